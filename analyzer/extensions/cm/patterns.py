@@ -26,6 +26,7 @@ __all__ = [
     "PTN_DS_CHAN_TABLE_END",
     "PTN_US_CHAN_TABLE_START",
     "PTN_US_CHAN_TABLE_END",
+    "PTN_DOMAIN_RULES",
     "PTN_SPLIT_LEFT",
     "PTN_SPLIT_RIGHT",
     "PTN_SPLIT_LEFT_TS",
@@ -235,6 +236,26 @@ PTN_DS_CHAN_TABLE_END = re.compile(r'\* indicates currently configured')
 PTN_US_CHAN_TABLE_START = re.compile(r'Active Upstream Channels:')
 # PTN_US_CHAN_TABLE_END = re.compile(r'Dynamic range window ')
 PTN_US_CHAN_TABLE_END = re.compile(r'\S')
+# ----------------------------------------------------------------------
+# Dispatch pattern of the rules in Preprocess.process_for_domain. It is
+# the alternation of the patterns that start a rule, in the order they
+# are tried. Each one is a named group, so the lastgroup of the match is
+# the rule. A line out of any block or table goes through the rules only
+# if it matches.
+# ----------------------------------------------------------------------
+PTN_DOMAIN_RULES = re.compile('|'.join(f'(?P<{name}>{ptnobj.pattern})' for name, ptnobj in [
+    ('BLOCK_RM_START', PTN_BLOCK_RM_START),
+    ('BLOCK_RM_PRI', PTN_BLOCK_RM_PRI),
+    ('LINE_RM', PTN_LINE_RM),
+    ('BLOCK_INDENT', PTN_BLOCK_INDENT),
+    ('BLOCK_INDENT2', PTN_BLOCK_INDENT2),
+    ('PRI_TO_NESTED', PTN_PRI_TO_NESTED),
+    ('DS_CHAN_TABLE_START', PTN_DS_CHAN_TABLE_START),
+    ('US_CHAN_TABLE_START', PTN_US_CHAN_TABLE_START),
+    ('TABLE_TITLE_COMMON', PTN_TABLE_TITLE_COMMON),
+    ('TABLE_TITLE', PTN_TABLE_TITLE),
+    ('NESTED_TO_PRI', PTN_NESTED_TO_PRI),
+]))
 
 # ----------------------------------------------------------------------
 # Patterns for spliting tokens. They cannot be built as a big one.
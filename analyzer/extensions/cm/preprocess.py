@@ -2,6 +2,7 @@
 """ Derived class of preprocess. LOG_TYPE specific.
 """
 import logging
+from collections import Counter
 from typing import Any, List, Dict
 from analyzer.preprocess import PreprocessBase
 from . import patterns as ptn
@@ -18,6 +19,9 @@ class Preprocess(PreprocessBase):
     def __init__(self):
         PreprocessBase.__init__(self)
         self.ptn_main_ts = ptn.PTN_STD_TS
+        # Hit counters of the rules in process_for_domain for profiling.
+        # See dump_rule_hits().
+        self.rule_hits: Counter = Counter()
 
     # pylint: disable=too-many-statements, disable=too-many-branches
     def process_for_domain(self, line: str, state: Dict[str, Any]):
@@ -29,19 +33,35 @@ class Preprocess(PreprocessBase):
         # position 0 if exists as we will remove it later. Also exclude
         # the case that tables are involved.
         #
-        if ptn.PTN_BFC_TS.search(line, 2) \
+        # The BFC timestamp always has the date like 01/01/1970.
+        #
+        if '/' in line and ptn.PTN_BFC_TS.search(line, 2) \
             and not ptn.PTN_NESTED_LINE.match(line) \
             and not ptn.PTN_TABLE_TITLE_COMMON.match(line):
             #
             match_g = ptn.PTN_BFC_TS.finditer(line, 2)
             *_, last_match = match_g
             line = line[last_match.start() :]
+            self.rule_hits['BFC_TS'] += 1
 
         #
         # Remove other timestamps, console prompt and unwanted chars
         #
         line = ptn.PTN_CLEAN_CHAR.sub('', line)
 
+        #
+        # Route the line straight through if it is out of any block or
+        # table and none of the rules below can match. Most lines are.
+        #
+        if state['in_log_blk'] or state['in_stat_tbl']:
+            self.rule_hits['IN_BLOCK_TABLE'] += 1
+        else:
+            match_rule = ptn.PTN_DOMAIN_RULES.match(line)
+            if not match_rule:
+                self.rule_hits['PASS'] += 1
+                return self.nested_to_primary(line, state)
+            self.rule_hits[match_rule.lastgroup] += 1
+
         #
         # Remove unwanted log blocks. Specific lines end the block
         #
@@ -180,14 +200,33 @@ class Preprocess(PreprocessBase):
         #
         # Convert nested as primary if two more empty lines procede
         #
-        elif ptn.PTN_NESTED_LINE.match(line) and state['last_ln_empty'] \
+        else:
+            line = self.nested_to_primary(line, state)
+
+        return line
+
+    @staticmethod
+    def nested_to_primary(line: str, state: Dict[str, Any]):
+        """ Convert nested as primary if two more empty lines procede """
+        if ptn.PTN_NESTED_LINE.match(line) and state['last_ln_empty'] \
             and (state['con_empty_ln_cnt']>=2):
             # Try to see if there are any exceptions
             if not ptn.PTN_NESTED_LINE_EXCEPTION.match(line):
                 line = line.lstrip()
-
         return line
 
+    def dump_rule_hits(self):
+        """
+        Print the hit counters of the rules in process_for_domain. The
+        PASS is the num of lines that go straight through, and the
+        IN_BLOCK_TABLE is the num of lines in a log block or table.
+        Note: the counters of workers in parallel preprocess are lost.
+        """
+        total = sum(self.rule_hits.values()) - self.rule_hits['BFC_TS']
+        print("Hits of the rules in process_for_domain:")
+        for rule, hits in self.rule_hits.most_common():
+            print(f"{rule:<24}{hits:>12}{hits/max(total, 1):>10.2%}")
+
     # pylint: disable=too-many-arguments
     def format_chan_stat_table(self, line: str, in_ch_stat_tbl: bool, tbl_hdr_done: bool,
                                remove_line: bool, is_table_end: bool, chan: str):
@@ -2,9 +2,9 @@
 """ DeepLog module
 """
 import os
+import sys
 import logging
-import pickle
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Any
 from importlib import import_module
 import numpy as np
 import pandas as pd
@@ -14,7 +14,8 @@ from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 from analyzer.config import GlobalConfig as GC
 import analyzer.utils.data_helper as dh
-from analyzer.modern import ModernBase
+import analyzer.utils.array_helper as ah
+from analyzer.modern import ModernBase, Vocab
 from .models import DeepLogExec
 
 # Import the knowledge base for the corresponding log type
@@ -29,29 +30,41 @@ log = logging.getLogger(__name__)
 class DeepLogExecDataset(Dataset):
     """ A map-style dataset and embed DataLoader by the way
     https://pytorch.org/docs/stable/data.html#dataset-types
+
+    The windows are not materialized. Each sample is sliced on the fly
+    from the single event index vector by its start offset, so memory
+    does not grow with the window size.
     """
     # pylint: disable=super-init-not-called
-    def __init__(self, data_dict, batch_size=32, shuffle=False, num_workers=1):
+    # pylint: disable=too-many-arguments
+    def __init__(self, data_dict, win_size, batch_size=32, shuffle=False, num_workers=1):
         """ Embed the pytorch DataLoader
         """
         self.data_dict = data_dict
-        self.keys = list(data_dict.keys())
+        self.win_size = win_size
         self.loader = DataLoader(dataset=self, batch_size=batch_size,
                                  shuffle=shuffle, num_workers=num_workers)
 
     def __getitem__(self, index):
         """ Return a complete data sample at index
         Here it returns a dict that represents a complete sample at the
-        index. The parameter is sample index. After DataLoader running,
-        the value parts of the dict will be tensors.
+        index. The parameter is sample index, aka. the sequence index.
+        After DataLoader running, the value parts of the dict will be
+        tensors.
         """
-        return {k: self.data_dict[k][index] for k in self.keys}
+        start = self.data_dict["SeqStart"][index]
+        return {
+            "SeqIdx": index,
+            "EventSeq": self.data_dict["EventIdx"][start: start + self.win_size],
+            "Target": self.data_dict["Target"][index],
+            "Label": self.data_dict["Label"][index]
+        }
 
     def __len__(self):
         """ Return the size of the dataset
         Here it represents the total num of sequences
         """
-        return self.data_dict["SeqIdx"].shape[0]
+        return self.data_dict["SeqStart"].shape[0]
 
 
 # pylint: disable=too-many-instance-attributes
@@ -63,9 +76,9 @@ class DeepLog(ModernBase):
         self._labels: List[int] = []
         self.exec_model: str = ''
         # Store the accumulated gap sizes for each session
-        self.acc_gaps: List[int] = []
-        # Store the map between session index and sequence range
-        self.map_session_seq: Dict[int, Tuple[int, int]] = {}
+        self.acc_gaps: np.ndarray = np.zeros(0, dtype='int64')
+        # Store the first sequence index of each session
+        self.session_seq_start: np.ndarray = np.zeros(0, dtype='int64')
 
         self.load_para()
         self.kbase = kb.Kb()
@@ -104,6 +117,8 @@ class DeepLog(ModernBase):
         self.model_para['num_workers'] = GC.conf['deeplog']['num_workers']
         self.model_para['device'] = GC.conf['deeplog']['device']
         self.model_para['one_hot'] = GC.conf['deeplog']['one_hot']
+        self.model_para['embedding'] = GC.conf['deeplog']['embedding']
+        self.model_para['embed_dim'] = GC.conf['deeplog']['embed_dim']
         self.exec_model = os.path.join(
             dh.PERSIST_DATA, 'deeplog_exec_model_'+str(self.model_para['group'])+'.pt'
         )
@@ -122,8 +137,8 @@ class DeepLog(ModernBase):
         Returns
         -------
         data_dict:
-        <SeqIdx> the sequence / sample idx
-        <EventSeq> array of index, [seq_num x window_size]
+        <EventIdx> the event index vector of all logs
+        <SeqStart> the first log offset of each sequence / sample
         <Target> the target event index for each event sequence
         <Label> the label of target event
         voc_size: the number of non zero event id in the vocabulary
@@ -139,15 +154,14 @@ class DeepLog(ModernBase):
         # read label vector. For other dataset, labels are always ZEROs.
         if not self.training and self.metrics:
             if not GC.conf['general']['aim']:
-                with open(self.fzip['labels'], 'rb') as fin:
-                    self._labels = pickle.load(fin)
+                self._labels = ah.load_vec(self.fzip['labels'], ah.DTYPE_LABEL).tolist()
         else:
             self._labels = [0] * len(event_id_logs)
 
         # --------------------------------------------------------------
         # Load vocab, aka STIDLE: Shuffled Template Id List Expanded
         # --------------------------------------------------------------
-        event_id_voc: List[str] = self.load_vocab(dh.VOCAB_DEEPLOG, event_id_lib)
+        event_id_voc: Vocab = self.load_vocab(dh.VOCAB_DEEPLOG, event_id_lib)
         # event_id_voc = event_id_lib
 
         # Count the non-zero event id number in the vocabulary. Suppose
@@ -160,14 +174,8 @@ class DeepLog(ModernBase):
         # vocabulary normally contain all the possible event ids. For
         # validation/test data, they probably miss some unknown ones.
         # Map the unknown events to the last index in the vocabulary.
-        event_idx_logs = []
-        new_eids = set()
-        for tid in event_id_logs:
-            try:
-                event_idx_logs.append(event_id_voc.index(tid))
-            except ValueError:
-                new_eids.add(tid)
-                event_idx_logs.append(self.libsize-1)
+        event_idx_logs = event_id_voc.lookup(event_id_logs, unknown=self.libsize-1)
+        new_eids = event_id_voc.missing(event_id_logs)
 
         if len(new_eids) != 0:
             for ele in new_eids:
@@ -179,8 +187,7 @@ class DeepLog(ModernBase):
 
         # Load the session vector we get from preprocess module
         if not GC.conf['general']['aim']:
-            with open(self.fzip['segdl'], 'rb') as fin:
-                self._segdl = pickle.load(fin)
+            self._segdl = ah.load_vec(self.fzip['segdl'], ah.DTYPE_SEGDL).tolist()
 
         # Accumulate and store gaps for each session. See the notes in
         # the member target_norm_idx(). Prediction only.
@@ -191,8 +198,8 @@ class DeepLog(ModernBase):
         data_dict = self.slice_logs_multi(event_idx_logs)
 
         # data_dict:
-        # <SeqIdx> the sequence index
-        # <EventSeq> array of index, [seq_num x window_size]
+        # <EventIdx> the event index vector of all logs
+        # <SeqStart> the first log offset of each sequence
         # <Target> the target event index for each window sequence
         # <Label> the label of target event
         return data_dict, voc_size
@@ -213,92 +220,83 @@ class DeepLog(ModernBase):
         Returns
         -------
         data_dict:
-        <SeqIdx> the sequence / sample idx across all sessions
-        <EventSeq> array of index, [seq_num x window_size]
+        <EventIdx> the event index vector of all logs, int32
+        <SeqStart> the first log offset of each sequence, and the \
+                   position in it is the sequence / sample idx across \
+                   all sessions
         <Target> the target event index for each event sequence
         <Label> the label of target event
         """
 
         win_size = self.model_para['win_size']
-        data_lst = []
         print(f"Slicing the multi-session logs with window {win_size} ...")
 
-        seq_idx = 0
-        session_offset = 0
-
-        for session_idx, session_size in enumerate(self._segdl):
-            # The window only applies in each session and doesn't cross
-            # session boundary.
-            i = 0
-            while (i + win_size) < session_size:
-                sequence = eidx_logs[i + session_offset: i + session_offset + win_size]
-                # The target word label. It is always 0 for training
-                # and prediction.
-                seq_label = self._labels[i + session_offset + win_size]
-
-                # For validation, aka training==false && metric==true
-                if not self.training and self.metrics:
-                    # Check each word in the seq as well as target label
-                    seq_labels = \
-                        self._labels[i + session_offset: i + session_offset + win_size + 1]
-                    if seq_labels.count(1) > 0:
-                        seq_label = 1
-
-                data_lst.append(
-                    [seq_idx, sequence, eidx_logs[i + session_offset + win_size], seq_label]
-                )
-
-                # Store the start and end sequence indexes of session
-                if not self.training and not self.metrics:
-                    if i == 0:
-                        start = seq_idx
-                    if i == session_size - win_size - 1:
-                        self.map_session_seq[session_idx] = (start, seq_idx)
-
-                i += 1
-                seq_idx += 1
-            # The session first log offset in the concatenated monolith
-            session_offset += session_size
-
-        # The last window has no target in a session. Simply disregard
-        # it. so, the total number of sequences in each session equals
-        # session_size - window_size. The number of all sequences in the
-        # the dataset equals dataset_size - n * window_size. The n means
-        # the number of sessions.
-
-        data_df = pd.DataFrame(data_lst, columns=["SeqIdx", "EventSeq", "Target", "Label"])
+        eidx_logs = np.asarray(eidx_logs, dtype='int32')
+        labels = np.asarray(self._labels, dtype='int32')
+        segdl = np.asarray(self._segdl, dtype='int64')
+
+        # The window only applies in each session and doesn't cross
+        # session boundary. The last window has no target in a session.
+        # Simply disregard it. So, the total number of sequences in each
+        # session equals session_size - window_size. The number of all
+        # sequences in the dataset equals dataset_size - n * window_size.
+        # The n means the number of sessions.
+        seq_cnts = np.maximum(segdl - win_size, 0)
+        # The session first log offset in the concatenated monolith, and
+        # the first sequence index of each session
+        session_offset = np.cumsum(segdl) - segdl
+        seq_first = np.cumsum(seq_cnts) - seq_cnts
+
+        # The first log offset of each sequence across all sessions
+        seq_start = np.repeat(session_offset - seq_first, seq_cnts) \
+            + np.arange(seq_cnts.sum())
+
+        # The target word label. It is always 0 for training and
+        # prediction. For validation, aka training==false && metric==
+        # true, check each word in the seq as well as target label.
+        if not self.training and self.metrics:
+            acc_labels = np.concatenate(([0], np.cumsum(labels)))
+            seq_label = acc_labels[seq_start + win_size + 1] - acc_labels[seq_start] > 0
+        else:
+            seq_label = labels[seq_start + win_size]
+
+        # Store the start sequence index of session
+        if not self.training and not self.metrics:
+            self.session_seq_start = seq_first
+
         data_dict = {
-            "SeqIdx": data_df["SeqIdx"].to_numpy(dtype='int32'),
-            "EventSeq": np.array(data_df["EventSeq"].tolist(), dtype='int32'),
-            "Target": data_df["Target"].to_numpy(dtype='int32'),
-            "Label": data_df["Label"].to_numpy(dtype='int32')
+            "EventIdx": eidx_logs,
+            "SeqStart": seq_start,
+            "Target": eidx_logs[seq_start + win_size],
+            "Label": seq_label.astype('int32')
         }
 
         return data_dict
 
-    def get_session_idx(self, seq_idx: int):
+    def get_session_idx(self, seq_idx):
         """
         Get the index (zero based) of session that current sequence
         resides in.
 
+        Note
+        ----
+        The session without sequence has the same start sequence index
+        as the next session. The binary search on the right side skips
+        it as the sequence resides in the last session that starts at
+        or before the sequence.
+
         Arguments
         ---------
-        seq_idx: Sequence index (zero based) across multi-session
+        seq_idx: Sequence index (zero based) across multi-session, int \
+                 or array of int
 
         Returns
         -------
-        session_idx: The session index
+        session_idx: The session index, int or array of int
         """
-        session_idx: int = 0
+        session_idx = np.searchsorted(self.session_seq_start, seq_idx, side='right') - 1
 
-        # The attribute self.map_session_seq has following format
-        # {session_index, (seq_idx_start, seq_idx_end)}
-        for i, seq_idx_pair in self.map_session_seq.items():
-            if seq_idx_pair[0] <= seq_idx <= seq_idx_pair[1]:
-                session_idx = i
-                break
-
-        return session_idx
+        return np.maximum(session_idx, 0)
 
     def set_acc_gap_size(self):
         """
@@ -316,13 +314,10 @@ class DeepLog(ModernBase):
         None: The attribute self.acc_gaps will be updated
         """
         win_size: int = self.model_para['win_size']
-        self.acc_gaps = [0] * len(self._segdl)
+        segdl = np.asarray(self._segdl, dtype='int64')
 
-        for i, _ in enumerate(self._segdl[1:], 1):
-            if self._segdl[i-1] > win_size:
-                self.acc_gaps[i] = self.acc_gaps[i-1] + win_size
-            else:
-                self.acc_gaps[i] = self.acc_gaps[i-1] + self._segdl[i-1]
+        self.acc_gaps = np.zeros(len(segdl), dtype='int64')
+        np.cumsum(np.minimum(segdl[:-1], win_size), out=self.acc_gaps[1:])
 
     def target_norm_idx(self, seq_idx: int):
         """
@@ -374,18 +369,19 @@ class DeepLog(ModernBase):
 
         Arguments
         ---------
-        seq_idx: Sequence index (zero based) across multi-session
+        seq_idx: Sequence index (zero based) across multi-session, int \
+                 or array of int, e.g. a batch of sequences
 
         Returns
         -------
-        norm_idx: The norm index (zero based) of target in a sequence
+        norm_idx: The norm index (zero based) of target in a sequence, \
+                  int or array of int
         """
 
         # Get the session index (zero based) that sequence resides in
-        session_idx: int = self.get_session_idx(seq_idx)
+        session_idx = self.get_session_idx(seq_idx)
 
-        norm_idx: int = seq_idx + self.model_para['win_size'] + \
-                        self.acc_gaps[session_idx]
+        norm_idx = seq_idx + self.model_para['win_size'] + self.acc_gaps[session_idx]
 
         return norm_idx
 
@@ -464,7 +460,7 @@ class DeepLog(ModernBase):
         # Feed pytorch Dataset/DataLoader to get the iterator/tensors
         #
         data_loader = DeepLogExecDataset(
-            data_dict, batch_size=self.model_para['batch_size'],
+            data_dict, self.model_para['win_size'], batch_size=self.model_para['batch_size'],
             shuffle=is_shuffle, num_workers=self.model_para['num_workers']
         ).loader
 
@@ -475,7 +471,9 @@ class DeepLog(ModernBase):
             'cuda' if self.model_para['device'] != 'cpu' and torch.cuda.is_available() else 'cpu'
         )
 
-        if self.model_para['one_hot']:
+        if self.model_para['embedding']:
+            input_dim = self.model_para['embed_dim']
+        elif self.model_para['one_hot']:
             input_dim = self.libsize
         else:
             input_dim = 1
@@ -483,74 +481,69 @@ class DeepLog(ModernBase):
         model = DeepLogExec(
             device, num_classes=voc_size, input_size=input_dim,
             hidden_size=self.model_para['hidden_size'],
-            num_layers=2, num_dir=self.model_para['num_dir']
+            num_layers=2, num_dir=self.model_para['num_dir'],
+            embed_dim=input_dim if self.model_para['embedding'] else 0
         )
 
         return model, data_loader, device
 
-    # pylint: disable=too-many-locals
+    def topk_anomaly(self, output, target):
+        """ Decide the anomalies of a batch by the top k predictions
+
+        The rank of the target is the num of classes that have larger
+        output than the target. The target is normal if it is in the
+        top k predictions, aka. the rank is less than k.
+
+        Arguments
+        ---------
+        output: the model output, [batch_size x num_classes]
+        target: the target event index, [batch_size]
+
+        Returns
+        -------
+        anomaly: the boolean anomaly mask, [batch_size]
+        """
+        target_output = output.gather(1, target.long().view(-1, 1))
+        rank = (output > target_output).sum(dim=1)
+        return rank >= self.model_para['topk']
+
     def predict_core(self, model, data_loader, device, mnp_vec):
         """ The predict core
         """
         # Data for parameter value anomaly detection
         content_lst, eid_lst, template_lst = self.load_oss_data()
 
-        j = 0
-        anomaly_pred = []
         anomaly_line = []
         model.eval()
         with torch.no_grad():
             for batch_in in data_loader:
-                # print(batch_in['EventSeq'])
                 seq = self.d2_d3(batch_in['EventSeq'], device)
                 output = model(seq)
-                # pred_prob = output.softmax(dim=-1)
-                # pred_sort = torch.argsort(pred_prob, 1, True)
-                pred_sort = torch.argsort(output, 1, True)
-                bt_size = pred_sort.size(0)
-                # topk_val = torch.narrow(pred_sort, 1, 0, 10)
-                # print('debug topk1:', topk_val)
-                seq_pred_sort = pred_sort.tolist()
-                seq_target = batch_in['Target'].tolist()
-                seq_idx_batch = batch_in['SeqIdx'].tolist()
-                # topk_lst = []
-                for i in range(bt_size):
-                    # topk_lst.append(seq_pred_sort[i].index(seq_target[i]))
-                    # The log (line, 0-based) index of anomaly in norm.
-                    # Notice that we select the target log as anomaly
-                    # for simplicity. It is more meaningful to consider
-                    # the logs as well in the window of this target in
-                    # the final report.
-                    norm_idx = self.target_norm_idx(seq_idx_batch[i])
-                    top_idx = seq_pred_sort[i].index(seq_target[i])
-
-                    if top_idx >= self.model_para['topk']:
-                        # Save each log state from line (WIN_SIZE+1)
-                        anomaly_pred.append(1)
+                anomaly = self.topk_anomaly(output, batch_in['Target'].to(device))
+
+                # The log (line, 0-based) index of anomaly in norm.
+                # Notice that we select the target log as anomaly for
+                # simplicity. It is more meaningful to consider the logs
+                # as well in the window of this target in the report.
+                norm_idx_batch = self.target_norm_idx(batch_in['SeqIdx'].numpy())
+
+                for norm_idx, is_anomaly in zip(norm_idx_batch.tolist(), anomaly.tolist()):
+                    # Integrate OSS as para value anomaly detection if
+                    # the target is in the top k predictions
+                    if is_anomaly or self.para_anomaly_det(content_lst[mnp_vec[norm_idx]],
+                                                           eid_lst[norm_idx],
+                                                           template_lst[norm_idx]):
                         # Save anomaly log index of norm data
                         anomaly_line.append(norm_idx)
-                    else:
-                        # Integrate OSS as para value anomaly detection
-                        if self.para_anomaly_det(content_lst[mnp_vec[norm_idx]],
-                                                 eid_lst[norm_idx], template_lst[norm_idx]):
-                            anomaly_pred.append(1)
-                            anomaly_line.append(norm_idx)
-                        else:
-                            anomaly_pred.append(0)
-                # print('debug topk2:', topk_lst)
-                j += 1
-
-        # print(anomaly_pred)
-        # print(anomaly_line)
-        # print(len(anomaly_line))
+
         return anomaly_line
 
     def evaluate_core(self, model, data_loader, device):
         """ The evaluate core
         """
         _anomaly_pred = []
-        # _anomaly_debug = []
-        _t_p = _t_n = _f_p = _f_n = 0
+        # The confusion matrix counts, tp, fp, tn, fn
+        confusion = torch.zeros(4, dtype=torch.long, device=device)
         model.eval()
         batch_cnt = len(data_loader)
 
@@ -560,40 +553,19 @@ class DeepLog(ModernBase):
             for batch_in in data_loader:
                 seq = self.d2_d3(batch_in['EventSeq'], device)
                 output = model(seq)
-                # pred_prob = output.softmax(dim=-1)
-                # pred_sort = torch.argsort(pred_prob, 1, True)
-                pred_sort = torch.argsort(output, 1, True)
-                bt_size = pred_sort.size(0)
-                # topk_val = torch.narrow(pred_sort, 1, 0, 10)
-                # print('debug topk1:', topk_val)
-                seq_pred_sort = pred_sort.tolist()
-                seq_target = batch_in['Target'].tolist()
-                seq_label = batch_in['Label'].tolist()
-                # topk_lst = []
-                for i in range(bt_size):
-                    # topk_lst.append(seq_pred_sort[i].index(seq_target[i]))
-                    top_idx = seq_pred_sort[i].index(seq_target[i])
-                    if seq_label[i] == 1:
-                        if top_idx >= self.model_para['topk']:
-                            _t_p += 1
-                            _anomaly_pred.append(1)
-                        else:
-                            _f_n += 1
-                            _anomaly_pred.append(0)
-                    else:
-                        if top_idx >= self.model_para['topk']:
-                            _anomaly_pred.append(1)
-                            # _anomaly_debug.append(top_idx)
-                            _f_p += 1
-                        else:
-                            _anomaly_pred.append(0)
-                            _t_n += 1
+                anomaly = self.topk_anomaly(output, batch_in['Target'].to(device))
+                label = batch_in['Label'].to(device) == 1
+
+                confusion += torch.stack([(anomaly & label).sum(), (anomaly & ~label).sum(),
+                                          (~anomaly & ~label).sum(), (~anomaly & label).sum()])
+                _anomaly_pred.append(anomaly)
 
                 pbar.update(1)
-                # print('debug topk2:', topk_lst)
-            # print(_anomaly_debug)
             pbar.close()
 
+        _t_p, _f_p, _t_n, _f_n = confusion.tolist()
+        _anomaly_pred = torch.cat(_anomaly_pred).int().tolist() if _anomaly_pred else []
+
         return _t_p, _f_p, _t_n, _f_n, _anomaly_pred
 
     def train_core(self, model, data_loader, device):
@@ -645,12 +617,14 @@ class DeepLog(ModernBase):
 
         For scalar, the input_size is 1. For one-hot, the input_size is
         the size of template/vocabulary. Also the element type is float
-        in the returned 3-D tensor.
+        in the returned 3-D tensor. For embedding, the 2-D tensor of the
+        event index is returned as int64 and the model embeds it.
 
         Note:
         Do the 2-D to 3-D conversion and one-hot vectoring in the batch
         instead of in the whole data set in one shot. The latter will
-        consume considerable memory and time.
+        consume considerable memory and time. The input does not require
+        grad, only the model parameters do.
 
         Arguments
         ---------
@@ -659,18 +633,54 @@ class DeepLog(ModernBase):
 
         Returns
         -------
-        tensor_3d: the 3-D tensor, [seq_num x win_size x input_size]
+        tensor_3d: the 3-D tensor, [seq_num x win_size x input_size], \
+                   or the 2-D int64 tensor for embedding
         """
 
-        if self.model_para['one_hot']:
+        if self.model_para['embedding']:
+            tensor_3d = tensor_2d.long().to(device)
+        elif self.model_para['one_hot']:
             tensor_3d = nn.functional.one_hot(tensor_2d.long(), num_classes=self.libsize)\
-                        .float().clone().detach().requires_grad_(True).to(device)
+                        .float().to(device)
         else:
-            tensor_3d = tensor_2d.float().clone().detach().requires_grad_(True)\
-                        .view(-1, self.model_para['win_size'], 1).to(device)
+            tensor_3d = tensor_2d.float().view(-1, self.model_para['win_size'], 1).to(device)
 
         return tensor_3d
 
+    def input_type(self):
+        """ The input type of the model per config, embedding, one_hot or
+            scalar. It is saved along with the model state.
+        """
+        if self.model_para['embedding']:
+            return 'embedding'
+        return 'one_hot' if self.model_para['one_hot'] else 'scalar'
+
+    def save_model(self, model):
+        """ Save the model state along with the input type """
+        torch.save({'input_type': self.input_type(), 'state_dict': model.state_dict()},
+                   self.exec_model)
+
+    def load_model(self, model, device):
+        """
+        Load the model state saved by save_model(). The old model file
+        is the bare state dict of the scalar or one-hot input model, and
+        it is still loadable with embedding disabled in config.
+        """
+        checkpoint = torch.load(self.exec_model, map_location=device)
+
+        if 'state_dict' in checkpoint:
+            if checkpoint['input_type'] != self.input_type():
+                print(f"The model {self.exec_model} has {checkpoint['input_type']} "
+                      f"input, but {self.input_type()} in config. Abort!!!")
+                sys.exit(1)
+            checkpoint = checkpoint['state_dict']
+        elif self.model_para['embedding']:
+            print(f"The model {self.exec_model} has no embedding. Disable "
+                  f"embedding in config or train it again. Abort!!!")
+            sys.exit(1)
+
+        model.load_state_dict(checkpoint)
+
     def train(self):
         """ Train model.
         """
@@ -690,7 +700,7 @@ class DeepLog(ModernBase):
         print(f"Train Dataset Validation ==> TP: {t_p}, FP: {f_p}, TN: {t_n}, FN: {f_n}")
 
         # Serialize the model
-        torch.save(model.state_dict(), self.exec_model)
+        self.save_model(model)
 
     def evaluate(self):
         """ Validate model.
@@ -702,7 +712,7 @@ class DeepLog(ModernBase):
             self.get_ready(is_shuffle=False)
 
         # Load the model from file
-        model.load_state_dict(torch.load(self.exec_model))
+        self.load_model(model, device)
 
         # Validate the test data
         print("Validating...")
@@ -730,15 +740,14 @@ class DeepLog(ModernBase):
             self.get_ready(is_shuffle=False)
 
         # Load the model from file
-        model.load_state_dict(torch.load(self.exec_model))
+        self.load_model(model, device)
 
         # The line mapping between norm and norm pred
         if self.rcv:
             if GC.conf['general']['aim']:
                 mnp_vec = self._map_norm_rcv
             else:
-                with open(self.fzip['map_norm_rcv'], 'rb') as fin:
-                    mnp_vec = pickle.load(fin)
+                mnp_vec = ah.load_vec(self.fzip['map_norm_rcv'], ah.DTYPE_LINE)
         else:
             mnp_vec = list(range(self._df_raws.shape[0]))
 
@@ -748,8 +757,7 @@ class DeepLog(ModernBase):
 
         # Load the line mapping list between raw and norm test file
         if not GC.conf['general']['aim']:
-            with open(self.fzip['map_norm_raw'], 'rb') as fin:
-                self._map_norm_raw = pickle.load(fin)
+            self._map_norm_raw = ah.load_vec(self.fzip['map_norm_raw'], ah.DTYPE_LINE)
 
         # Write to file. It is 1-based line num in raw file. Map the
         # anomaly_line in norm file to the raw test data file.
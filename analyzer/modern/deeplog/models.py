@@ -19,7 +19,7 @@ class DeepLogExec(nn.Module):
     """
     # pylint: disable=too-many-arguments
     def __init__(self, device, num_classes, input_size=1, hidden_size=100,
-                 num_layers=2, num_dir=1):
+                 num_layers=2, num_dir=1, embed_dim=0):
         """ Initialization
         """
         super().__init__()
@@ -27,8 +27,16 @@ class DeepLogExec(nn.Module):
         self.hidden_size = hidden_size
         self.num_layers = num_layers
         self.num_directions = num_dir
+        # The input element is the event index (int) in vocabulary, and
+        # it is looked up in the embedding layer if embed_dim is not 0.
+        # The embedding layer is not created otherwise, so the models
+        # with scalar or one-hot input keep the same state dict.
+        self.embedding = nn.Embedding(num_classes, embed_dim) if embed_dim else None
+        if self.embedding is not None:
+            input_size = embed_dim
         # The cell input dimension is 1 if input element is scalar, aka.
-        # event index in vocabulary, otherwise the element is one-hot.
+        # event index in vocabulary, embed_dim if it is embedding, else
+        # the element is one-hot.
         # The batch_first is True, then the LSTM input & output first
         # Dimension is batch. The input & output part of (h_n, c_n) are
         # not affected by batch_first.
@@ -41,7 +49,9 @@ class DeepLogExec(nn.Module):
         """ Override the forward function
 
         The input_[0] is a 3-D tensor
-        (batch_size x seq_len x input_size): EventSeq.
+        (batch_size x seq_len x input_size): EventSeq. With embedding,
+        it is a 2-D tensor of event index (batch_size x seq_len), and
+        the embedding layer turns it into the 3-D tensor.
 
         The output of LSTM is a 3-D tensor
         (batch_size x seq_len x hidden_size).
@@ -58,6 +68,10 @@ class DeepLogExec(nn.Module):
         """
         h_0 = torch.zeros(self.num_layers, input_[0].size(0), self.hidden_size).to(self.device)
         c_0 = torch.zeros(self.num_layers, input_[0].size(0), self.hidden_size).to(self.device)
-        output_, _ = self.rnn(input_[0].float(), (h_0, c_0))
+        if self.embedding is not None:
+            input_0 = self.embedding(input_[0].long())
+        else:
+            input_0 = input_[0].float()
+        output_, _ = self.rnn(input_0, (h_0, c_0))
         output_ = self.predict_layer(output_[:, -1, :])
         return output_
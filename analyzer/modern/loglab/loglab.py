@@ -7,13 +7,13 @@ import csv
 import logging
 from typing import List, Dict, Tuple
 from importlib import import_module
-import pickle
 import numpy as np
 from tqdm import tqdm
 from analyzer.config import GlobalConfig as GC
 import analyzer.utils.data_helper as dh
+import analyzer.utils.array_helper as ah
 import analyzer.utils.yaml_helper as yh
-from analyzer.modern import ModernBase
+from analyzer.modern import ModernBase, Vocab
 
 # Import the knowledge base for the corresponding log type
 kb = import_module("analyzer.extensions." + dh.LOG_TYPE + ".knowledgebase")
@@ -98,18 +98,13 @@ class Loglab(ModernBase):
         # --------------------------------------------------------------
         # Load vocab, aka STIDLE: Shuffled Template Id List Expanded
         # --------------------------------------------------------------
-        event_id_voc: List[str] = self.load_vocab(dh.VOCAB_LOGLAB, event_id_lib)
+        event_id_voc: Vocab = self.load_vocab(dh.VOCAB_LOGLAB, event_id_lib)
         # event_id_voc = event_id_lib
 
         # Check if event ids are all in vocab. For training data, the
         # template library/vocabulary normally contain all the possible
         # event ids. For validation/test data, they may not contain all.
-        new_eids = set()
-        for tid in event_id_logs:
-            try:
-                event_id_voc.index(tid)
-            except ValueError:
-                new_eids.add(tid)
+        new_eids = event_id_voc.missing(event_id_logs)
 
         if len(new_eids) != 0:
             for ele in new_eids:
@@ -183,6 +178,8 @@ class Loglab(ModernBase):
         eid_logs = data_df['EventId'].tolist()
         tmplt_logs = data_df['EventTemplate'].tolist()
         cont_logs = data_df['Content'].tolist()
+        # The index in vocabulary of each log, -1 for the unknown
+        eidx_logs = eid_voc.lookup(eid_logs)
 
         # Do not iterate dataframe using iterrows(). It's very slow.
         for axis, (eid, tmplt, content) in enumerate(zip(eid_logs, tmplt_logs, cont_logs)):
@@ -219,7 +216,7 @@ class Loglab(ModernBase):
                 event_count_vec[0, eid_voc.index(eid)] = self.weight[severity]
 
                 if has_contxt:
-                    self.window_binary(axis, eid_voc, eid_logs, event_count_vec)
+                    self.window_binary(axis, eidx_logs, event_count_vec)
 
         return event_count_vec
 
@@ -252,6 +249,8 @@ class Loglab(ModernBase):
         eid_logs = data_df['EventId'].tolist()
         tmplt_logs = data_df['EventTemplate'].tolist()
         cont_logs = data_df['Content'].tolist()
+        # The index in vocabulary of each log, -1 for the unknown
+        eidx_logs = eid_voc.lookup(eid_logs)
 
         # Do not iterate dataframe using iterrows(). It's very slow.
         for axis, (eid, tmplt, content) in enumerate(zip(eid_logs, tmplt_logs, cont_logs)):
@@ -296,7 +295,7 @@ class Loglab(ModernBase):
                     event_stat_logs[axis] = 1
 
                 if has_contxt:
-                    self.window_count(axis, eid_voc, eid_logs, event_count_vec,
+                    self.window_count(axis, eidx_logs, event_count_vec,
                                       event_char_voc, event_stat_logs)
 
         if self.feat['cover'] == 'FULL':
@@ -312,15 +311,14 @@ class Loglab(ModernBase):
 
         return event_count_vec
 
-    def window_binary(self, axis, eid_voc, eid_logs, event_count_vec):
+    def window_binary(self, axis, eidx_logs, event_count_vec):
         """
         Check event in binary manner within window, axis exclusive.
 
         Arguments
         ---------
         axis: the window axis
-        eid_voc: event id vocabulary
-        eid_logs: event id logs
+        eidx_logs: event index (in vocabulary) logs, -1 for the unknown
         event_count_vec: one line matrix, aka. event count in one sample
         """
 
@@ -328,17 +326,17 @@ class Loglab(ModernBase):
             # The upper part of the window
             if axis - (i+1) >= 0:
                 self.window_binary_core(
-                    axis-(i+1), eid_voc, eid_logs, event_count_vec
+                    axis-(i+1), eidx_logs, event_count_vec
                 )
 
             # The under part of the window
-            if axis + (i+1) < len(eid_logs):
+            if axis + (i+1) < len(eidx_logs):
                 self.window_binary_core(
-                    axis+(i+1), eid_voc, eid_logs, event_count_vec
+                    axis+(i+1), eidx_logs, event_count_vec
                 )
 
     # pylint: disable=too-many-arguments
-    def window_count(self, axis, eid_voc, eid_logs, event_count_vec,
+    def window_count(self, axis, eidx_logs, event_count_vec,
                      event_char_voc, event_stat_logs):
         """
         Count the event within window, axis exclusive.
@@ -346,8 +344,7 @@ class Loglab(ModernBase):
         Arguments
         ---------
         axis: the window axis
-        eid_voc: event id vocabulary
-        eid_logs: event id logs
+        eidx_logs: event index (in vocabulary) logs, -1 for the unknown
         event_count_vec: one line matrix, aka. event count in one sample
         event_char_voc: event charactor, 0: n/a, >0: severity weight
         event_stat_logs: log status in sample, 0: not counted 1: counted
@@ -357,39 +354,37 @@ class Loglab(ModernBase):
             # The upper part of the window
             if axis - (i+1) >= 0:
                 self.window_count_core(
-                    axis-(i+1), eid_voc, eid_logs, event_count_vec,
+                    axis-(i+1), eidx_logs, event_count_vec,
                     event_char_voc, event_stat_logs
                 )
 
             # The under part of the window
-            if axis + (i+1) < len(eid_logs):
+            if axis + (i+1) < len(eidx_logs):
                 self.window_count_core(
-                    axis+(i+1), eid_voc, eid_logs, event_count_vec,
+                    axis+(i+1), eidx_logs, event_count_vec,
                     event_char_voc, event_stat_logs
                 )
 
-    def window_binary_core(self, idx, eid_voc, eid_logs, event_count_vec):
+    def window_binary_core(self, idx, eidx_logs, event_count_vec):
         """
         The core of windowing to do binary event count.
 
         Arguments
         ---------
         idx: the index
-        eid_voc: event id vocabulary
-        eid_logs: event id logs
+        eidx_logs: event index (in vocabulary) logs, -1 for the unknown
         event_count_vec: one line matrix, aka. event count in one sample
         """
 
         # Skip the event id which is not in the tempalte lib or eid
         # vocabulary. This usually happens in the logs for prediction.
-        try:
-            feature_idx = eid_voc.index(eid_logs[idx])
-            if event_count_vec[0, feature_idx] == 0:
-                event_count_vec[0, feature_idx] = self.weight['info']
-        except ValueError:
-            pass
-
-    def window_count_core(self, idx, eid_voc, eid_logs, event_count_vec,
+        feature_idx = eidx_logs[idx]
+        if feature_idx < 0:
+            return
+        if event_count_vec[0, feature_idx] == 0:
+            event_count_vec[0, feature_idx] = self.weight['info']
+
+    def window_count_core(self, idx, eidx_logs, event_count_vec,
                           event_char_voc, event_stat_logs):
         """
         The core of windowing to do event count.
@@ -397,8 +392,7 @@ class Loglab(ModernBase):
         Arguments
         ---------
         idx: the index
-        eid_voc: event id vocabulary
-        eid_logs: event id logs
+        eidx_logs: event index (in vocabulary) logs, -1 for the unknown
         event_count_vec: one line matrix, aka. event count in one sample
         event_char_voc: event charactor, 0: n/a, >0: severity weight
         event_stat_logs: log status in sample, 0: not counted 1: counted
@@ -406,15 +400,14 @@ class Loglab(ModernBase):
 
         # Skip the event id which is not in the tempalte lib or eid
         # vocabulary. This usually happens in the logs for prediction.
-        try:
-            feature_idx = eid_voc.index(eid_logs[idx])
-            if event_char_voc[feature_idx] == 0:
-                event_char_voc[feature_idx] = self.weight['info']
-            if event_stat_logs[idx] == 0:
-                event_count_vec[0, feature_idx] += 1
-                event_stat_logs[idx] = 1
-        except ValueError:
-            pass
+        feature_idx = eidx_logs[idx]
+        if feature_idx < 0:
+            return
+        if event_char_voc[feature_idx] == 0:
+            event_char_voc[feature_idx] = self.weight['info']
+        if event_stat_logs[idx] == 0:
+            event_count_vec[0, feature_idx] += 1
+            event_stat_logs[idx] = 1
 
     def edges_update(self, axis: int, edges: dict, sample_len: int):
         """
@@ -497,8 +490,7 @@ class Loglab(ModernBase):
 
         # Load the sample info vector we generate in logparser module
         if not GC.conf['general']['aim']:
-            with open(self.fzip['segll'], 'rb') as fin:
-                self._segll = pickle.load(fin)
+            self._segll = ah.load_segll(self.fzip['segll'])
         # print(self._segll)
 
         # The sample info format: [(sample_size, sample_class), ...]
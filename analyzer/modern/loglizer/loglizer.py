@@ -4,9 +4,9 @@
 import os
 import sys
 import logging
-import pickle
 from typing import List
 from datetime import datetime
+from itertools import chain
 from importlib import import_module
 import joblib
 import numpy as np
@@ -14,7 +14,8 @@ import pandas as pd
 from scipy.special import expit
 from analyzer.config import GlobalConfig as GC
 import analyzer.utils.data_helper as dh
-from analyzer.modern import ModernBase
+import analyzer.utils.array_helper as ah
+from analyzer.modern import ModernBase, Vocab
 
 # Load LOG_TYPE dependent helpers
 msc = import_module("analyzer.extensions." + dh.LOG_TYPE + ".misc")
@@ -102,8 +103,7 @@ class Loglizer(ModernBase):
             self._df_raws['Label'] = [0] * self._df_raws.shape[0]
         else:
             if not GC.conf['general']['aim']:
-                with open(self.fzip['labels'], 'rb') as fin:
-                    self._labels = pickle.load(fin)
+                self._labels = ah.load_vec(self.fzip['labels'], ah.DTYPE_LABEL)
             self._df_raws['Label'] = self._labels
 
         raw_data = self._df_raws[['Label','Ms_Elapsed']].values
@@ -117,14 +117,14 @@ class Loglizer(ModernBase):
         # Load vocab, aka STIDLE: Shuffled Template Id List Expanded
         # --------------------------------------------------------------
         if self.inc_updt:
-            event_id_voc: List[str] = self.load_vocab(dh.VOCAB_LOGLIZER, event_id_lib)
+            event_id_voc: Vocab = self.load_vocab(dh.VOCAB_LOGLIZER, event_id_lib)
         else:
             if not os.path.exists(dh.VOCAB_LOGLIZER_STATIC):
-                event_id_voc = np.random.default_rng().permutation(event_id_lib).tolist()
-                np.save(dh.VOCAB_LOGLIZER_STATIC, event_id_voc)
+                event_id_voc = Vocab(np.random.default_rng().permutation(event_id_lib).tolist())
+                np.save(dh.VOCAB_LOGLIZER_STATIC, event_id_voc.event_ids)
             else:
                 print('Loading shuffled EventId list in templates: static version.')
-                event_id_voc = np.load(dh.VOCAB_LOGLIZER_STATIC).tolist()
+                event_id_voc = Vocab(np.load(dh.VOCAB_LOGLIZER_STATIC).tolist())
 
         # --------------------------------------------------------------
         # Slice data using sliding window
@@ -253,31 +253,29 @@ class Loglizer(ModernBase):
         event_num = len(list(set(event_id_logs)))
         print(f"There are {event_num} log events")
 
-        # Get labels and event count of each sliding window
-        labels = []
-        label_data = raw_data[:, 0]
+        # Convert EventId, aka. template id, to ZERO based index in vocab
+        for event_id in event_id_voc.missing(event_id_logs):
+            log.warning('EventId %s is not in the templates of train data', event_id)
+        event_idx_logs = event_id_voc.lookup(event_id_logs)
+
+        # The window index and log index of each log in all windows
+        win_lens = [len(indexes) for indexes in expanded_indexes_list]
+        win_idx = np.repeat(np.arange(inst_number), win_lens)
+        log_idx = np.fromiter(chain.from_iterable(expanded_indexes_list),
+                              dtype=np.int64, count=sum(win_lens))
+
+        # Get labels and event count of each sliding window. One label
+        # per instance. Labeling the instance if one log within is
+        # labeled at least, even if the log might not be in train
+        # template lib. 0 represents success, 1 represents failure.
+        label_data = raw_data[:, 0].astype(bool)
+        labels = (np.bincount(win_idx, weights=label_data[log_idx],
+                              minlength=inst_number) > 0).astype(int).tolist()
+
+        # Increase the feature/event/template count in event count matrix
         event_count_matrix = np.zeros((inst_number,len(event_id_voc)))
-        for j in range(inst_number):
-            label = 0   # 0 represents success, 1 represents failure
-            for k in expanded_indexes_list[j]:
-                # Label the instance even if current log might not be in
-                # train template lib.
-                if label_data[k]:
-                    label = 1
-                # Current log EventId, aka. template id
-                event_id = event_id_logs[k]
-                # Convert EventId to ZERO based index in vocab
-                try:
-                    event_index = event_id_voc.index(event_id)
-                except:  # pylint: disable=bare-except
-                    log.warning('EventId %s is not in the templates of train data', event_id)
-                    continue
-                # Increase the feature/event/template count in event
-                # count matrix.
-                event_count_matrix[j, event_index] += 1
-            # One label per instance. Labeling the instance if one log
-            # within is labeled at least.
-            labels.append(label)
+        known = event_idx_logs[log_idx] >= 0
+        np.add.at(event_count_matrix, (win_idx[known], event_idx_logs[log_idx][known]), 1)
         assert inst_number == len(labels)
         # Do not calc the num of instances that have anomalies on test
         # dataset w/o validating.
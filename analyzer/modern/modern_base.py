@@ -4,17 +4,93 @@
 import os
 import logging
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Dict, Set, Iterable, Iterator, Optional
 import numpy as np
 from analyzer.config import GlobalConfig as GC
 import analyzer.utils.data_helper as dh
 
 
-__all__ = ["ModernBase"]
+__all__ = ["ModernBase", "Vocab"]
 
 log = logging.getLogger(__name__)
 
 
+class Vocab():
+    """
+    The vocabulary of event ids, aka. STIDLE, with O(1) lookup of the
+    index of event id. The index of an event id is the one of its first
+    occurrence, same as list.index(). It behaves like the list of event
+    ids for len(), iteration and indexing.
+
+    Attributes
+    ----------
+    event_ids : the event id list
+    """
+    def __init__(self, event_ids: Iterable[str]):
+        self.event_ids: List[str] = list(event_ids)
+        self._index: Dict[str, int] = {}
+        for idx, tid in enumerate(self.event_ids):
+            self._index.setdefault(tid, idx)
+        # The sorted event ids and their index for the vectorized lookup
+        self._sorted: Optional[np.ndarray] = None
+        self._sorted_idx: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.event_ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.event_ids)
+
+    def __getitem__(self, idx: int) -> str:
+        return self.event_ids[idx]
+
+    def __contains__(self, tid: str):
+        return tid in self._index
+
+    def index(self, tid: str) -> int:
+        """ The index of event id. Raise ValueError if it is unknown. """
+        try:
+            return self._index[tid]
+        except KeyError:
+            raise ValueError(f"Event ID {tid} is not in vocabulary") from None
+
+    def update(self, idx: int, tid: str):
+        """ Replace the event id at idx with tid """
+        tid_old = self.event_ids[idx]
+        self.event_ids[idx] = tid
+        if self._index.get(tid_old) == idx:
+            try:
+                self._index[tid_old] = self.event_ids.index(tid_old, idx+1)
+            except ValueError:
+                del self._index[tid_old]
+        if self._index.get(tid, idx) >= idx:
+            self._index[tid] = idx
+        self._sorted = None
+
+    def lookup(self, tids: Iterable[str], unknown: int = -1) -> np.ndarray:
+        """
+        Convert the event ids, e.g. the EventId column, to the indexes at
+        once by the binary search over the sorted vocabulary. The unknown
+        event ids get the index of param unknown.
+        """
+        tids = np.asarray(list(tids), dtype=str)
+        if self._sorted is None:
+            self._sorted = np.array(list(self._index.keys()), dtype=str)
+            order = np.argsort(self._sorted)
+            self._sorted = self._sorted[order]
+            self._sorted_idx = np.fromiter(self._index.values(), dtype=np.int64,
+                                           count=len(self._index))[order]
+        if not tids.size or not self._sorted.size:
+            return np.full(tids.shape[0], unknown, dtype=np.int64)
+
+        pos = np.searchsorted(self._sorted, tids).clip(max=self._sorted.shape[0]-1)
+        return np.where(self._sorted[pos] == tids, self._sorted_idx[pos], unknown)
+
+    def missing(self, tids: Iterable[str]) -> Set[str]:
+        """ The event ids that are not in the vocabulary """
+        return {tid for tid in set(tids) if tid not in self._index}
+
+
 # pylint: disable=too-many-instance-attributes
 class ModernBase(ABC):
     """ The base class of modern analyzing techniques. """
@@ -58,7 +134,7 @@ class ModernBase(ABC):
             self._map_norm_raw: List[int] = []
             self._map_norm_rcv: List[int] = []
 
-    def load_vocab(self, vocab_file: str, event_id_lib: List[str]):
+    def load_vocab(self, vocab_file: str, event_id_lib: List[str]) -> Vocab:
         """ Generate/Load/Update vocabulary of eid (event id)
 
         Arguments
@@ -68,7 +144,7 @@ class ModernBase(ABC):
 
         Returns
         -------
-        event_id_shuffled: shuffled version of eid list with fixed size
+        event_id_shuffled: vocabulary of shuffled eid list with fixed size
         """
         if not os.path.exists(vocab_file):
             # Initialize shuffled EventId list of templates
@@ -94,11 +170,11 @@ class ModernBase(ABC):
             if self.dbg:
                 np.savetxt(vocab_file+'.txt', event_id_shuffled, fmt="%s")
 
-            return event_id_shuffled
+            return Vocab(event_id_shuffled)
 
         # Load the existing STIDLE and update it
         print('Loading shuffled EventId list of templates.')
-        event_id_shuffled = np.load(vocab_file).tolist()
+        event_id_shuffled = Vocab(np.load(vocab_file).tolist())
 
         # We only update STIDLE for train dataset currently
         if self.training:
@@ -126,10 +202,8 @@ class ModernBase(ABC):
                 updt_cnt = 0
                 for idx, tid in enumerate(event_id_old_zero):
                     # Make sure no duplicates in the STIDLE
-                    try:
-                        event_id_shuffled.index(tid)
-                    except ValueError:
-                        event_id_shuffled[idx_zero_shuffled[idx]] = tid
+                    if tid not in event_id_shuffled:
+                        event_id_shuffled.update(idx_zero_shuffled[idx], tid)
                         updt_cnt += 1
                 # Set the update flag
                 update_flag = True
@@ -142,7 +216,7 @@ class ModernBase(ABC):
             for tid_old, tid in zip(event_id_lib_old, event_id_lib):
                 if tid_old not in('0', tid):
                     idx_old = event_id_shuffled.index(tid_old)
-                    event_id_shuffled[idx_old] = tid
+                    event_id_shuffled.update(idx_old, tid)
                     updt_cnt += 1
 
             if updt_cnt > 0:
@@ -158,9 +232,9 @@ class ModernBase(ABC):
 
             # Update the STIDLE file
             if update_flag:
-                np.save(vocab_file, event_id_shuffled)
+                np.save(vocab_file, event_id_shuffled.event_ids)
                 if self.dbg:
-                    np.savetxt(vocab_file+'.txt', event_id_shuffled, fmt="%s")
+                    np.savetxt(vocab_file+'.txt', event_id_shuffled.event_ids, fmt="%s")
 
         return event_id_shuffled
 
@@ -3,12 +3,12 @@
 """
 import sys
 import logging
-import pickle
 from typing import List
 from importlib import import_module
 import pandas as pd
 from tqdm import tqdm
 import analyzer.utils.data_helper as dh
+import analyzer.utils.array_helper as ah
 from analyzer.config import GlobalConfig as GC
 
 # Load knowledge-base of LOG_TYPE
@@ -73,8 +73,7 @@ class OSS():
         # Use in-memory data by default unless config tells us to do so.
         if not GC.conf['general']['aim']:
             self._df_raws = pd.read_csv(self.fzip['struct'])
-            with open(self.fzip['map_norm_raw'], 'rb') as fin:
-                self._map_norm_raw = pickle.load(fin)
+            self._map_norm_raw = ah.load_vec(self.fzip['map_norm_raw'], ah.DTYPE_LINE)
 
         # A lower overhead progress bar
         pbar = tqdm(total=self._df_raws.shape[0], unit='Logs', disable=False,
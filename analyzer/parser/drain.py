@@ -5,15 +5,22 @@
 """
 import re
 import os
+import io
 import math
+import struct
+import time
 import shutil
 import hashlib
+import multiprocessing as mp
+from collections import OrderedDict
 from datetime import datetime
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from analyzer.utils.misc_regex import Rexengine
 
 
-__all__ = ["Para", "Drain"]
+__all__ = ["Para", "Drain", "Drainsession", "Tmpltregistry"]
 
 
 # pylint: disable=too-many-instance-attributes,too-few-public-methods
@@ -31,6 +38,9 @@ class Logcluster:
         is_tmplt_new   : New template that does not exist in library
         tmplt_updt_cnt : the tmplate update count
         tmplt_id_old   : load id from template lib or '0' for a new leaf
+        tmplt_ids      : compiled token ids of the template, see Matchengine
+        tmplt_masks    : compiled special token masks of the template
+        leaf           : the token layer node that holds this cluster
         """
         self.log_tmplt = log_tmplt
         self.updt_cnt = 0
@@ -41,6 +51,9 @@ class Logcluster:
         self.is_tmplt_new = is_tmplt_new
         self.tmplt_updt_cnt = 0
         self.tmplt_id_old = tmplt_id_old
+        self.tmplt_ids = None
+        self.tmplt_masks = None
+        self.leaf = None
 
 
 class Node:
@@ -54,32 +67,304 @@ class Node:
                        : token_first_key - The first token split
                        : token_last_key - The last token split
                        : <*> - others-node within each length layer node
+        compiled       : stacked token ids/masks of the clusters in a token
+                         layer node, None if not compiled yet or stale
         """
         if child_node is None:
             child_node = {}
         self.child_node = child_node
         self.digit_or_token = digit_or_token
+        self.compiled = None
 
 
 class Ouputcell:
     """ Output layer """
-    def __init__(self, log_id_lst=None, parent_lst=None):
+    def __init__(self, log_id_lst=None, parent_lst=None, keep_ids=True):
+        """
+        Attributes
+        ----------
+        log_id_lst : the log line ids of the cell, 1 based
+        log_cnt    : the occurrence counter of the cell
+        keep_ids   : keep the log line ids or only count them
+        """
         if log_id_lst is None:
             log_id_lst = []
-        self.log_id_lst = log_id_lst
+        self.log_cnt = len(log_id_lst)
+        self.keep_ids = keep_ids
+        self.log_id_lst = log_id_lst if keep_ids else []
         self.out_tmplts = ''
         self.active = True
         if parent_lst is None:
             parent_lst = []
         self.parent_lst = parent_lst
 
+    def add_log(self, log_id):
+        """ Add a log to the cell """
+        self.log_cnt += 1
+        if self.keep_ids:
+            self.log_id_lst.append(log_id)
+
+
+class Matchcache:
+    """ Exact-match cache in front of the tree search. It maps the token
+        tuple of a preprocessed log to the matched cluster directly.
+    """
+    def __init__(self, max_size=100000):
+        """
+        Attributes
+        ----------
+        max_size  : the max num of entries, LRU evicted. 0 disables it
+        hits      : the num of lookups that hit the cache
+        misses    : the num of lookups that miss the cache
+        _entries  : ordered dict of token tuple -> Logcluster
+        _len_keys : dict of seq_len -> set of token tuples
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._len_keys = {}
+
+    def get(self, key):
+        """ Get the cached cluster of the token tuple or None """
+        if self.max_size <= 0:
+            return None
+        log_clust = self._entries.get(key)
+        if log_clust is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return log_clust
+
+    def put(self, key, log_clust):
+        """ Cache the matched cluster of the token tuple """
+        if self.max_size <= 0:
+            return
+        self._entries[key] = log_clust
+        self._len_keys.setdefault(len(key), set()).add(key)
+        if len(self._entries) > self.max_size:
+            old_key, _ = self._entries.popitem(last=False)
+            self._len_keys[len(old_key)].discard(old_key)
+
+    def invalidate(self, seq_len):
+        """ Drop all entries under the length layer node of seq_len """
+        for key in self._len_keys.pop(seq_len, ()):
+            del self._entries[key]
+
+    @property
+    def hit_rate(self):
+        """ Get the hit rate of the lookups """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class Matchengine:
+    """ Precompiled matching engine of the similarity layer. Each token is
+        tagged once as an integer id, '<*>' is always id 0, along with a
+        bit mask of the special token patterns it fully matches. Then the
+        similarity of a log against all the clusters in a leaf is done in
+        one batched pass over the stacked id matrix of the leaf.
+    """
+    PARA_ID = 0
+
+    def __init__(self, rex_s_token):
+        """
+        Attributes
+        ----------
+        rex_s_token : pattern list of special tokens, see Para
+        token_ids   : dict of template token -> token id
+        token_masks : dict of template token -> special token mask
+        """
+        self.rex_s_token = rex_s_token
+        self.token_ids = {'<*>': self.PARA_ID}
+        self.token_masks = {'<*>': self.spec_mask('<*>')}
+
+    def spec_mask(self, token):
+        """ Bit mask of the special token patterns the token matches """
+        mask = 0
+        for bit, ptn in enumerate(self.rex_s_token):
+            if ptn.fullmatch(token):
+                mask |= 1 << bit
+        return mask
+
+    def compile_tmplt(self, log_clust):
+        """ Tag the template tokens of a created or updated cluster """
+        ids = []
+        masks = []
+        for token in log_clust.log_tmplt:
+            tid = self.token_ids.get(token)
+            if tid is None:
+                tid = self.token_ids[token] = len(self.token_ids)
+                self.token_masks[token] = self.spec_mask(token)
+            ids.append(tid)
+            masks.append(self.token_masks[token])
+        log_clust.tmplt_ids = ids
+        log_clust.tmplt_masks = masks
+
+        # The stacked matrix of the leaf is stale now
+        if log_clust.leaf is not None:
+            log_clust.leaf.compiled = None
+
+    def compile_seq(self, seq):
+        """ Tag the tokens of a log. Unknown tokens get id -1 that never
+            equals any template token.
+        """
+        ids = np.fromiter((self.token_ids.get(token, -1) for token in seq),
+                          dtype=np.int32, count=len(seq))
+        masks = np.fromiter((self.token_masks[token] if token in self.token_masks
+                             else self.spec_mask(token) for token in seq),
+                            dtype=np.int64, count=len(seq))
+        return ids, masks
+
+    @staticmethod
+    def compile_leaf(leaf):
+        """ Stack the compiled templates of the clusters in a leaf """
+        if leaf.compiled is None:
+            leaf.compiled = (
+                np.array([clust.tmplt_ids for clust in leaf.child_node], dtype=np.int32),
+                np.array([clust.tmplt_masks for clust in leaf.child_node], dtype=np.int64)
+            )
+        return leaf.compiled
+
+    def seq_dist_batch(self, leaf, seq, seq_ids, seq_masks):
+        """
+        Batched version of Drain.seq_dist between a log and all the
+        templates in a leaf. The checks in seq_dist only depend on the
+        current and the last token, so they are done position-wise.
+
+        Returns
+        -------
+        1) sim array, the similarity of each template
+        2) para_num array, the num of parameters of each template
+        """
+        tmplt_ids, tmplt_masks = self.compile_leaf(leaf)
+        seq_len = len(seq)
+
+        # Position-wise status. Differ means const token in template is
+        # not same as the one in log. Same is the last_token_same status
+        # in seq_dist after current position.
+        para = tmplt_ids == self.PARA_ID
+        equal = tmplt_ids == seq_ids
+        differ = ~(para | equal)
+        same = equal | (para & (seq_ids == self.PARA_ID))
+
+        # 1). The first tokens are different
+        stop = tmplt_ids[:, 0] != seq_ids[0]
+        if seq_len > 1:
+            # 2). Successive different tokens, or a parameter follows a
+            # different token
+            stop |= (differ[:, 1:] & ~same[:, :-1]).any(axis=1)
+            stop |= (para[:, 1:] & differ[:, :-1]).any(axis=1)
+        # 3). Special tokens are different
+        stop |= (differ & ((tmplt_masks | seq_masks) != 0)).any(axis=1)
+
+        para_num = para.sum(axis=1)
+        sim_tokens = (equal & ~para).sum(axis=1)
+        const_num = seq_len - para_num
+
+        if seq_len == 1 and Drain.has_numbers(seq[0]):
+            sim = np.ones(len(const_num))
+        else:
+            sim = np.zeros(len(const_num))
+        np.divide(sim_tokens, const_num, out=sim, where=const_num != 0)
+
+        sim[stop] = 0.0
+        para_num[stop] = 0
+        return sim, para_num
+
+    def fast_match(self, leaf, seq):
+        """
+        Batched version of Drain.fast_match. Find the most suitable log
+        cluster in the leaf node.
+
+        Parameters
+        ----------
+        leaf : the token layer node
+        seq  : the raw log
+
+        Returns
+        -------
+        the matched log cluster
+        """
+        seq_ids, seq_masks = self.compile_seq(seq)
+        sim, para_num = self.seq_dist_batch(leaf, seq, seq_ids, seq_masks)
+
+        # When similarity is same, pick the one with more parameters. It
+        # is the first one if still same.
+        max_sim = sim.max()
+        max_idx = int(np.argmax(np.where(sim == max_sim, para_num, -1)))
+        max_clust = leaf.child_node[max_idx]
+
+        if max_sim >= max_clust.sim_t:
+            return max_clust
+        return None
+
+
+class Tmpltregistry:
+    """ Interned template registry. It maps each template id, aka. the
+        first 8 hex chars of md5 of the template, to a dense int32 index
+        and back, so the structured logs can keep the index only.
+    """
+    def __init__(self):
+        """
+        Attributes
+        ----------
+        eids      : template id of each index
+        tmplts    : template string of each index
+        eid_idx   : dict of template id to index
+        tmplt_idx : dict of template string to index, saves the hashing
+        """
+        self.eids = []
+        self.tmplts = []
+        self.eid_idx = {}
+        self.tmplt_idx = {}
+
+    def __len__(self):
+        return len(self.eids)
+
+    @staticmethod
+    def hash_tmplt(tmplt_str):
+        """ Return the template id of the template string """
+        return hashlib.md5(tmplt_str.encode('utf-8')).hexdigest()[0:8]
+
+    def intern(self, tmplt_str):
+        """ Return the index of the template, register it if not yet """
+        idx = self.tmplt_idx.get(tmplt_str)
+        if idx is None:
+            eid = self.hash_tmplt(tmplt_str)
+            idx = self.eid_idx.get(eid)
+            if idx is None:
+                idx = len(self.eids)
+                self.eids.append(eid)
+                self.tmplts.append(tmplt_str)
+                self.eid_idx[eid] = idx
+            self.tmplt_idx[tmplt_str] = idx
+        return idx
+
+    def eid(self, idx):
+        """ Return the template id of the index """
+        return self.eids[idx]
+
+    def index(self, eid):
+        """ Return the index of the template id, -1 if not registered """
+        return self.eid_idx.get(eid, -1)
+
+    def to_columns(self, codes):
+        """ Convert the int32 indices to EventId and EventTemplate columns
+            in categorical, which share the indices as codes.
+        """
+        return pd.Categorical.from_codes(codes, categories=self.eids), \
+               pd.Categorical.from_codes(codes, categories=self.tmplts)
+
 
 class Para:
     """ Class of parameters """
     def __init__(self, log_format, rex, rex_s_token, raw_file, tmplt_lib,
                  outdir='./', max_child=120, sim_t_m=1, over_wr_lib=False,
                  intmdt=True, aim=True, inc_updt=True, prt_tree=False,
-                 nopgbar=False):
+                 nopgbar=False, cache_size=100000, num_workers=1,
+                 tree_snapshot=None, chunk_size=10000, rex_prefilter=True):
         """
         Attributes
         ----------
@@ -100,6 +385,13 @@ class Para:
         nopgbar     : disable the progress bar
         intmdt      : save intermediate results to files
         aim         : alway using in-memory data
+        cache_size  : max entries of the exact-match cache, 0 disables
+        num_workers : num of worker processes, 1 for serial parsing
+        tree_snapshot : binary snapshot of the tree built from tmplt_lib, \
+                        None disables it
+        chunk_size  : num of structured logs in each chunk of streaming
+        rex_prefilter : skip a pattern of rex when its trigger chars are \
+                        absent in the log, see Rexengine
         """
         self.log_format = log_format
         self.raw_file = raw_file
@@ -115,10 +407,27 @@ class Para:
         self.nopgbar = nopgbar
         self.intmdt = intmdt
         self.aim = aim
+        self.cache_size = cache_size
+        self.num_workers = num_workers
+        self.tree_snapshot = tree_snapshot
+        self.chunk_size = chunk_size
+        self.rex_prefilter = rex_prefilter
 
 
 class Drain:
     """ The Drain core """
+    # Do the parallel parsing only for big data
+    PARALLEL_MIN_LOGS = 10000
+
+    # Layout of the tree snapshot: header, then string table (NUL
+    # separated, padded to 8 bytes), cluster [sim_t, initst] float64,
+    # template token offsets int32, template token string ids int32,
+    # cluster [base, updt_cnt, leaf index] int32, and token layer nodes
+    # [seq_len, key string id] int32. All little endian.
+    TREE_SNAPSHOT_MAGIC = b'DRTS'
+    TREE_SNAPSHOT_VERSION = 1
+    TREE_SNAPSHOT_HEADER = '<4sHH16s4I'
+
     def __init__(self, para, raws):
         """
         Attributes
@@ -126,20 +435,32 @@ class Drain:
         para         : the parameter object from class Para
         raws         : the raw log data, aka. norm of preprocess
         pointer      : dict of pointers for cache mechanism
+        cache        : exact-match cache in front of the tree search
+        engine       : precompiled matching engine of similarity layer
+        rexengine    : precompiled engine of preprocess in Drain domain
         _df_raws     : data frame of raw logs, aka. norm of preprocess
         _df_tmplts   : updated data frame of templates
         _df_tmplts_o : original data frame of templates
         log_id       : log line number in the raw file, debug only
         tree         : the tree, debug only
+        tmplt_lib_digest : md5 digest of the template library file
+        keep_ids     : keep the log ids in output cells, False for stream
+        registry     : interned registry of the output templates
         """
         self.para = para
         self.raws = raws
         self.pointer = {}
+        self.cache = Matchcache(para.cache_size)
+        self.engine = Matchengine(para.rex_s_token)
+        self.rexengine = Rexengine(para.rex, prefilter=para.rex_prefilter)
         self._df_raws = None
         self._df_tmplts = None
         self._df_tmplts_o = None
         self.log_id = 0
         self.tree = ''
+        self.tmplt_lib_digest = None
+        self.keep_ids = True
+        self.registry = Tmpltregistry()
 
     @staticmethod
     def has_numbers(string):
@@ -208,12 +529,10 @@ class Drain:
             if ret_log_cluster is None:
                 token_layer_node = self.token_tree_search(rtn, seq)
 
-                if token_layer_node is not None:
-                    # Token layer child node is list, not dict anymore
-                    log_cluster_lst = token_layer_node.child_node
-
-                    # Do the fast match under the token layer node
-                    ret_log_cluster = self.fast_match(log_cluster_lst, seq)
+                if token_layer_node is not None and token_layer_node.child_node:
+                    # Do the fast match under the token layer node. It is
+                    # the batched version of self.fast_match().
+                    ret_log_cluster = self.engine.fast_match(token_layer_node, seq)
 
                     # Update the pointer
                     if ret_log_cluster is not None:
@@ -363,6 +682,8 @@ class Drain:
             token_layer_node.child_node = [log_clust]
         else:
             token_layer_node.child_node.append(log_clust)
+        log_clust.leaf = token_layer_node
+        token_layer_node.compiled = None
 
     def seq_dist(self, seq1, seq2):
         """
@@ -558,7 +879,7 @@ class Drain:
         is_new_tmplt : The template is new or not.
         old_tid      : The old EventId in template lib
         """
-        new_out_cell = Ouputcell(log_id_lst=id_lst)
+        new_out_cell = Ouputcell(log_id_lst=id_lst, keep_ids=self.keep_ids)
 
         new_clust = Logcluster(log_tmplt=message_lst, outcell=new_out_cell,
                                is_tmplt_new=is_new_tmplt, tmplt_id_old=old_tid)
@@ -594,11 +915,16 @@ class Drain:
         clust_lst.append(new_clust)
         out_cell_lst.append(new_out_cell)
 
+        self.engine.compile_tmplt(new_clust)
         self.add_seq_to_tree(rtn, new_clust)
 
         # Update the cache
         self.pointer[len(message_lst)] = new_clust
 
+        # The new cluster may win the match of the logs with same length
+        # that have been cached, so drop them.
+        self.cache.invalidate(len(message_lst))
+
     def update_cluster(self, message_lst, log_idx, clust_lst, match_clust):
         """
         Update the cluster in the tree
@@ -611,12 +937,13 @@ class Drain:
         match_clust : the matched cluster after search the tree
         """
         new_tmplt, updt_token_num = self.get_template(message_lst, match_clust.log_tmplt)
-        match_clust.outcell.log_id_lst.append(log_idx)
+        match_clust.outcell.add_log(log_idx)
 
         # Update the cluster
         if ' '.join(new_tmplt) != ' '.join(match_clust.log_tmplt):
             match_clust.log_tmplt = new_tmplt
             match_clust.tmplt_updt_cnt += 1
+            self.engine.compile_tmplt(match_clust)
 
             # Update the sim threshold of current existing cluster. The
             # sim_t increases with updates, see paper Formula (4) & (5)
@@ -624,6 +951,10 @@ class Drain:
             match_clust.sim_t = min(1, match_clust.initst + \
                                     0.5*math.log(match_clust.updt_cnt+1, match_clust.base))
 
+            # The template and sim threshold changes may lead to other
+            # matching results of the cached logs with same length.
+            self.cache.invalidate(len(new_tmplt))
+
             # _Note_
             # For the online update of template, we should save the
             # threshold along with each template in the output_result()
@@ -709,6 +1040,7 @@ class Drain:
         if similar_clust is not None and sim>self.para.sim_t_m:
             similar_clust.outcell.log_id_lst = similar_clust.outcell.log_id_lst + \
                                                log_clust.outcell.log_id_lst
+            similar_clust.outcell.log_cnt += log_clust.outcell.log_cnt
             remove_out_cell = log_clust.outcell
 
             for parent in remove_out_cell.parent_lst:
@@ -716,32 +1048,52 @@ class Drain:
                 parent.outcell = similar_clust.outcell
 
             remove_out_cell.log_id_lst = None
+            remove_out_cell.log_cnt = 0
             remove_out_cell.active = False
 
     def output_result(self, log_clust_lst):
         """ Output the template library and structured logs """
         # No need feature of merging outputcell in Fig. 2 in paper. Just
         # suppose 1-to-1 mapping between template and output always.
-        log_templates = [0] * self._df_raws.shape[0]
-        log_templateids = [0] * self._df_raws.shape[0]
-        log_templateids_old = [0] * self._df_raws.shape[0]
+        log_codes = np.full(self._df_raws.shape[0], -1, dtype=np.int32)
+        log_codes_old = np.full(self._df_raws.shape[0], -1, dtype=np.int32)
+        eid_old_idx = {}
+        for log_clust in log_clust_lst:
+            tmplt_idx = self.registry.intern(' '.join(log_clust.log_tmplt))
+            tmplt_idx_old = eid_old_idx.setdefault(log_clust.tmplt_id_old, len(eid_old_idx))
+
+            # Assign template index to each log. The log id is 1 based.
+            log_ids = np.array(log_clust.outcell.log_id_lst, dtype=np.int64) - 1
+            log_codes[log_ids] = tmplt_idx
+            log_codes_old[log_ids] = tmplt_idx_old
+
+        self.output_tmplts(log_clust_lst)
+
+        # Save the structured file to data/train or data/test directory
+        self._df_raws['EventIdOld'] = pd.Categorical.from_codes(
+            log_codes_old, categories=list(eid_old_idx))
+        self._df_raws['EventId'], self._df_raws['EventTemplate'] = \
+            self.registry.to_columns(log_codes)
+        # self._df_raws.drop(['Content'], inplace=True, axis=1)
+        if self.para.intmdt or not self.para.aim:
+            self._df_raws.to_csv(
+                os.path.join(self.para.save_path,
+                os.path.basename(self.para.raw_file) + '_structured.csv'), index=False
+            )
+
+    def output_tmplts(self, log_clust_lst):
+        """ Output the template library """
         tmplt_event_lst = []
         for log_clust in log_clust_lst:
             tmplt_str = ' '.join(log_clust.log_tmplt)
-            occurrence = len(log_clust.outcell.log_id_lst)
-            tmplt_id = hashlib.md5(tmplt_str.encode('utf-8')).hexdigest()[0:8]
+            tmplt_idx = self.registry.intern(tmplt_str)
+            occurrence = log_clust.outcell.log_cnt
+            tmplt_id = self.registry.eid(tmplt_idx)
             tmplt_id_old = log_clust.tmplt_id_old
             # _ToDo_
             # Should save the sim threshold of tempalte too. It is used
             # to be as the init sim threshold of online template update.
 
-            # Assign template and its id (1 based) to each log.
-            for log_id in log_clust.outcell.log_id_lst:
-                log_id -= 1
-                log_templates[log_id] = tmplt_str
-                log_templateids[log_id] = tmplt_id
-                log_templateids_old[log_id] = tmplt_id_old
-
             # Merge duplicate templates. row[0/1/2/3] has mapping below:
             # [tmplt_id_old, tmplt_id, tmplt_str, occurrence]
             tmplt_unique = True
@@ -780,21 +1132,15 @@ class Drain:
         if self.para.over_wr_lib and self.para.inc_updt:
             if os.path.exists(self.para.tmplt_lib):
                 shutil.copy(self.para.tmplt_lib, self.para.tmplt_lib+'.old')
-            self._df_tmplts.to_csv(
-                self.para.tmplt_lib,
+            data = self._df_tmplts.to_csv(
                 columns=['EventIdOld', 'EventId', 'EventTemplate'], index=False
-            )
-
-        # Save the structured file to data/train or data/test directory
-        self._df_raws['EventIdOld'] = log_templateids_old
-        self._df_raws['EventId'] = log_templateids
-        self._df_raws['EventTemplate'] = log_templates
-        # self._df_raws.drop(['Content'], inplace=True, axis=1)
-        if self.para.intmdt or not self.para.aim:
-            self._df_raws.to_csv(
-                os.path.join(self.para.save_path,
-                os.path.basename(self.para.raw_file) + '_structured.csv'), index=False
-            )
+            ).encode('utf-8')
+            # Write to a temp file and then rename it, so the readers of
+            # the library never get a partial one.
+            with open(self.para.tmplt_lib+'.tmp', 'wb') as fout:
+                fout.write(data)
+            os.replace(self.para.tmplt_lib+'.tmp', self.para.tmplt_lib)
+            self.tmplt_lib_digest = hashlib.md5(data).digest()
 
     @property
     def df_raws(self):
@@ -879,18 +1225,21 @@ class Drain:
 
     def preprocess(self, line):
         """ Pre-process the log in Drain domain """
-        for cur_rex in self.para.rex.keys():
-            # We put a space before <*>. It does not affect a separate
-            # token number. It only affects something like offset:123
-            # and the result will be offset: <*>
-            line = cur_rex.sub(self.para.rex[cur_rex], line)
-        return line
+        # Apply each pattern in para.rex in order. We put a space before
+        # <*>. It does not affect a separate token number. It only affects
+        # something like offset:123 and the result will be offset: <*>
+        return self.rexengine.sub(line)
 
     def load_template_lib(self):
         """ Read the templates from the library to dataframe """
+        self.tmplt_lib_digest = None
         if self.para.inc_updt and os.path.exists(self.para.tmplt_lib):
+            # Read the file once for both the content hash and dataframe
+            with open(self.para.tmplt_lib, 'rb') as fin:
+                data = fin.read()
+            self.tmplt_lib_digest = hashlib.md5(data).digest()
             self._df_tmplts = \
-            self._df_tmplts_o = pd.read_csv(self.para.tmplt_lib)
+            self._df_tmplts_o = pd.read_csv(io.BytesIO(data))
         else:
             # Only initialize an empty dataframe
             self._df_tmplts = \
@@ -898,11 +1247,220 @@ class Drain:
                 columns=['EventIdOld', 'EventId', 'EventTemplate']
             )
 
-    def main_process(self):
-        """ The main entry """
-        print('Parsing file: ' + self.para.raw_file)
-        start_time = datetime.now()
+    @staticmethod
+    def split_log(log_t):
+        """ Split the log or template into token list. Note, reserve the
+            trailing spaces of each log if it has.
+        """
+        token_count = len(log_t.split())
+        return log_t.split(None, token_count-1)
 
+    def build_tree(self, eids, tmplts, log_clust_lst, out_cell_lst, rtn):
+        """ Build the tree by using templates from library """
+        for eid, line in zip(eids, tmplts):
+            # Split the template into token list
+            message_lst = self.split_log(line.strip('\r\n'))
+
+            # Read the old template id for current template
+            eid_old = eid
+
+            # Add new cluster to the tree, and no log id for template
+            # The template in each cluster is NOT new
+            self.add_cluster(message_lst, [], log_clust_lst, out_cell_lst,
+                             rtn, False, eid_old)
+
+    def save_tree(self, log_clust_lst, rtn):
+        """
+        Save the tree built from the template library to a versioned
+        binary snapshot. See TREE_SNAPSHOT_* for the layout. It is tied
+        to the content hash of the library file and max_child.
+        """
+        if self.para.tree_snapshot is None or self.tmplt_lib_digest is None:
+            return
+
+        # String table of template tokens and token layer keys
+        sids = {}
+        leaves = []
+        leaf_idx = {}
+        for seq_len, len_layer_nd in rtn.child_node.items():
+            for key, leaf in len_layer_nd.child_node.items():
+                leaf_idx[id(leaf)] = len(leaves)
+                leaves.append((seq_len, sids.setdefault(key, len(sids))))
+
+        tok_off = [0]
+        tok_ids = []
+        clust_f = []
+        clust_i = []
+        for log_clust in log_clust_lst:
+            tok_ids.extend(sids.setdefault(token, len(sids)) for token in log_clust.log_tmplt)
+            tok_off.append(len(tok_ids))
+            clust_f.append((log_clust.sim_t, log_clust.initst))
+            clust_i.append((log_clust.base, log_clust.updt_cnt, leaf_idx[id(log_clust.leaf)]))
+
+        str_blob = '\0'.join(sids).encode('utf-8')
+        sections = [
+            str_blob + b'\0' * (-len(str_blob) % 8),
+            np.array(clust_f, dtype='<f8').tobytes(),
+            np.array(tok_off, dtype='<i4').tobytes(),
+            np.array(tok_ids, dtype='<i4').tobytes(),
+            np.array(clust_i, dtype='<i4').tobytes(),
+            np.array(leaves, dtype='<i4').tobytes(),
+        ]
+        header = struct.pack(self.TREE_SNAPSHOT_HEADER, self.TREE_SNAPSHOT_MAGIC,
+                             self.TREE_SNAPSHOT_VERSION, self.para.max_child,
+                             self.tmplt_lib_digest, len(str_blob), len(log_clust_lst),
+                             len(tok_ids), len(leaves))
+
+        # Write to a temp file and then rename it, so a reader never gets
+        # a partial snapshot. Skip it quietly on a read-only persist dir.
+        tmp_file = self.para.tree_snapshot + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as fout:
+                fout.write(header)
+                fout.writelines(sections)
+            os.replace(tmp_file, self.para.tree_snapshot)
+        except OSError:
+            pass
+
+    def load_tree(self, eids, log_clust_lst, out_cell_lst, rtn):
+        """
+        Restore the tree from the binary snapshot with a single read of
+        the file. Return False if the snapshot does not exist or is stale
+        and then the tree should be built from the library.
+        """
+        snapshot = self.para.tree_snapshot
+        if snapshot is None or self.tmplt_lib_digest is None \
+            or not os.path.exists(snapshot):
+            return False
+
+        with open(snapshot, 'rb') as fin:
+            data = fin.read()
+        try:
+            magic, version, max_child, digest, str_len, clust_num, tok_num, leaf_num \
+                = struct.unpack_from(self.TREE_SNAPSHOT_HEADER, data)
+        except struct.error:
+            return False
+        if magic != self.TREE_SNAPSHOT_MAGIC or version != self.TREE_SNAPSHOT_VERSION \
+            or max_child != self.para.max_child or digest != self.tmplt_lib_digest \
+            or clust_num != len(eids):
+            return False
+
+        offset = struct.calcsize(self.TREE_SNAPSHOT_HEADER)
+        strs = data[offset:offset+str_len].decode('utf-8').split('\0')
+        offset += str_len + (-str_len % 8)
+        sections = []
+        for dtype, count, width in [('<f8', clust_num, 2), ('<i4', clust_num+1, 1),
+                                    ('<i4', tok_num, 1), ('<i4', clust_num, 3),
+                                    ('<i4', leaf_num, 2)]:
+            arr = np.frombuffer(data, dtype=dtype, count=count*width, offset=offset)
+            sections.append(arr.reshape(count, width).tolist() if width > 1 else arr.tolist())
+            offset += arr.nbytes
+        clust_f, tok_off, tok_ids, clust_i, leaves = sections
+
+        # Length layer and token layer nodes in the original order
+        leaf_nodes = []
+        for seq_len, key_sid in leaves:
+            len_layer_nd = rtn.child_node.get(seq_len)
+            if len_layer_nd is None:
+                len_layer_nd = rtn.child_node[seq_len] = Node(digit_or_token=seq_len)
+            leaf = len_layer_nd.child_node[strs[key_sid]] = Node(digit_or_token=strs[key_sid])
+            leaf_nodes.append(leaf)
+
+        # Similarity layer and output layer. Same as add_cluster().
+        for idx, eid in enumerate(eids):
+            message_lst = [strs[sid] for sid in tok_ids[tok_off[idx]:tok_off[idx+1]]]
+            new_out_cell = Ouputcell(log_id_lst=[], keep_ids=self.keep_ids)
+            new_clust = Logcluster(log_tmplt=message_lst, outcell=new_out_cell,
+                                   is_tmplt_new=False, tmplt_id_old=eid)
+            new_out_cell.parent_lst.append(new_clust)
+            new_clust.sim_t, new_clust.initst = clust_f[idx]
+            new_clust.base, new_clust.updt_cnt, leaf_idx = clust_i[idx]
+
+            leaf = leaf_nodes[leaf_idx]
+            if len(leaf.child_node) == 0:
+                leaf.child_node = [new_clust]
+            else:
+                leaf.child_node.append(new_clust)
+            new_clust.leaf = leaf
+            self.engine.compile_tmplt(new_clust)
+
+            log_clust_lst.append(new_clust)
+            out_cell_lst.append(new_out_cell)
+            self.pointer[len(message_lst)] = new_clust
+
+        return True
+
+    def parse_log(self, log_id, message_lst, log_clust_lst, out_cell_lst, rtn):
+        """
+        Parse one log, aka. search the tree and add a new cluster or
+        update the matched one.
+
+        Parameters
+        ----------
+        log_id        : the log line id, 1 based
+        message_lst   : the log token list
+        log_clust_lst : the cluster list
+        out_cell_lst  : the output cell list
+        rtn           : the root node
+
+        Returns
+        -------
+        match_clust : the cluster the log goes to
+        changed     : True if the tree is changed, aka. a cluster is added
+                      or the template of the matched cluster is updated
+        """
+        # Look up the exact-match cache first. A cached cluster has the
+        # template covering current log already, so the update of the
+        # cluster is reduced to appending the log id.
+        seq_key = tuple(message_lst)
+        match_clust = self.cache.get(seq_key)
+        if match_clust is not None:
+            match_clust.outcell.add_log(log_id)
+            return match_clust, False
+
+        # Tree search but not generate node here
+        match_clust = self.tree_search(rtn, message_lst)
+
+        if match_clust is None:
+            # Match no existing log cluster, so add a new one
+            # The template in each cluster is new
+            self.add_cluster(message_lst, [log_id], log_clust_lst,
+                             out_cell_lst, rtn, True, '0')
+            return log_clust_lst[-1], True
+
+        # Match an existing cluster, add new log message to it
+        tmplt_updt_cnt = match_clust.tmplt_updt_cnt
+        self.update_cluster(message_lst, log_id, log_clust_lst, match_clust)
+        if match_clust.tmplt_updt_cnt != tmplt_updt_cnt:
+            return match_clust, True
+
+        # Cache the match only if the tree is not changed by the update,
+        # then the same log always gets the same cluster.
+        self.cache.put(seq_key, match_clust)
+        return match_clust, False
+
+    def shard_match(self, contents, eids, tmplts):
+        """
+        Preprocess and match the logs against the read-only tree that is
+        built from the template library, in shards across the worker
+        processes. See _match_shard() for the result of each log.
+        """
+        num_workers = self.para.num_workers
+        shard_size = math.ceil(len(contents) / (num_workers * 4))
+        shards = [contents[i:i+shard_size] for i in range(0, len(contents), shard_size)]
+
+        print(f"Matching {len(contents)} logs against the template library "
+              f"on {num_workers} workers ...")
+        shard_rslts = []
+        with mp.Pool(num_workers, initializer=_init_shard_worker,
+                     initargs=(self.para, eids, tmplts)) as pool:
+            # The imap keeps the order of shards
+            for shard_rslt in pool.imap(_match_shard, shards):
+                shard_rslts.extend(shard_rslt)
+        return shard_rslts
+
+    def setup_tree(self):
+        """ Set up the tree and return root node and the cluster lists """
         root_node = Node()
 
         # List of nodes in the similarity layer containing similar logs
@@ -917,28 +1475,51 @@ class Drain:
 
         # Load the templates from the template library
         self.load_template_lib()
+        eids = self._df_tmplts['EventId'].tolist()
+        tmplts = self._df_tmplts['EventTemplate'].tolist()
 
         #
-        # Build the tree by using templates from library
+        # Build the tree by using templates from library. Restore it from
+        # the snapshot if the library is not changed since last build.
         #
-        for eid, line in zip(self._df_tmplts['EventId'].tolist(),
-                             self._df_tmplts['EventTemplate'].tolist()):
-            # Split the template into token list
-            # Note, reserve the trailing spaces of each log if it has
-            log_t = line.strip('\r\n')
-            token_count = len(log_t.split())
-            message_lst = log_t.split(None, token_count-1)
+        if not self.load_tree(eids, log_clust_lst, out_cell_lst, root_node):
+            self.build_tree(eids, tmplts, log_clust_lst, out_cell_lst, root_node)
+            self.save_tree(log_clust_lst, root_node)
 
-            # Read the old template id for current template
-            eid_old = eid
+        return root_node, log_clust_lst, out_cell_lst
 
-            # Add new cluster to the tree, and no log id for template
-            # The template in each cluster is NOT new
-            self.add_cluster(message_lst, [], log_clust_lst, out_cell_lst,
-                             root_node, False, eid_old)
+    def finish_process(self, root_node, start_time):
+        """ Print the summary and the tree for debugging """
+        print(f"Parsing done. [Time taken: {datetime.now() - start_time}, "
+              f"Cache hit rate: {self.cache.hit_rate:.2%}]\n")
+
+        # Print the tree to a file for debugging...
+        if self.para.prt_tree:
+            self.print_tree(root_node, 0)
+            with open(os.path.join(self.para.save_path, 'tree.txt'), 'w',
+                encoding='utf-8') as drain_tree:
+                drain_tree.write(self.tree)
+
+    def main_process(self):
+        """ The main entry """
+        print('Parsing file: ' + self.para.raw_file)
+        start_time = datetime.now()
+
+        root_node, log_clust_lst, out_cell_lst = self.setup_tree()
 
         # Load the raw log data
         self.load_data()
+        contents = self._df_raws['Content'].tolist()
+
+        # Match the logs against the library in parallel for big data.
+        # The result of a log stays valid until the length layer it goes
+        # to is changed by the serial parsing below.
+        shard_rslts = None
+        if self.para.num_workers > 1 and len(contents) >= self.PARALLEL_MIN_LOGS:
+            shard_rslts = self.shard_match(contents,
+                                           self._df_tmplts['EventId'].tolist(),
+                                           self._df_tmplts['EventTemplate'].tolist())
+        dirty_lens = set()
 
         # A lower overhead progress bar
         pbar = tqdm(total=self._df_raws.shape[0], unit='Logs', disable=self.para.nopgbar,
@@ -947,39 +1528,296 @@ class Drain:
         #
         # Process the raw log data
         #
-        for idx, line in enumerate(self._df_raws['Content'].tolist()):
+        for idx, line in enumerate(contents):
             # For debugging purpose
             self.log_id = idx + 1
+            pbar.update(1)
 
-            # Reserve trailing spaces of each log if it has
-            log_t = self.preprocess(line).strip('\r\n')
-            token_count = len(log_t.split())
-            message_lst = log_t.split(None, token_count-1)
-
-            # Tree search but not generate node here
-            match_clust = self.tree_search(root_node, message_lst)
-
-            if match_clust is None:
-                # Match no existing log cluster, so add a new one
-                # The template in each cluster is new
-                self.add_cluster(message_lst, [idx+1], log_clust_lst,
-                                 out_cell_lst, root_node, True, '0')
+            if shard_rslts is None:
+                # Reserve trailing spaces of each log if it has
+                log_t = self.preprocess(line).strip('\r\n')
             else:
-                # Match an existing cluster, add new log message to it
-                self.update_cluster(message_lst, idx+1, log_clust_lst, match_clust)
+                seed_idx, seq_len, log_t = shard_rslts[idx]
+                if seed_idx >= 0 and seq_len not in dirty_lens:
+                    # Same as the matching of serial parsing
+                    log_clust_lst[seed_idx].outcell.add_log(idx+1)
+                    continue
 
-            pbar.update(1)
+            message_lst = self.split_log(log_t)
+            _, changed = self.parse_log(idx+1, message_lst, log_clust_lst, out_cell_lst,
+                                        root_node)
+            if changed:
+                dirty_lens.add(len(message_lst))
 
         pbar.close()
         if not os.path.exists(self.para.save_path):
             os.makedirs(self.para.save_path)
 
         self.output_result(log_clust_lst)
-        print(f"Parsing done. [Time taken: {datetime.now() - start_time}]\n")
+        self.finish_process(root_node, start_time)
 
-        # Print the tree to a file for debugging...
-        if self.para.prt_tree:
-            self.print_tree(root_node, 0)
-            with open(os.path.join(self.para.save_path, 'tree.txt'), 'w',
-                encoding='utf-8') as drain_tree:
-                drain_tree.write(self.tree)
+    def stream_process(self, lines):
+        """
+        The streaming entry. Parse an iterator of norm logs and yield the
+        structured logs in data frames of para.chunk_size rows, which have
+        the same columns as df_raws. The output cells count the logs only
+        instead of keeping their ids, so the memory does not grow with the
+        input size. The template library is output after the last chunk.
+
+        Note, each log gets the template of its cluster at the time it is
+        parsed, and the template may be updated by the later logs. Batch
+        mode main_process() assigns the final templates instead.
+        """
+        print('Parsing stream: ' + self.para.raw_file)
+        start_time = datetime.now()
+
+        self.keep_ids = False
+        root_node, log_clust_lst, out_cell_lst = self.setup_tree()
+
+        headers, regex = self.generate_logformat_regex(self.para.log_format)
+        content_idx = headers.index('Content')
+        columns = ['LineId'] + headers + ['EventIdOld', 'EventId', 'EventTemplate']
+
+        if not os.path.exists(self.para.save_path):
+            os.makedirs(self.para.save_path)
+        struct_file = None
+        if self.para.intmdt or not self.para.aim:
+            struct_file = os.path.join(self.para.save_path,
+                          os.path.basename(self.para.raw_file) + '_structured.csv')
+
+        # Template index of each cluster, keyed by the cluster id and
+        # refreshed when the template is updated.
+        tmplt_memo = {}
+        eid_old_idx = {}
+        records, codes, codes_old = [], [], []
+        chunk_num = 0
+        # No total for the progress bar of stream
+        pbar = tqdm(unit='Logs', disable=self.para.nopgbar)
+
+        for line in lines:
+            match = regex.search(line.strip('\r\n'))
+            if match is None:
+                continue
+            message = [match.group(header) for header in headers]
+            self.log_id += 1
+            pbar.update(1)
+
+            # Reserve trailing spaces of each log if it has
+            log_t = self.preprocess(message[content_idx]).strip('\r\n')
+            log_clust, _ = self.parse_log(self.log_id, self.split_log(log_t),
+                                          log_clust_lst, out_cell_lst, root_node)
+
+            memo = tmplt_memo.get(id(log_clust))
+            if memo is None or memo[0] != log_clust.tmplt_updt_cnt:
+                memo = tmplt_memo[id(log_clust)] = \
+                    (log_clust.tmplt_updt_cnt, self.registry.intern(' '.join(log_clust.log_tmplt)))
+            records.append([self.log_id] + message)
+            codes.append(memo[1])
+            codes_old.append(eid_old_idx.setdefault(log_clust.tmplt_id_old, len(eid_old_idx)))
+
+            if len(records) == self.para.chunk_size:
+                chunk = self.stream_chunk(records, columns, codes, codes_old, eid_old_idx)
+                records, codes, codes_old = [], [], []
+                if struct_file is not None:
+                    chunk.to_csv(struct_file, mode='a' if chunk_num else 'w',
+                                 header=not chunk_num, index=False)
+                chunk_num += 1
+                yield chunk
+
+        pbar.close()
+        if records or not chunk_num:
+            chunk = self.stream_chunk(records, columns, codes, codes_old, eid_old_idx)
+            if struct_file is not None:
+                chunk.to_csv(struct_file, mode='a' if chunk_num else 'w',
+                             header=not chunk_num, index=False)
+            yield chunk
+
+        self.output_tmplts(log_clust_lst)
+        self.finish_process(root_node, start_time)
+
+    def stream_chunk(self, records, columns, codes, codes_old, eid_old_idx):
+        """ Build the data frame of a chunk of structured logs """
+        chunk = pd.DataFrame(records, columns=columns[:-3])
+        chunk['EventIdOld'] = pd.Categorical.from_codes(
+            np.array(codes_old, dtype=np.int32), categories=list(eid_old_idx))
+        chunk['EventId'], chunk['EventTemplate'] = \
+            self.registry.to_columns(np.array(codes, dtype=np.int32))
+        return chunk
+
+
+class Drainsession:
+    """ Long-lived online Drain. It keeps the tree hot between calls and
+        accepts the norm logs one at a time or in micro-batches. The
+        library changes are written back in batch on an interval.
+    """
+    def __init__(self, para, flush_interval=60):
+        """
+        Attributes
+        ----------
+        drain          : the Drain object that holds the hot tree
+        flush_interval : min seconds between two write-backs of library
+        dirty          : the tree is changed since last write-back
+        last_flush     : the time of last write-back
+        """
+        self.drain = Drain(para, [])
+        self.drain.keep_ids = False
+        self.flush_interval = flush_interval
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        self._root_node, self._log_clust_lst, self._out_cell_lst = self.drain.setup_tree()
+        self._headers, self._regex = self.drain.generate_logformat_regex(para.log_format)
+        self._content_idx = self._headers.index('Content')
+        self._columns = ['LineId'] + self._headers + \
+                        ['EventIdOld', 'EventId', 'EventTemplate']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def parse_line(self, line):
+        """
+        Parse one norm log. Return the template index in the registry of
+        drain and the old template id, or None if the log does not match
+        the log format.
+        """
+        match = self._regex.search(line.strip('\r\n'))
+        if match is None:
+            return None
+        return self.parse_match(match)
+
+    def parse_match(self, match):
+        """
+        Parse one norm log that matches the log format. Write back the
+        library if the flush interval passes.
+        """
+        self.drain.log_id += 1
+
+        # Reserve trailing spaces of each log if it has
+        log_t = self.drain.preprocess(match.group('Content')).strip('\r\n')
+        log_clust, changed = self.drain.parse_log(
+            self.drain.log_id, self.drain.split_log(log_t),
+            self._log_clust_lst, self._out_cell_lst, self._root_node)
+        self.dirty = self.dirty or changed
+
+        tmplt_idx = self.drain.registry.intern(' '.join(log_clust.log_tmplt))
+        tmplt_id_old = log_clust.tmplt_id_old
+        self.maybe_flush()
+        return tmplt_idx, tmplt_id_old
+
+    def parse(self, lines):
+        """
+        Parse a micro-batch of norm logs and return the structured logs
+        in data frame, which has the same columns as df_raws.
+        """
+        eid_old_idx = {}
+        records, codes, codes_old = [], [], []
+        for line in lines:
+            match = self._regex.search(line.strip('\r\n'))
+            if match is None:
+                continue
+            tmplt_idx, tmplt_id_old = self.parse_match(match)
+            records.append([self.drain.log_id] + \
+                           [match.group(header) for header in self._headers])
+            codes.append(tmplt_idx)
+            codes_old.append(eid_old_idx.setdefault(tmplt_id_old, len(eid_old_idx)))
+
+        return self.drain.stream_chunk(records, self._columns, codes, codes_old, eid_old_idx)
+
+    def maybe_flush(self):
+        """ Write back the library if it is changed and interval passes """
+        if self.dirty and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write back the new and updated templates to the library in a
+        single atomic write, along with the EventIdOld lineage. Then the
+        written ids become the old ids of the following parsing, which
+        is the same as a new batch run loading the library.
+
+        The library is written only if over_wr_lib and inc_updt are both
+        enabled. Otherwise the lineage and the new flags of templates are
+        kept, as nothing is persisted.
+        """
+        self.last_flush = time.monotonic()
+        if not self.dirty:
+            return
+        self.drain.output_tmplts(self._log_clust_lst)
+        self.dirty = False
+
+        if not (self.drain.para.over_wr_lib and self.drain.para.inc_updt):
+            return
+
+        for log_clust in self._log_clust_lst:
+            tmplt_idx = self.drain.registry.intern(' '.join(log_clust.log_tmplt))
+            log_clust.tmplt_id_old = self.drain.registry.eid(tmplt_idx)
+            log_clust.is_tmplt_new = False
+
+        # Keep the tree snapshot in sync with the written library. The
+        # hot tree has evolved sim thresholds and leaf placement, so the
+        # snapshot is the tree rebuilt from the written library, same as
+        # the one a batch run builds from it.
+        log_clust_lst = []
+        root_node = Node()
+        self.drain.build_tree(self.drain.df_tmplts['EventId'].tolist(),
+                              self.drain.df_tmplts['EventTemplate'].tolist(),
+                              log_clust_lst, [], root_node)
+        self.drain.save_tree(log_clust_lst, root_node)
+
+    def close(self):
+        """ Write back the pending changes of library """
+        self.flush()
+
+    @property
+    def df_tmplts(self):
+        """ Get templates of last write-back in pandas dataframe
+            Column: EventIdOld/EventId/EventTemplate/Occurrences
+        """
+        return self.drain.df_tmplts
+
+
+# The read-only tree of each worker process for parallel parsing
+_SHARD_SEED = None
+
+
+def _init_shard_worker(para, eids, tmplts):
+    """ Build the read-only tree from the template library in worker """
+    global _SHARD_SEED  # pylint: disable=global-statement
+    drain = Drain(para, [])
+    root_node = Node()
+    log_clust_lst = []
+    drain.build_tree(eids, tmplts, log_clust_lst, [], root_node)
+    clust_idx = {id(log_clust): idx for idx, log_clust in enumerate(log_clust_lst)}
+    _SHARD_SEED = (drain, root_node, clust_idx)
+
+
+def _match_shard(lines):
+    """
+    Preprocess and match a shard of logs in worker. The result of each
+    log is a tuple (seed_idx, seq_len, log_t). The seed_idx is the index
+    of the matched library template whose template is not changed by the
+    log, or -1 otherwise. The log_t is the log preprocessed in Drain.
+    """
+    drain, root_node, clust_idx = _SHARD_SEED
+    shard_rslt = []
+    for line in lines:
+        log_t = drain.preprocess(line).strip('\r\n')
+        message_lst = drain.split_log(log_t)
+        seq_key = tuple(message_lst)
+
+        # The tree is read-only, so the cache never goes stale here
+        match_clust = drain.cache.get(seq_key)
+        if match_clust is None:
+            match_clust = drain.tree_search(root_node, message_lst)
+            if match_clust is not None:
+                new_tmplt, _ = drain.get_template(message_lst, match_clust.log_tmplt)
+                if new_tmplt == match_clust.log_tmplt:
+                    drain.cache.put(seq_key, match_clust)
+                else:
+                    match_clust = None
+
+        seed_idx = -1 if match_clust is None else clust_idx[id(match_clust)]
+        shard_rslt.append((seed_idx, len(message_lst), log_t))
+    return shard_rslt
@@ -3,14 +3,14 @@
 import sys
 import re
 import logging
-import hashlib
-import pickle
-from typing import List
+from typing import List, Iterable
 from importlib import import_module
 # import pandas as pd
+import numpy as np
 import analyzer.utils.data_helper as dh
+import analyzer.utils.array_helper as ah
 from analyzer.config import GlobalConfig as GC
-from analyzer.parser import Para, Drain
+from analyzer.parser import Para, Drain, Drainsession, Tmpltregistry
 
 # Load LOG_TYPE specific patterns
 ptn = import_module("analyzer.extensions." + dh.LOG_TYPE + ".patterns")
@@ -22,6 +22,40 @@ __all__ = ["Parser"]
 log = logging.getLogger(__name__)
 
 
+class Suffixindex():
+    """ Reversed trie of the templates in library. It finds the longest
+        template that is a suffix of a string in a single backward pass
+        of the string, instead of hashing each suffix.
+    """
+    # Key of the terminal mark in a trie node, never a char of template
+    END = ''
+
+    def __init__(self, tmplts: List[str]):
+        self.root: dict = {}
+        for tmplt in tmplts:
+            if not isinstance(tmplt, str) or not tmplt:
+                continue
+            node = self.root
+            for char in reversed(tmplt):
+                node = node.setdefault(char, {})
+            node[self.END] = True
+
+    def longest_suffix(self, text: str, min_start: int = 0) -> int:
+        """ Return the start index of the longest template that is a
+            suffix of the text and starts at min_start or later, -1 if
+            no such template.
+        """
+        start: int = -1
+        node: dict = self.root
+        for idx in range(len(text)-1, min_start-1, -1):
+            node = node.get(text[idx])
+            if node is None:
+                break
+            if self.END in node:
+                start = idx
+        return start
+
+
 # pylint: disable=too-many-instance-attributes
 class Parser():
     """ The parser class """
@@ -41,6 +75,7 @@ class Parser():
         self._norm_rcv: List[str] = []
         self._df_raws = None
         self._df_tmplts = None
+        self._registry: Tmpltregistry = Tmpltregistry()
 
     @property
     def df_raws(self):
@@ -56,6 +91,13 @@ class Parser():
         """
         return self._df_tmplts
 
+    @property
+    def registry(self):
+        """ Get the template registry. The codes of categorical EventId
+            and EventTemplate in df_raws are the indices in it.
+        """
+        return self._registry
+
     @property
     def map_norm_raw(self):
         """ Get the raw line index in norm data """
@@ -76,8 +118,10 @@ class Parser():
         """ Get the mess recovered norm data """
         return self._norm_rcv
 
-    def parse(self):
-        """ Parse, generate and update templates """
+    def drain_para(self):
+        """ Set up the parameters of Drain. Return None if the log type
+            does not match.
+        """
         # For Loglab/DeepLog predict and OSS, check the runtime log head
         # off value to decide the timestamp width.
         if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
@@ -97,7 +141,7 @@ class Parser():
                 # It's OK to exit for console app. But for webgui app,
                 # it's not good as no any info send to later modules.
                 # sys.exit(1)
-                return
+                return None
         else:
             log_format = msc.LOG_FORMAT_COMPLETE
 
@@ -109,20 +153,16 @@ class Parser():
             ptn_hard_para = ptn.PTN_HARD_PARA
             raw_file = self.fzip['norm']
 
-        my_para = Para(
+        return Para(
             log_format, ptn_hard_para, ptn.PTN_SPEC_TOKEN, raw_file, dh.TEMPLATE_LIB,
             outdir=self.fzip['output'], over_wr_lib=self.training, intmdt=self.intmdt,
-            aim=self.aim, inc_updt=True, prt_tree=self.dbg, nopgbar=False
+            aim=self.aim, inc_updt=True, prt_tree=self.dbg, nopgbar=False,
+            num_workers=GC.conf['template']['workers'], tree_snapshot=dh.TEMPLATE_TREE,
+            chunk_size=GC.conf['template']['chunk']
         )
 
-        my_parser = Drain(my_para, self._rawlogs)
-        my_parser.main_process()
-
-        # Reload the magazine of our parser gun
-        #
-        # Column: LineId/Time/Content/EventIdOld/EventId/EventTemplate
-        self._df_raws = my_parser.df_raws
-
+    def update_tmplts(self, my_parser):
+        """ Reload the templates from Drain after parsing """
         # For in-memory template lib, it is always the same as the data
         # in lib file except 'Occurrences' for training. It is probably
         # different for prediction as we dont overwrite lib file with
@@ -134,44 +174,80 @@ class Parser():
             # Column: EventIdOld/EventId/EventTemplate
             self._df_tmplts = my_parser.df_tmplts_o
 
+    def parse(self):
+        """ Parse, generate and update templates """
+        my_para = self.drain_para()
+        if my_para is None:
+            return
+
+        my_parser = Drain(my_para, self._rawlogs)
+        my_parser.main_process()
+
+        # Reload the magazine of our parser gun
+        #
+        # Column: LineId/Time/Content/EventIdOld/EventId/EventTemplate
+        self._df_raws = my_parser.df_raws
+        self._registry = my_parser.registry
+        self.update_tmplts(my_parser)
+
+    def parse_stream(self, lines: Iterable[str]):
+        """ Parse an iterator of norm logs in bounded memory and yield the
+            structured logs in chunks of dataframe. The templates are
+            updated after the last chunk. See Drain.stream_process().
+            Column: LineId/Time/Content/EventIdOld/EventId/EventTemplate
+        """
+        my_para = self.drain_para()
+        if my_para is None:
+            return
+
+        my_parser = Drain(my_para, [])
+        self._registry = my_parser.registry
+        yield from my_parser.stream_process(lines)
+        self.update_tmplts(my_parser)
+
+    def session(self):
+        """ Open an online Drain session that keeps the tree hot and
+            writes back the library on interval. See Drainsession.
+        """
+        my_para = self.drain_para()
+        if my_para is None:
+            return None
+        return Drainsession(my_para, flush_interval=GC.conf['template']['flush'])
+
     def learn_timestamp(self):
         """ Learn the width of timestamp. Run parse beforehand. """
-        # Load event id from template library
-        eid_lib: List[str] = self._df_tmplts['EventId'].values.tolist()
+        # Index the templates in library by their reversed chars
+        sfx_idx = Suffixindex(self._df_tmplts['EventTemplate'].values.tolist())
 
         # Take the structured logs
-        content_logs: List[str] = self._df_raws['Content'].values.tolist()
-        temp_logs: List[str] = self._df_raws['EventTemplate'].values.tolist()
+        max_line: int = GC.conf['general']['max_line']
+        content_logs: List[str] = self._df_raws['Content'].values.tolist()[0:max_line]
+        temp_logs: List[str] = self._df_raws['EventTemplate'].values.tolist()[0:max_line]
 
         # Init offset as -1 which means a non LOG_TYPE log file
         log_start_offset: int = -1
         idx: int = 0
 
         for idx, (content, temp) in enumerate(zip(content_logs, temp_logs)):
-            # Slice one char at the head of current template, and then
-            # hash the remaining.
-            for i in range(len(temp)):
-                if i > dh.MAX_TIMESTAMP_LENGTH:
-                    break
-                temp_tail = temp[i:]
-                eid_tail = hashlib.md5(temp_tail.encode('utf-8')).hexdigest()[0:8]
-                if eid_tail in eid_lib:
-                    if i == 0:
-                        # No timestamp at all, we can return directly
-                        log_start_offset = 0
-                        return log_start_offset, idx
-
-                    # Take out the first word (append a space) of the
-                    # template and locate where it is in the raw log
-                    # (content).
-                    header = temp[i:].split()[0]+' '
-                    match = re.search(header, content)
-                    if match:
-                        log_start_offset = match.start()
-                        return log_start_offset, idx
-                    # For some reason we cannot locate the header in the
-                    # raw log, go to check the next log
-                    break
+            # The longest template in library that is a suffix of current
+            # template. Anything before it is the timestamp.
+            i = sfx_idx.longest_suffix(temp)
+            if 0 <= i <= dh.MAX_TIMESTAMP_LENGTH:
+                if i == 0:
+                    # No timestamp at all, we can return directly
+                    log_start_offset = 0
+                    return log_start_offset, idx
+
+                # Take out the first word (append a space) of the
+                # template and locate where it is in the raw log
+                # (content).
+                header = temp[i:].split()[0]+' '
+                match = re.search(header, content)
+                if match:
+                    log_start_offset = match.start()
+                    return log_start_offset, idx
+                # For some reason we cannot locate the header in the
+                # raw log, go to check the next log
 
         return log_start_offset, idx
 
@@ -195,8 +271,8 @@ class Parser():
             Not for DeepLog train and validation.
             Not for OSS, Loglab and Loglizer.
         """
-        # Load event id from template library
-        eid_lib: List[str] = self._df_tmplts['EventId'].values.tolist()
+        # Index the templates in library by their reversed chars
+        sfx_idx = Suffixindex(self._df_tmplts['EventTemplate'].values.tolist())
 
         # Load old event id & template of each log from structured norm
         if self._log_head_offset > 0:
@@ -249,22 +325,24 @@ class Parser():
 
             # We get here only when conditon below:
             # (old event id is zero) AND (m1_found==0 AND header_care)
-            # The case 1, the most common case
-            for i in range(len(temp)):
-                o1_head = temp[0:i+1]
-                temp_o2 = temp[i+1:]
-                eid_o2 = hashlib.md5(temp_o2.encode('utf-8')).hexdigest()[0:8]
-                if eid_o2 in eid_lib:
-                    m1_found = True
-                    m1_idx = idx
-                    # new_temp_logs[idx] = temp_o2
-                    self._map_norm_rcv.append(idx)
-                    self._norm_rcv.append(''.join([time_logs[idx], temp_o2, '\n']))
-                    if eid_o2 in msc.SPECIAL_ID:
-                        # The case 2:
-                        # Remove one trailing spaces in o1_head
-                        o1_head = o1_head[0:-1]
-                    break
+            # The case 1, the most common case. The o2 is the longest
+            # template in library that is a suffix of current log but
+            # not the whole log, and the o1_head is the remaining head.
+            i = sfx_idx.longest_suffix(temp, min_start=1)
+            if i > 0:
+                o1_head = temp[0:i]
+                temp_o2 = temp[i:]
+                m1_found = True
+                m1_idx = idx
+                # new_temp_logs[idx] = temp_o2
+                self._map_norm_rcv.append(idx)
+                self._norm_rcv.append(''.join([time_logs[idx], temp_o2, '\n']))
+                if Tmpltregistry.hash_tmplt(temp_o2) in msc.SPECIAL_ID:
+                    # The case 2:
+                    # Remove one trailing spaces in o1_head
+                    o1_head = o1_head[0:-1]
+            else:
+                o1_head = temp
 
             # If cannot find m1 in current log, we suppose o1 is broken
             # by o2 wherein a leading new line char exists. In other
@@ -292,17 +370,15 @@ class Parser():
         # Update the raw / norm file line mapping table
         if len(skipped_ln) > 0:
             if not GC.conf['general']['aim']:
-                with open(self.fzip['map_norm_raw'], 'rb') as fio:
-                    self._map_norm_raw = pickle.load(fio)
-            # reverse the list in skipped_ln before poping the empty lines
-            for i in skipped_ln[::-1]:
-                self._map_norm_raw.pop(i)
+                self._map_norm_raw = ah.load_vec(self.fzip['map_norm_raw'], ah.DTYPE_LINE)
+            # Drop the empty lines from the table in a single pass
+            keep = np.ones(len(self._map_norm_raw), dtype=bool)
+            keep[skipped_ln] = False
+            self._map_norm_raw = np.asarray(self._map_norm_raw)[keep].tolist()
             if not GC.conf['general']['aim']:
-                with open(self.fzip['map_norm_raw'], 'wb') as fio:
-                    pickle.dump(self._map_norm_raw, fio)
+                ah.save_vec(self.fzip['map_norm_raw'], self._map_norm_raw, ah.DTYPE_LINE)
 
         if not GC.conf['general']['aim']:
-            with open(self.fzip['map_norm_rcv'], 'wb') as fio:
-                pickle.dump(self._map_norm_rcv, fio)
+            ah.save_vec(self.fzip['map_norm_rcv'], self._map_norm_rcv, ah.DTYPE_LINE)
             with open(self.fzip['norm_rcv'], 'w', encoding='utf-8') as fout:
                 fout.writelines(self._norm_rcv)
@@ -2,5 +2,8 @@
 """ Preprocess package.
 """
 from .preprocess_base import *
+from .rawfile import *
+from .catcache import *
+from .samplestore import *
 # from .patterns import *
 from .preprocess_api import *
@@ -0,0 +1,143 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Incremental cache of raw log files concatenated into a monolith.
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Tuple, Callable, Optional
+
+
+__all__ = ["Catcache"]
+
+
+class Catcache():
+    """
+    The cache of raw log files that are concatenated into a monolith.
+    Each raw file is cooked, e.g. the segment label is inserted, and the
+    result is saved as a piece file in the cache folder. The piece is
+    reused as long as the raw file has the same path, size and mtime,
+    or the same contents hash if only the mtime changes. So only the new
+    or changed raw files are cooked again, on a thread pool.
+
+    Attributes
+    ----------
+    cache_dir : the folder of piece files and the index file
+    num_workers : num of threads to cook the raw files
+    salt : the settings that the cooking depends on besides raw file
+    index : piece name -> dict of raw file path, size, mtime and md5
+    num_hits : num of raw files whose piece is reused
+    """
+    INDEX_FILE = 'index.json'
+    PIECE_EXT = '.txt'
+
+    def __init__(self, cache_dir: str, num_workers: int = 1, salt: str = ''):
+        self.cache_dir = cache_dir
+        self.num_workers = max(num_workers, 1)
+        self.salt = salt
+        self.num_hits = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(os.path.join(cache_dir, self.INDEX_FILE), 'r',
+                      encoding='utf-8') as fidx:
+                self.index = json.load(fidx)
+        except (OSError, ValueError):
+            self.index = {}
+
+    @staticmethod
+    def file_md5(filepath: str):
+        """ The md5 of file contents """
+        md5 = hashlib.md5()
+        with open(filepath, 'rb') as fin:
+            for blk in iter(lambda: fin.read(1 << 20), b''):
+                md5.update(blk)
+        return md5.hexdigest()
+
+    def piece_name(self, rawf: str, seglabel: str):
+        """ The piece name of the raw file along with segment label """
+        key = '\0'.join([os.path.abspath(rawf), seglabel, self.salt])
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def piece_path(self, name: str):
+        """ The piece file path """
+        return os.path.join(self.cache_dir, name + self.PIECE_EXT)
+
+    @staticmethod
+    def write_piece(piece: str, lines: List[str]):
+        """ Write the cooked lines to the piece file """
+        with open(piece, 'w', encoding='utf-8') as fout:
+            fout.writelines(lines)
+
+    def lookup(self, rawf: str, seglabel: str) -> Optional[dict]:
+        """
+        Get the index entry of the raw file if its piece is still valid,
+        with the mtime updated. Return None otherwise.
+        """
+        name = self.piece_name(rawf, seglabel)
+        entry = self.index.get(name)
+        if entry is None or not os.path.exists(self.piece_path(name)):
+            return None
+
+        stat = os.stat(rawf)
+        if entry['size'] != stat.st_size:
+            return None
+        if entry['mtime'] != stat.st_mtime_ns:
+            # Touched only or really changed?
+            if entry['md5'] != self.file_md5(rawf):
+                return None
+            entry = dict(entry, mtime=stat.st_mtime_ns)
+        return entry
+
+    def cook(self, rawf: str, seglabel: str, cook_fn: Callable[[str, str], Any]) -> dict:
+        """ Cook the raw file to the piece and return the index entry """
+        # Get the stat before reading, so a change during the cooking is
+        # found next time.
+        stat = os.stat(rawf)
+        md5 = self.file_md5(rawf)
+        cooked = cook_fn(rawf, seglabel)
+
+        piece = self.piece_path(self.piece_name(rawf, seglabel))
+        self.write_piece(piece + '.tmp', cooked)
+        os.replace(piece + '.tmp', piece)
+
+        return {'path': rawf, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'md5': md5}
+
+    def get(self, rawf: str, seglabel: str, cook_fn: Callable[[str, str], Any]):
+        """ Get the index entry of raw file, cook it if not cached """
+        entry = self.lookup(rawf, seglabel)
+        if entry is not None:
+            return entry, True
+        return self.cook(rawf, seglabel, cook_fn), False
+
+    def pieces(self, sources: List[Tuple[str, str]],
+               cook_fn: Callable[[str, str], Any]) -> List[str]:
+        """
+        Get the pieces of the raw files in order. The sources are tuples
+        of raw file path and segment label (empty for none). The cook_fn
+        reads a raw file, inserts the segment label, and returns what is
+        saved by write_piece(), e.g. lines.
+        """
+        with ThreadPoolExecutor(self.num_workers) as pool:
+            rslts = list(pool.map(lambda src: self.get(*src, cook_fn), sources))
+
+        names = [self.piece_name(rawf, seglabel) for rawf, seglabel in sources]
+        for name, (entry, hit) in zip(names, rslts):
+            self.index[name] = entry
+            self.num_hits += hit
+
+        # Drop the pieces of raw files that are removed
+        for name in [name for name, entry in self.index.items()
+                     if not os.path.exists(entry['path'])]:
+            if os.path.exists(self.piece_path(name)):
+                os.remove(self.piece_path(name))
+            del self.index[name]
+
+        self.save()
+        return [self.piece_path(name) for name in names]
+
+    def save(self):
+        """ Save the index file atomically """
+        index_file = os.path.join(self.cache_dir, self.INDEX_FILE)
+        with open(index_file + '.tmp', 'w', encoding='utf-8') as fidx:
+            json.dump(self.index, fidx)
+        os.replace(index_file + '.tmp', index_file)
@@ -4,15 +4,23 @@
 import re
 import os
 import sys
-import pickle
+import shutil
 import logging
+import multiprocessing as mp
 from datetime import datetime
+from contextlib import nullcontext
 from abc import ABC, abstractmethod
-from typing import List, Pattern, Match, Any, Dict
+from typing import List, Pattern, Match, Any, Dict, Iterable, Iterator, Tuple, Optional, \
+    Callable
+import numpy as np
 from tqdm import tqdm
 from analyzer.config import GlobalConfig as GC
 import analyzer.utils.data_helper as dh
+import analyzer.utils.array_helper as ah
 from . import patterns as ptn
+from .rawfile import Rawfile
+from .catcache import Catcache
+from .samplestore import Sample, Samplestore
 
 
 __all__ = ["PreprocessBase"]
@@ -30,6 +38,11 @@ log = logging.getLogger(__name__)
 # pylint: disable=too-many-instance-attributes,too-many-public-methods
 class PreprocessBase(ABC):
     """ The base class of preprocess. """
+    # Min num of raw logs to run the preprocess_new in parallel
+    PARALLEL_MIN_LINES = 10000
+    # Max num of lines to look ahead for a safe chunk boundary
+    BOUNDARY_LOOKAHEAD = 1000
+
     def __init__(self):
         self.fzip: dict = dh.get_files_io()
         self.datatype: str = dh.get_data_type()
@@ -37,6 +50,7 @@ class PreprocessBase(ABC):
         self.metrics: bool = GC.conf['general']['metrics']
         self.context: str = GC.conf['general']['context']
         self.max_line: int = GC.conf['general']['max_line']
+        self.num_workers: int = GC.conf['general']['workers']
 
         self._rawlogs: List[str] = []
         self._newlogs: List[str] = []
@@ -66,12 +80,35 @@ class PreprocessBase(ABC):
         # To skip the BOM when decoding the file, use utf-8-sig codec.
         # https://docs.python.org/3/library/codecs.html
         #
+        # The file is mapped in memory and the lines are decoded lazily
+        # as the utf-8-sig codec does. See Rawfile.
+        #
         if not os.path.exists(self.fzip['raw']):
             print(f"The {dh.get_data_type()}.txt doesn't exist in cooked folder!!!")
             sys.exit(1)
 
-        with open(self.fzip['raw'], 'r', encoding='utf-8-sig') as rawfile:
-            self._rawlogs = rawfile.readlines()
+        self.close_raw_logs()
+        self._rawlogs = Rawfile(self.fzip['raw'])
+
+    def close_raw_logs(self):
+        """
+        Unmap and close the raw file if the raw logs are mapped from it.
+        The raw logs are empty then. Call it before the raw logs are
+        replaced, and once they are consumed, so no file handle leaks
+        or blocks rewriting the raw file.
+        """
+        if isinstance(self._rawlogs, Rawfile):
+            self._rawlogs.close()
+            self._rawlogs = []
+
+    def iter_raw_logs(self) -> Iterator[str]:
+        """ Read raw data file line by line. See load_raw_logs(). """
+        if not os.path.exists(self.fzip['raw']):
+            print(f"The {dh.get_data_type()}.txt doesn't exist in cooked folder!!!")
+            sys.exit(1)
+
+        with Rawfile(self.fzip['raw']) as rawfile:
+            yield from rawfile
 
     def _main_timestamp_regx(self):
         """ Get timestamp regx pattern object. """
@@ -112,6 +149,34 @@ class PreprocessBase(ABC):
             last_label_removed = True
         return last_label, last_label_removed
 
+    def raw_skip_check(self) -> Optional[Callable[[bytes], bool]]:
+        """
+        The check on the bytes of raw line if iter_new drops it because
+        of the main timestamp. Only the ASCII line is checked, for which
+        the bytes patterns work the same as the str ones. Return None if
+        no line is dropped that way. Run _get_timestamp_info() first.
+        """
+        if not self._reserve_ts:
+            return None
+        try:
+            ptn_ts = re.compile(self.ptn_main_ts.pattern.encode(),
+                                self.ptn_main_ts.flags & ~re.UNICODE)
+        except re.error:
+            return None
+
+        if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
+            and not (self.training or self.metrics):
+            ptn_fuzzy = re.compile(ptn.PTN_FUZZY_TIME.pattern.encode())
+
+            def skip(line: bytes):
+                if not line.isascii():
+                    return False
+                match_ts = ptn_ts.match(line)
+                return not match_ts or not ptn_fuzzy.search(match_ts.group(0))
+            return skip
+
+        return lambda line: line.isascii() and not ptn_ts.match(line)
+
     @property
     def log_head_offset(self):
         """ Get log head offset info. """
@@ -236,10 +301,45 @@ class PreprocessBase(ABC):
         # Reset newlogs in case it is not empty
         self._newlogs = []
 
-        #-------------------------------
-        # Local state variables
-        #-------------------------------
-        stat: Dict[str, Any] = {
+        print(f"Pre-processing the raw {self.datatype} dataset ...")
+        parse_st: datetime = datetime.now()
+
+        #
+        # A low overhead progress bar
+        # https://github.com/tqdm/tqdm#documentation
+        # If only display statics w/o bar, set ncols=0
+        #
+        pbar = tqdm(total=len(self._rawlogs), unit='Lines', disable=False,
+                    bar_format='{l_bar}{bar:40}{r_bar}{bar:-40b}')
+
+        if self.num_workers > 1 and len(self._rawlogs) >= self.PARALLEL_MIN_LINES:
+            new_pairs = self.parallel_new(pbar)
+        else:
+            new_pairs = self.iter_new(self._rawlogs, pbar)
+
+        for raw_ln, newline in new_pairs:
+            self._newlogs.append(newline)
+
+            # The raw line index list in the new file
+            # Do it only for prediction in DeepLog/Loglab and OSS
+            if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
+                and not (self.training or self.metrics):
+                self._map_new_raw.append(raw_ln)
+
+        pbar.close()
+
+        # The raw logs are consumed
+        self.close_raw_logs()
+
+        # Conditionally save the newlogs to a file per the config file
+        self.cond_save_strings(self.fzip['new'], self._newlogs)
+
+        print(f"Purge costs {datetime.now()-parse_st}\n")
+
+    @staticmethod
+    def new_state() -> Dict[str, Any]:
+        """ The initial state variables of preprocess_new """
+        return {
             'head_clean': False,
             'remove_line': False,
             'tbl_hdr_done': False,
@@ -252,20 +352,123 @@ class PreprocessBase(ABC):
             'curr_line_ts': ''
         }
 
-        print(f"Pre-processing the raw {self.datatype} dataset ...")
-        parse_st: datetime = datetime.now()
+    @staticmethod
+    def carried_state(stat: Dict[str, Any]):
+        """
+        The part of state variables that is carried over to the next raw
+        line. The remove_line is reset and the curr_line_ts is rewritten
+        by each line before use. The con_empty_ln_cnt is read only after
+        an empty line.
+        """
+        return (stat['head_clean'], stat['tbl_hdr_done'], stat['last_ln_empty'],
+                stat['last_label_removed'], stat['last_label'], stat['in_stat_tbl'],
+                stat['in_log_blk'], stat['con_empty_ln_cnt'] if stat['last_ln_empty'] else 0)
 
-        #
-        # A low overhead progress bar
-        # https://github.com/tqdm/tqdm#documentation
-        # If only display statics w/o bar, set ncols=0
-        #
-        pbar = tqdm(total=len(self._rawlogs), unit='Lines', disable=False,
-                    bar_format='{l_bar}{bar:40}{r_bar}{bar:-40b}')
+    def is_safe_boundary(self, line: str):
+        """
+        Check if the raw line is a candidate of chunk boundary, i.e. a
+        primary line that is not empty. The timestamp is stripped first.
+        """
+        if self._reserve_ts:
+            match_ts = self.ptn_main_ts.match(line)
+            if not match_ts:
+                return False
+            line = line[match_ts.end():]
+        return bool(line) and not ptn.PTN_NESTED_LINE.match(line) \
+            and not ptn.PTN_EMPTY_LINE.match(line)
 
-        for idx, line in enumerate(self._rawlogs):
+    def chunk_boundaries(self, num_chunks: int):
+        """
+        Split the raw logs into about num_chunks chunks and return the
+        start index of each chunk. A chunk starts at a primary line that
+        follows another one, which is usually out of any log block or
+        table, see is_safe_boundary().
+        """
+        num_lines = len(self._rawlogs)
+        chunk_size = -(-num_lines // num_chunks)
+        starts = [0]
+        for target in range(chunk_size, num_lines, chunk_size):
+            stop = min(target + self.BOUNDARY_LOOKAHEAD, num_lines)
+            for idx in range(max(target, starts[-1]+1), stop):
+                if self.is_safe_boundary(self._rawlogs[idx]) \
+                    and self.is_safe_boundary(self._rawlogs[idx-1]):
+                    starts.append(idx)
+                    break
+        return starts
+
+    def parallel_new(self, pbar: Optional[tqdm] = None) -> List[Tuple[int, str]]:
+        """
+        The parallel version of iter_new. Preprocess the chunks of raw
+        logs across the worker processes, and each chunk starts with the
+        initial state. Then stitch the new logs of chunks in order. The
+        chunk is preprocessed again in serial with the actual state of
+        the former chunk if the initial state does not hold at the chunk
+        boundary, so the new logs are always the same as the serial ones.
+        """
+        starts = self.chunk_boundaries(self.num_workers * 4)
+        ends = starts[1:] + [len(self._rawlogs)]
+        chunks = [(start, self._rawlogs[start:end]) for start, end in zip(starts, ends)]
+
+        print(f"Pre-processing {len(chunks)} chunks on {self.num_workers} workers ...")
+        new_pairs: List[Tuple[int, str]] = []
+        init_stat = self.carried_state(self.new_state())
+        last_stat = None
+        num_redo = 0
+        with mp.Pool(self.num_workers, initializer=_init_chunk_worker,
+                     initargs=(self,)) as pool:
+            # The imap keeps the order of chunks
+            for (start, lines), (chunk_pairs, chunk_stat) \
+                in zip(chunks, pool.imap(_preprocess_chunk, chunks)):
+                if last_stat is not None and self.carried_state(last_stat) != init_stat:
+                    chunk_stat = last_stat
+                    chunk_pairs = list(self.iter_new(lines, start=start, stat=chunk_stat))
+                    num_redo += 1
+                new_pairs.extend(chunk_pairs)
+                last_stat = chunk_stat
+                if pbar is not None:
+                    pbar.update(len(lines))
+
+        if num_redo:
+            log.info("Redo %d chunks in serial for the state across chunks.", num_redo)
+        return new_pairs
+
+    # pylint: disable=too-many-statements, disable=too-many-branches
+    def iter_new(self, rawlogs: Iterable[str], pbar: Optional[tqdm] = None,
+                 start: int = 0, stat: Optional[Dict[str, Any]] = None) \
+        -> Iterator[Tuple[int, str]]:
+        """
+        The stage of preprocess_new. Consume the raw logs and yield the
+        new logs, each along with its raw line index (1 based). Run the
+        _get_timestamp_info() beforehand.
+
+        Parameters
+        ----------
+        rawlogs : the raw logs, checked on bytes first if it is a Rawfile
+        pbar    : the progress bar to update
+        start   : the raw line index (0 based) of the first raw log
+        stat    : the state variables at the first raw log, see the
+                  new_state(). It is updated in place.
+        """
+        #-------------------------------
+        # Local state variables
+        #-------------------------------
+        if stat is None:
+            stat = self.new_state()
+
+        # Check the timestamp on bytes and decode only the rest lines
+        if isinstance(rawlogs, Rawfile):
+            rawlogs = rawlogs.iter_lazy(self.raw_skip_check())
+
+        for idx, line in enumerate(rawlogs, start):
             # Update the progress bar
-            pbar.update(1)
+            if pbar is not None:
+                pbar.update(1)
+
+            # The line without main timestamp is dropped on bytes
+            if line is None:
+                if idx == 0:
+                    stat['head_clean'] = True
+                continue
 
             # ----------------------------------------------------------
             # Handle the main timestamp
@@ -391,27 +594,19 @@ class PreprocessBase(ABC):
             # ----------------------------------------------------------
             if self._reserve_ts and match_ts:
                 newline = ''.join([stat['curr_line_ts'], newline])
-            self._newlogs.append(newline)
-
-            # The raw line index list in the new file
-            # Do it only for prediction in DeepLog/Loglab and OSS
-            if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
-                and not (self.training or self.metrics):
-                self._map_new_raw.append(idx+1)
-
-        pbar.close()
-
-        # Conditionally save the newlogs to a file per the config file
-        self.cond_save_strings(self.fzip['new'], self._newlogs)
-
-        print(f"Purge costs {datetime.now()-parse_st}\n")
+            # Along with the raw line index (1 based) of the new line
+            yield idx+1, newline
 
     # pylint: disable=too-many-branches
-    def preprocess_norm(self):
+    def preprocess_norm(self, labels: bool = False, segment: str = ''):
         """
         Preprocess to generate the norm log data.
         Normalize the new log data, aka. converting multi-line log to
         one line.
+
+        The extract_labels(), segment_deeplog() or segment_loglab() can be
+        fused into it per the params, see iter_postnorm(). Then the norm
+        logs are scanned and written to file only once.
         \b
         Note:
             Overwrite this func if multi-line log has a different format
@@ -428,24 +623,55 @@ class PreprocessBase(ABC):
             with open(self.fzip['new'], 'r', encoding='utf-8') as newfile:
                 self._newlogs = newfile.readlines()
 
-        # Make sure newlogs is not empty. Usually if the preprocess_new
-        # thinks the timestamp format is abnormal, it will delete all
-        # the lines and leads to an empty newlogs.
-        if len(self._newlogs) == 0:
-            print("Timestamps are abnormal, or not standard for training!!!")
-            sys.exit(1)
+        if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
+            and not (self.training or self.metrics):
+            map_new_raw = self._map_new_raw
+        else:
+            map_new_raw = None
+
+        self._normlogs, map_norm_raw = self.norm_columnar(self._newlogs, map_new_raw)
+        # The raw line index list based on the norm file.
+        # Mapping: norm file line index (0-based) -> test file
+        # line index (1-based)
+        # Do it only for prediction in DeepLog/Loglab and OSS
+        if map_new_raw is not None:
+            self._map_norm_raw += map_norm_raw.tolist()
+
+        if labels or segment:
+            self._normlogs = list(self.iter_postnorm(self._normlogs, labels, segment))
+
+        # Conditionally save the normlogs, rawln idx and side info to files
+        if GC.conf['general']['intmdt'] or not GC.conf['general']['aim']:
+            with open(self.fzip['norm'], 'w', encoding='utf-8') as fnorm:
+                fnorm.writelines(self._normlogs)
+
+            if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
+                and not (self.training or self.metrics):
+                ah.save_vec(self.fzip['map_norm_raw'], self._map_norm_raw, ah.DTYPE_LINE)
+            self.save_postnorm_info(labels, segment)
 
+    def iter_norm(self, new_pairs: Iterable[Tuple[Optional[int], str]]) \
+        -> Iterator[Tuple[Optional[int], str]]:
+        """
+        The stage of preprocess_norm. Consume the new logs along with the
+        raw line index, and yield the norm logs along with the raw line
+        index of its primary line. The raw line index is None for a norm
+        log without its own primary line.
+        """
         #-------------------------------
         # Local state variables
         #-------------------------------
         # The last_line is initialized as empty w/o LF or CRLF
         last_line = ''
         last_line_ts = ''
+        last_raw_ln = None
+        match_ts = None
+        idx = -1
 
         #
         # Concatenate nested line to its parent (primary) line
         #
-        for idx, line in enumerate(self._newlogs):
+        for idx, (raw_ln, line) in enumerate(new_pairs):
 
             match_ts = self.ptn_main_ts.match(line)
             if self._reserve_ts and match_ts:
@@ -468,42 +694,185 @@ class PreprocessBase(ABC):
                 # the in-memory data in GlobalConfig['general']['aim']
                 # enabled mode.
                 if idx != 0:
-                    self._normlogs.append(last_line)
-
-                # The raw line index list based on the norm file.
-                # Mapping: norm file line index (0-based) -> test file
-                # line index (1-based)
-                # Do it only for prediction in DeepLog/Loglab and OSS
-                if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
-                    and not (self.training or self.metrics):
-                    self._map_norm_raw.append(self._map_new_raw[idx])
+                    yield last_raw_ln, last_line
 
                 # Update last line parameters
                 last_line = newline
+                last_raw_ln = raw_ln
                 if self._reserve_ts and match_ts:
                     last_line_ts = curr_line_ts
 
+        # Make sure newlogs is not empty. Usually if the preprocess_new
+        # thinks the timestamp format is abnormal, it will delete all
+        # the lines and leads to an empty newlogs.
+        if idx < 0:
+            print("Timestamps are abnormal, or not standard for training!!!")
+            sys.exit(1)
+
         # Write the last line of norm dataset
         if self._reserve_ts and match_ts and (last_line != ''):
             last_line = ''.join([last_line_ts, last_line])
-        self._normlogs.append(last_line)
+        yield last_raw_ln, last_line
 
-        # Conditionally save the normlogs and rawln idx to files
-        if GC.conf['general']['intmdt'] or not GC.conf['general']['aim']:
-            with open(self.fzip['norm'], 'w', encoding='utf-8') as fnorm:
-                fnorm.writelines(self._normlogs)
+    def norm_columnar(self, newlogs: List[str], map_new_raw: Optional[List[int]] = None) \
+        -> Tuple[List[str], np.ndarray]:
+        """
+        The columnar variant of iter_norm over the whole new logs, with
+        the same output. The timestamp, primary line mask and the group
+        of each line are computed as arrays. Then only the groups with
+        nested lines, or the ones whose timestamp is not their own, are
+        joined. The others are the new logs as they are.
+
+        Return the norm logs and the raw line index of them. The latter
+        is an empty array if map_new_raw is None.
+        """
+        num = len(newlogs)
+        # Make sure newlogs is not empty, see iter_norm()
+        if not num:
+            print("Timestamps are abnormal, or not standard for training!!!")
+            sys.exit(1)
 
-            if self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
-                and not (self.training or self.metrics):
-                with open(self.fzip['map_norm_raw'], 'wb') as fridx:
-                    pickle.dump(self._map_norm_raw, fridx)
+        # The end of timestamp in each line, -1 if it doesn't exist
+        if self._reserve_ts:
+            ts_ends = np.array([-1 if match_ts is None else match_ts.end()
+                                for match_ts in map(self.ptn_main_ts.match, newlogs)],
+                               dtype=np.int64)
+        else:
+            ts_ends = np.full(num, -1, dtype=np.int64)
+        has_ts = ts_ends >= 0
+        offsets = np.maximum(ts_ends, 0).tolist()
+
+        # The line is nested if the char behind timestamp is space or tab
+        heads = np.array([line[offset:offset+1] for line, offset in zip(newlogs, offsets)],
+                         dtype='<U1').view(np.uint32)
+        primary = (heads != ord(' ')) & (heads != ord('\t'))
+
+        # Each primary line starts a group. The nested lines ahead of the
+        # first primary line make a group without primary line.
+        prims = np.flatnonzero(primary)
+        orphan = not prims.size or prims[0] != 0
+        starts = np.concatenate(([0], prims)) if orphan else prims
+        ends = np.append(starts[1:], num)
+
+        # The timestamp of a group is the one of latest primary line with
+        # timestamp. It is added back only if the line behind the group,
+        # or the last line for the last group, has timestamp.
+        ts_src = np.maximum.accumulate(np.where(primary & has_ts, np.arange(num), -1))[starts]
+        add_ts = has_ts[np.minimum(ends, num-1)]
+
+        # The single line group is the new log itself if the timestamp is
+        # added back exactly, or not removed at all
+        lens = np.array(list(map(len, newlogs)), dtype=np.int64)[starts]
+        simple = (ends - starts == 1) & primary[starts] & np.where(
+            add_ts, (ts_src == starts) & (lens > ts_ends[starts]), ~has_ts[starts])
+
+        normlogs = [newlogs[idx] for idx in starts.tolist()]
+        for grp in np.flatnonzero(~simple).tolist():
+            start, end, src = int(starts[grp]), int(ends[grp]), int(ts_src[grp])
+            if orphan and grp == 0:
+                head = ''
+            else:
+                head, start = newlogs[start][offsets[start]:], start + 1
+            normline = self._join_nested(head, [newlogs[idx][offsets[idx]:].lstrip()
+                                                for idx in range(start, end)])
+            if add_ts[grp] and normline != '':
+                normline = ''.join([newlogs[src][:offsets[src]] if src >= 0 else '',
+                                    normline])
+            normlogs[grp] = normline
+
+        if map_new_raw is None:
+            return normlogs, np.empty(0, dtype=ah.DTYPE_LINE)
+        return normlogs, np.asarray(map_new_raw, dtype=ah.DTYPE_LINE)[prims]
 
-    def preprocess(self):
+    @staticmethod
+    def _join_nested(head: str, tails: List[str]) -> str:
         """
-        Preprocess in whole.
+        Concatenate the nested lines (left stripped) to the primary line
+        in one join. It is the same as concatenating them one by one as
+        iter_norm() does, i.e. ''.join([last.rstrip(), ', ', tail]).
+        """
+        if not tails:
+            return head
+        # The blank nested line in the middle leaves a trailing ', ' that
+        # is stripped to ',' by the next one. Concatenate one by one.
+        if not all(tail.strip() for tail in tails[:-1]):
+            for tail in tails:
+                head = ''.join([head.rstrip(), ', ', tail])
+            return head
+        return ', '.join([head.rstrip()] + [tail.rstrip() for tail in tails[:-1]]
+                         + tails[-1:])
+
+    def preprocess(self, labels: bool = False, segment: str = ''):
+        """
+        Preprocess in whole. See preprocess_norm() for the params.
         """
         self.preprocess_new()
-        self.preprocess_norm()
+        self.preprocess_norm(labels, segment)
+
+    def iter_preprocess(self, rawlogs: Optional[Iterable[str]] = None,
+                        labels: bool = False, segment: str = '') -> Iterator[str]:
+        """
+        Generator-based preprocess pipeline. The stages raw -> new -> norm
+        -> label extraction -> segmentation are chained, and each consumes
+        and yields lines, so the memory is bounded by the longest multi-
+        line log and the parsing can start before the whole raw file is
+        read, e.g. Parser.parse_stream(ppobj.iter_preprocess()).
+
+        Parameters
+        ----------
+        rawlogs : the raw logs, read from the raw file lazily if None
+        labels  : extract the abnormal labels, see extract_labels()
+        segment : 'deeplog' or 'loglab' to do the segmentation, see the
+                  segment_deeplog() and segment_loglab()
+
+        The labels, segment info and the raw line index of norm logs are
+        collected as the lines go, and saved to files at the end per the
+        config. The new and norm logs are not kept in memory.
+        """
+        self._get_timestamp_info()
+        # Bail out early for the wrong LOG_TYPE
+        if self._log_head_offset < 0:
+            return
+        if rawlogs is None:
+            rawlogs = self.iter_raw_logs()
+
+        predict = self.context in ['LOGLAB', 'OLDSCHOOL', 'DEEPLOG'] \
+            and not (self.training or self.metrics)
+        intmdt = GC.conf['general']['intmdt'] or not GC.conf['general']['aim']
+
+        print(f"Pre-processing the raw {self.datatype} dataset in pipeline ...")
+        parse_st: datetime = datetime.now()
+        pbar = tqdm(unit='Lines', disable=False)
+
+        norm_pairs = self.iter_norm(self.iter_new(rawlogs, pbar))
+        normlogs = (normline for _, normline in norm_pairs) if not predict \
+            else self._iter_map_norm_raw(norm_pairs)
+        if labels or segment:
+            normlogs = self.iter_postnorm(normlogs, labels, segment)
+
+        with open(self.fzip['norm'], 'w', encoding='utf-8') if intmdt \
+            else nullcontext() as fnorm:
+            for normline in normlogs:
+                if fnorm is not None:
+                    fnorm.write(normline)
+                yield normline
+        pbar.close()
+
+        # Conditionally save the side info to files per config file
+        if intmdt:
+            if predict:
+                ah.save_vec(self.fzip['map_norm_raw'], self._map_norm_raw, ah.DTYPE_LINE)
+            self.save_postnorm_info(labels, segment)
+
+        print(f"Purge costs {datetime.now()-parse_st}\n")
+
+    def _iter_map_norm_raw(self, norm_pairs: Iterable[Tuple[Optional[int], str]]) \
+        -> Iterator[str]:
+        """ Record the raw line index of norm logs and yield the logs """
+        for raw_ln, normline in norm_pairs:
+            if raw_ln is not None:
+                self._map_norm_raw.append(raw_ln)
+            yield normline
 
     def extract_labels(self):
         """
@@ -517,39 +886,101 @@ class PreprocessBase(ABC):
         Note:
         Do not call this func for predition
         """
-        norm_logs: List[str] = []
+        self.postprocess_norm(labels=True)
 
+    def iter_labels(self, normlogs: Iterable[str]) -> Iterator[str]:
+        """
+        The stage of extract_labels. Consume the norm logs and yield them
+        with labels removed. The label vector is updated as it goes.
+        """
+        return self.iter_postnorm(normlogs, labels=True)
+
+    def postprocess_norm(self, labels: bool = False, segment: str = ''):
+        """
+        Extract the labels and / or do the segmentation on the norm data
+        in one pass, see iter_postnorm(). The norm data is read from file
+        and rewritten once no matter how many steps are done.
+        """
         if not GC.conf['general']['aim']:
             with open(self.fzip['norm'], 'r', encoding='utf-8') as fnorm:
                 self._normlogs = fnorm.readlines()
 
-        for line in self._normlogs:
-            try:
-                match = ptn.PTN_ABN_LABEL.search(line, self._log_head_offset,
-                        self._log_head_offset+dh.ABN_LABEL_LENGTH)
-                if match:
-                    self.labels.append(1)  # Abnormal
-                    newline = ptn.PTN_ABN_LABEL.sub('', line, count=1)
-                else:
-                    self.labels.append(0)  # Normal
-                    newline = line
-
-                # Label is removed
-                norm_logs.append(newline)
-            except Exception:  # pylint: disable=broad-except
-                pass
-
         # Overwrite the old norm data with contents that labels removed
-        self._normlogs = norm_logs
+        self._normlogs = list(self.iter_postnorm(self._normlogs, labels, segment))
 
-        # Save norm data and abnormal label vector to files per config
+        # Save norm data and side info to files per config
         if GC.conf['general']['intmdt'] or not GC.conf['general']['aim']:
             with open(self.fzip['norm'], 'w+', encoding='utf-8') as fnorm:
                 fnorm.writelines(self._normlogs)
+            self.save_postnorm_info(labels, segment)
+
+    def save_postnorm_info(self, labels: bool, segment: str):
+        """ Save the labels and segment info extracted from norm data """
+        if labels and self.context in ['LOGLIZER', 'DEEPLOG']:
+            ah.save_vec(self.fzip['labels'], self._labels, ah.DTYPE_LABEL)
+        if segment == 'deeplog':
+            ah.save_vec(self.fzip['segdl'], self._segdl, ah.DTYPE_SEGDL)
+        elif segment == 'loglab':
+            ah.save_vec(self.fzip['segll'], self._segll, ah.DTYPE_SEGLL)
+
+    def iter_postnorm(self, normlogs: Iterable[str], labels: bool = False,
+                      segment: str = '') -> Iterator[str]:
+        """
+        The fused stage of extract_labels, segment_deeplog and
+        segment_loglab. Each norm log is scanned once, the abnormal label
+        is removed first, then the session or class label. The label
+        vector and segment info are updated as it goes.
+
+        Parameters
+        ----------
+        normlogs : the norm logs
+        labels   : extract the abnormal labels
+        segment  : 'deeplog' or 'loglab' to do the segmentation, or empty
+        """
+        offset: int = self._log_head_offset
+        seg_start: int = 0
+        classname_last: str = ''
+        idx: int = -1
+
+        for idx, line in enumerate(normlogs):
+            if labels:
+                if ptn.PTN_ABN_LABEL.search(line, offset, offset+dh.ABN_LABEL_LENGTH):
+                    self._labels.append(1)  # Abnormal
+                    line = ptn.PTN_ABN_LABEL.sub('', line, count=1)
+                else:
+                    self._labels.append(0)  # Normal
 
-            if self.context in ['LOGLIZER', 'DEEPLOG']:
-                with open(self.fzip['labels'], 'wb') as fout:
-                    pickle.dump(self._labels, fout)
+            if segment == 'deeplog':
+                match = ptn.PTN_SEG_LABEL_1.search(line, offset,
+                                                   offset+dh.SEG_LABEL_LENGTH)
+                if match:
+                    # The session label might be added twice, see the
+                    # segment_deeplog()
+                    line = ptn.PTN_SEG_LABEL_1.sub('', line, count=2)
+                    if idx != 0:
+                        self._segdl.append(idx - seg_start)
+                        seg_start = idx
+            elif segment == 'loglab':
+                match = ptn.PTN_SEG_LABEL_2.search(line, offset,
+                                                   offset+dh.CLASS_LABEL_LENGTH)
+                if idx == 0 and not match:
+                    print("Something is wrong with the monolith file, exit!")
+                    sys.exit(1)
+                elif match:
+                    line = ptn.PTN_SEG_LABEL_2.sub('', line, count=1)
+                    if idx != 0:
+                        self._segll.append((idx - seg_start, classname_last))
+                        seg_start = idx
+                    classname_last = match.group(0).strip()
+
+            # Labels are removed
+            yield line
+
+        # The last session / sample info
+        if segment == 'deeplog':
+            self._segdl.append(idx + 1 - seg_start)
+        elif segment == 'loglab':
+            self._segll.append((idx + 1 - seg_start, classname_last))
 
     def cat_files_lst(self, raw_dir: str, file_names: List[str]):
         """
@@ -557,19 +988,12 @@ class PreprocessBase(ABC):
         monolith. Based on the config settings, monolith file is either
         data/cooked/train.txt or data/cooked/test.txt.
         """
-        raw_in_lst: List[str] = []
-        self._rawlogs = []
+        sources: List[Tuple[str, str]] = []
 
         for fname in file_names:
-            raw_in_lst.append(os.path.join(raw_dir, fname))
-        for rawf in raw_in_lst:
-            with open(rawf, 'r', encoding='utf-8-sig') as rawin:
-                self._rawlogs += rawin.readlines()
-            # Make sure preceding file has line feed at EOF
-            self.add_line_feed(self._rawlogs)
-
-        # Conditionally save the rawlogs to train.txt or test.txt.
-        self.cond_save_strings(self.fzip['raw'], self._rawlogs)
+            sources.append((os.path.join(raw_dir, fname), ''))
+
+        self.cat_files(sources)
 
     def cat_files_dir(self, raw_dir: str):
         """
@@ -578,22 +1002,16 @@ class PreprocessBase(ABC):
         either data/cooked/train.txt or data/cooked/test.txt based on
         the config settings.
         """
-        self._rawlogs = []
+        sources: List[Tuple[str, str]] = []
 
         for dirpath, _, files in sorted(os.walk(raw_dir, topdown=True)):
             # print(f'Found directory: {dirpath}')
             for filename in files:
                 if filename in dh.SKIP_FILE_LIST:
                     continue
-                rawf = os.path.join(dirpath, filename)
-                # print(rawf)
-                with open(rawf, 'r', encoding='utf-8-sig') as rawin:
-                    self._rawlogs += rawin.readlines()
-                # Make sure preceding file has line feed at EOF
-                self.add_line_feed(self._rawlogs)
-
-        # Conditionally save the rawlogs to train.txt or test.txt.
-        self.cond_save_strings(self.fzip['raw'], self._rawlogs)
+                sources.append((os.path.join(dirpath, filename), ''))
+
+        self.cat_files(sources)
 
     def cat_files_deeplog(self, raw_dir: str):
         """
@@ -602,17 +1020,16 @@ class PreprocessBase(ABC):
         considering session labels. Monolith is either the data/cooked/
         train.txt or data/cooked/test.txt based on the config settings.
         """
-        self._rawlogs = []
+        sources: List[Tuple[str, str]] = []
 
         for dirpath, _, files in sorted(os.walk(raw_dir, topdown=True)):
             # print(f'Found directory: {dirpath}')
             for filename in files:
                 if filename in dh.SKIP_FILE_LIST:
                     continue
-                self.cat_segment(dirpath, filename, dh.SESSION_LABEL, self._rawlogs)
+                sources.append((os.path.join(dirpath, filename), dh.SESSION_LABEL))
 
-        # Conditionally save the rawlogs to train.txt or test.txt.
-        self.cond_save_strings(self.fzip['raw'], self._rawlogs)
+        self.cat_files(sources)
 
     def cat_files_loglab(self):
         """
@@ -620,7 +1037,15 @@ class PreprocessBase(ABC):
         monolith. Extract class names. This is used for Loglab training.
         Monolith is data/train.txt
         """
-        self._rawlogs = []
+        self.cat_files(self.loglab_sources())
+
+    @staticmethod
+    def loglab_sources() -> List[Tuple[str, str]]:
+        """
+        The Loglab sample files along with class labels 'cxxx ' in the
+        order of concatenation.
+        """
+        sources: List[Tuple[str, str]] = []
 
         loglab_dir = os.path.join(dh.RAW_DATA, 'loglab')
         # Note: name the class folder as 'cxxx', and the training log
@@ -637,32 +1062,68 @@ class PreprocessBase(ABC):
             # Sort the files per the file name string[-7:-4], aka. the 3
             # digits num part.
             for filename in sorted(files, key=lambda x:x[-7:-4]):
-                self.cat_segment(dirpath, filename, ''.join([classname, ' ']), self._rawlogs)
+                sources.append((os.path.join(dirpath, filename), ''.join([classname, ' '])))
 
-        # Conditionally save the rawlogs to train.txt.
-        self.cond_save_strings(self.fzip['raw'], self._rawlogs)
+        return sources
+
+    def cat_files(self, sources: List[Tuple[str, str]]):
+        """
+        Cat the raw log files into a monolith in order. The sources are
+        tuples of raw file path and segment label (empty for none). The
+        raw files are cooked via the cache under data/cooked/LOG_TYPE/,
+        so only new or changed ones are read again. See Catcache. Then
+        the monolith is assembled by streaming the cooked pieces.
+        """
+        catcache = Catcache(dh.CAT_CACHE, self.num_workers)
+        pieces = catcache.pieces(sources, self.cook_raw_file)
+        print(f"Concatenated {len(pieces)} raw files, {catcache.num_hits} from cache.")
+
+        # Release the old raw file before it is replaced
+        self.close_raw_logs()
+        if GC.conf['general']['intmdt'] or not GC.conf['general']['aim']:
+            # Save the monolith to train.txt or test.txt and map it. Write
+            # to a new file in case the old one is still mapped.
+            with open(self.fzip['raw'] + '.tmp', 'wb') as fout:
+                for piece in pieces:
+                    with open(piece, 'rb') as fin:
+                        shutil.copyfileobj(fin, fout)
+            os.replace(self.fzip['raw'] + '.tmp', self.fzip['raw'])
+            self._rawlogs = Rawfile(self.fzip['raw'])
+        else:
+            self._rawlogs = []
+            for piece in pieces:
+                with open(piece, 'r', encoding='utf-8') as fin:
+                    self._rawlogs += fin.readlines()
+
+    def cook_raw_file(self, rawf: str, seglabel: str) -> List[str]:
+        """
+        Read a raw log file for concatenation. Insert the segment label
+        to the start line if the label is not empty.
+        """
+        with open(rawf, 'r', encoding='utf-8-sig') as rawin:
+            lines = rawin.readlines()
+        if not lines:
+            return lines
+
+        if seglabel:
+            match_ts = self.ptn_main_ts.match(lines[0])
+            if match_ts:
+                cur_line_ts = match_ts.group(0)
+                newline = self.ptn_main_ts.sub('', lines[0], count=1)
+                lines[0] = ''.join([cur_line_ts, seglabel, newline])
+            else:
+                print("Error: The timestamp is wrong!")
+
+        # Make sure the file has line feed at EOF
+        self.add_line_feed(lines)
+        return lines
 
     def cat_segment(self, dpath: str, fname: str, seglabel: str, mono: List[str]):
         """
         Cat files and insert segment labels to mark the original file
         boundary.
         """
-        rawf = os.path.join(dpath, fname)
-        # print(rawf)
-        with open(rawf, 'r', encoding='utf-8-sig') as rawin:
-            for idx, line in enumerate(rawin):
-                # Insert segment label to the start line of each file
-                if idx == 0:
-                    match_ts = self.ptn_main_ts.match(line)
-                    if match_ts:
-                        cur_line_ts = match_ts.group(0)
-                        newline = self.ptn_main_ts.sub('', line, count=1)
-                        line = ''.join([cur_line_ts, seglabel, newline])
-                    else:
-                        print("Error: The timestamp is wrong!")
-                mono.append(line)
-        # Make sure preceding file has line feed at EOF
-        self.add_line_feed(mono)
+        mono += self.cook_raw_file(os.path.join(dpath, fname), seglabel)
 
     @staticmethod
     def add_line_feed(strlns: List[str]):
@@ -694,41 +1155,14 @@ class PreprocessBase(ABC):
 
         The segment info format: [segment_size, ...]
         """
-        norm_logs: List[str] = []
-        session_start: int = 0
-
-        if not GC.conf['general']['aim']:
-            with open(self.fzip['norm'], 'r', encoding='utf-8') as fnorm:
-                self._normlogs = fnorm.readlines()
-
-        for idx, line in enumerate(self._normlogs):
-            match = ptn.PTN_SEG_LABEL_1.search(line, self._log_head_offset,
-                    self._log_head_offset+dh.SEG_LABEL_LENGTH)
-            if match:
-                newline = ptn.PTN_SEG_LABEL_1.sub('', line, count=2)
-                if idx != 0:
-                    self._segdl.append(idx - session_start)
-                    session_start = idx
-            else:
-                newline = line
-
-            # Session label is removed
-            norm_logs.append(newline)
-
-        # The last session size
-        self._segdl.append(len(self._normlogs) - session_start)
-        # print(self._segdl)
-
-        # Overwrite the old norm data
-        self._normlogs = norm_logs
-
-        # Conditionally save data to files per config file
-        if GC.conf['general']['intmdt'] or not GC.conf['general']['aim']:
-            with open(self.fzip['segdl'], 'wb') as fout:
-                pickle.dump(self._segdl, fout)
+        self.postprocess_norm(segment='deeplog')
 
-            with open(self.fzip['norm'], 'w+', encoding='utf-8') as fout:
-                fout.writelines(self._normlogs)
+    def iter_segment_deeplog(self, normlogs: Iterable[str]) -> Iterator[str]:
+        """
+        The stage of segment_deeplog. Consume the norm logs and yield them
+        with session labels removed. The segment info is updated as it goes.
+        """
+        return self.iter_postnorm(normlogs, segment='deeplog')
 
     def segment_loglab(self):
         """
@@ -741,47 +1175,78 @@ class PreprocessBase(ABC):
         sample_size is int type and unit is log, aka. one line in norm.
         sample_class is str type and is int after removing heading 'c'.
         """
-        norm_logs: List[str] = []
-        sample_start: int = 0
+        self.postprocess_norm(segment='loglab')
 
-        if not GC.conf['general']['aim']:
-            with open(self.fzip['norm'], 'r', encoding='utf-8') as fnorm:
-                self._normlogs = fnorm.readlines()
-
-        for idx, line in enumerate(self._normlogs):
-            match = ptn.PTN_SEG_LABEL_2.search(line, self._log_head_offset,
-                    self._log_head_offset+dh.CLASS_LABEL_LENGTH)
-            if idx == 0 and not match:
-                print("Something is wrong with the monolith file, exit!")
-                sys.exit(1)
-            elif match:
-                classname = match.group(0).strip()
-                newline = ptn.PTN_SEG_LABEL_2.sub('', line, count=1)
-                norm_logs.append(newline)
-                if idx == 0:
-                    classname_last = classname
-                    continue
-                self._segll.append((idx - sample_start, classname_last))
-                sample_start = idx
-                classname_last = classname
-            else:
-                norm_logs.append(line)
-
-        # The last segment/sample info
-        self._segll.append((len(self._normlogs) - sample_start, classname_last))
-        # print(self._segll)
+    def preprocess_loglab(self):
+        """
+        The cat_files_loglab(), preprocess() and segment_loglab() for the
+        Loglab training, but via the per-file artifact store of samples
+        under data/train/LOG_TYPE/. Only the new or changed samples are
+        preprocessed, and the others are loaded from the store. See the
+        Samplestore. It falls back to the monolith if the preprocess of
+        a sample depends on the sample ahead of it.
+        """
+        self._get_timestamp_info()
+        store = Samplestore(dh.LOGLAB_STORE, self.num_workers,
+                            salt=str(self._log_head_offset))
+        pieces = store.pieces(self.loglab_sources(), self.cook_loglab_sample)
+        print(f"Loaded {len(pieces)} loglab samples, {store.num_hits} from store.")
+        samples = [store.read_piece(piece) for piece in pieces]
+
+        if not samples or not all(sample.head_ok for sample in samples[1:]) \
+            or not all(sample.tail_ok for sample in samples[:-1]):
+            print("Samples are not independent, preprocess the monolith instead.")
+            self.cat_files_loglab()
+            self.preprocess(segment='loglab')
+            return
 
-        # Overwrite the old norm data
-        self._normlogs = norm_logs
+        self._normlogs = []
+        self._segll = []
+        for sample in samples:
+            self._normlogs += sample.normlogs
+            self._segll.append((len(sample.normlogs), sample.classname))
 
         # Conditionally save data to files per config file
         if GC.conf['general']['intmdt'] or not GC.conf['general']['aim']:
-            with open(self.fzip['segll'], 'wb') as fout:
-                pickle.dump(self._segll, fout)
+            ah.save_vec(self.fzip['segll'], self._segll, ah.DTYPE_SEGLL)
 
             with open(self.fzip['norm'], 'w+', encoding='utf-8') as fout:
                 fout.writelines(self._normlogs)
 
+    def cook_loglab_sample(self, rawf: str, seglabel: str) -> Sample:
+        """
+        Preprocess a Loglab sample file alone as it is at the head of the
+        monolith. Check if it is preprocessed the same in the middle of
+        the monolith, i.e. its first line is a plain primary one that is
+        also the first norm log and the only one with the class label,
+        and its end state of preprocess_new is the initial one.
+        """
+        rawlogs = self.cook_raw_file(rawf, seglabel)
+        stat = self.new_state()
+        new_pairs = list(self.iter_new(rawlogs, stat=stat))
+        if not new_pairs:
+            return Sample([], seglabel.strip(), False, False)
+
+        normlogs = [normline for _, normline in self.iter_norm(new_pairs)]
+        label_idx = [idx for idx, line in enumerate(normlogs)
+                     if ptn.PTN_SEG_LABEL_2.search(line, self._log_head_offset,
+                        self._log_head_offset+dh.CLASS_LABEL_LENGTH)]
+        if label_idx:
+            normlogs[0] = ptn.PTN_SEG_LABEL_2.sub('', normlogs[0], count=1)
+
+        first_new = self.ptn_main_ts.sub('', new_pairs[0][1], count=1)
+        head_ok = self.is_safe_boundary(rawlogs[0]) and label_idx == [0] \
+            and not ptn.PTN_NESTED_LINE.match(first_new)
+        tail_ok = self.carried_state(stat) == self.carried_state(self.new_state())
+        return Sample(normlogs, seglabel.strip(), head_ok, tail_ok)
+
+    def iter_segment_loglab(self, normlogs: Iterable[str]) -> Iterator[str]:
+        """
+        The stage of segment_loglab. Consume the norm logs and yield them
+        with class labels removed. The segment info is updated as it goes.
+        """
+        return self.iter_postnorm(normlogs, segment='loglab')
+
     def exceptions_tmplt(self):
         """
         Do some exceptional prework for template update. Overwrite it w/
@@ -799,7 +1264,9 @@ class PreprocessBase(ABC):
         # Make sure preceding file has line feed at EOF
         self.add_line_feed(rawlogs)
 
-        self._rawlogs = rawlogs + self._rawlogs
+        rawlogs += list(self._rawlogs)
+        self.close_raw_logs()
+        self._rawlogs = rawlogs
 
         # Conditionally save the rawlogs to file per config.
         self.cond_save_strings(self.fzip['raw'], self._rawlogs)
@@ -832,3 +1299,30 @@ class PreprocessBase(ABC):
     @abstractmethod
     def match_session_label(self, line: str):
         """ Match session label for DeepLog """
+
+
+# The preprocess object of each worker process for parallel preprocess
+_CHUNK_SEED = None
+
+
+def _init_chunk_worker(ppobj):
+    """ Keep the preprocess object in worker """
+    global _CHUNK_SEED  # pylint: disable=global-statement
+    # The worker gets the raw logs in chunks, no need of the whole file
+    ppobj.close_raw_logs()
+    _CHUNK_SEED = ppobj
+
+
+def _preprocess_chunk(chunk):
+    """
+    Preprocess a chunk of raw logs with the initial state in worker.
+    Return the new logs along with raw line indices, and the state at
+    the end of chunk.
+    """
+    start, lines = chunk
+    stat = _CHUNK_SEED.new_state()
+    chunk_pairs = list(_CHUNK_SEED.iter_new(lines, start=start, stat=stat))
+    # The chunk of Rawfile maps the file again in worker
+    if isinstance(lines, Rawfile):
+        lines.close()
+    return chunk_pairs, stat
@@ -0,0 +1,141 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Memory-mapped raw log file that is decoded line by line lazily.
+"""
+import os
+import mmap
+import codecs
+from typing import Iterator, Union, Callable, Optional
+import numpy as np
+
+
+__all__ = ["Rawfile"]
+
+
+class Rawfile():
+    """
+    The raw log file mapped in memory as a read-only sequence of lines.
+    Only the line offsets are kept, and a line is decoded when it is
+    accessed. It reads the same lines as the text file opened with the
+    utf-8-sig codec, i.e. the BOM is skipped, and the line breaks LF,
+    CRLF and CR are all translated to LF.
+
+    The slice of it is a view of the same mapping. Pickling it keeps the
+    file path and the offsets only, so it is cheap to send to the worker
+    processes, where the file is mapped again.
+
+    Attributes
+    ----------
+    filepath : the path of raw log file
+    starts : start offset of each line in the file
+    ends : end offset of each line, excluding the line break
+    """
+    # Num of bytes scanned at a time for the line breaks
+    SCAN_SIZE = 1 << 26
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._open()
+        self.starts, self.ends = self._scan_lines()
+
+    def _open(self):
+        """ Map the file in memory """
+        self._file = open(self.filepath, 'rb')  # pylint: disable=consider-using-with
+        if os.fstat(self._file.fileno()).st_size:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # Empty file cannot be mapped
+            self._mm = b''
+        self._size = len(self._mm)
+        self._owner = True
+
+    def _scan_lines(self):
+        """ Get the offsets of lines per the positions of line breaks """
+        arr = np.frombuffer(self._mm, dtype=np.uint8)
+        head = len(codecs.BOM_UTF8) if self._mm[0:3] == codecs.BOM_UTF8 else 0
+
+        # Positions of CR and LF, scanned in blocks to bound the memory
+        breaks = [i + np.flatnonzero((arr[i:i+self.SCAN_SIZE] == 10)
+                                     | (arr[i:i+self.SCAN_SIZE] == 13))
+                  for i in range(head, self._size, self.SCAN_SIZE)]
+        breaks = np.concatenate(breaks) if breaks else np.empty(0, dtype=np.int64)
+
+        # The LF of CRLF is a part of the line break started by CR
+        is_crlf_tail = (arr[breaks] == 10) & (breaks > head)
+        is_crlf_tail[is_crlf_tail] = arr[breaks[is_crlf_tail]-1] == 13
+        ends = breaks[~is_crlf_tail].astype(np.int64)
+
+        # The next line starts behind the line break
+        is_crlf = arr[ends] == 13
+        is_crlf[is_crlf] = ends[is_crlf] + 1 < self._size
+        is_crlf[is_crlf] = arr[ends[is_crlf]+1] == 10
+        starts = np.concatenate(([head], ends + 1 + is_crlf)).astype(np.int64)
+
+        # The last line has no line break
+        if starts[-1] < self._size:
+            ends = np.append(ends, self._size)
+        else:
+            starts = starts[:-1]
+        return starts, ends
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[str, 'Rawfile']:
+        if isinstance(idx, slice):
+            view = Rawfile.__new__(Rawfile)
+            view.__dict__.update(self.__dict__)
+            view.starts, view.ends = self.starts[idx], self.ends[idx]
+            view._owner = False  # pylint: disable=protected-access
+            return view
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('Rawfile index out of range')
+        return self.line(idx)
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self)):
+            yield self.line(idx)
+
+    def __getstate__(self):
+        return {'filepath': self.filepath, 'starts': self.starts, 'ends': self.ends}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def raw(self, idx: int) -> bytes:
+        """ The bytes of line with the line break translated to LF """
+        start, end = int(self.starts[idx]), int(self.ends[idx])
+        if end == self._size:
+            return self._mm[start:end]
+        if self._mm[end] == 10:
+            return self._mm[start:end+1]
+        return self._mm[start:end] + b'\n'
+
+    def line(self, idx: int) -> str:
+        """ The decoded line """
+        return self.raw(idx).decode('utf-8')
+
+    def iter_lazy(self, skip: Optional[Callable[[bytes], bool]] = None) \
+        -> Iterator[Optional[str]]:
+        """
+        Iterate the lines and decode only the ones that are not skipped
+        per the check on the bytes. Yield None for the skipped line.
+        """
+        for idx in range(len(self)):
+            line = self.raw(idx)
+            yield None if skip is not None and skip(line) else line.decode('utf-8')
+
+    def close(self):
+        """ Unmap and close the file """
+        if self._owner:
+            if isinstance(self._mm, mmap.mmap):
+                self._mm.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,77 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Per-file artifact store of preprocessed Loglab samples.
+"""
+import mmap
+import struct
+from typing import List, NamedTuple
+import numpy as np
+from .catcache import Catcache
+
+
+__all__ = ["Sample", "Samplestore"]
+
+
+class Sample(NamedTuple):
+    """
+    The preprocessed sample file of Loglab.
+
+    Attributes
+    ----------
+    normlogs : the norm logs with the class label removed
+    classname : the class name 'cxxx' of the sample
+    head_ok : the sample is preprocessed the same in the monolith if it
+              is preceded by another one
+    tail_ok : the sample leaves the initial state of preprocess_new to
+              the next one in the monolith
+    """
+    normlogs: List[str]
+    classname: str
+    head_ok: bool
+    tail_ok: bool
+
+
+class Samplestore(Catcache):
+    """
+    The store of preprocessed Loglab samples, one artifact per sample
+    file. The artifact is reused until the sample file changes, see the
+    Catcache. It is a compact binary file rather than pickle. Layout:
+    header, then the end offsets of the norm logs, then the norm logs in
+    utf-8. The header has the magic, the version, the flags, the num of
+    norm logs and the class name.
+    """
+    PIECE_EXT = '.smp'
+    MAGIC = b'LLSP'
+    VERSION = 1
+    HEADER = '<4sHHI8s'
+    FLAG_HEAD_OK = 0x1
+    FLAG_TAIL_OK = 0x2
+
+    @classmethod
+    def write_piece(cls, piece: str, sample: Sample):
+        """ Write the sample to the artifact file """
+        blobs = [line.encode('utf-8') for line in sample.normlogs]
+        ends = np.cumsum([len(blob) for blob in blobs], dtype=np.uint64)
+        flags = cls.FLAG_HEAD_OK * sample.head_ok | cls.FLAG_TAIL_OK * sample.tail_ok
+        with open(piece, 'wb') as fout:
+            fout.write(struct.pack(cls.HEADER, cls.MAGIC, cls.VERSION, flags,
+                                   len(blobs), sample.classname.encode('utf-8')))
+            fout.write(ends.astype('<u8').tobytes())
+            fout.write(b''.join(blobs))
+
+    @classmethod
+    def read_piece(cls, piece: str) -> Sample:
+        """ Read the sample from the artifact file via memory map """
+        with open(piece, 'rb') as fin, \
+            mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mmf:
+            magic, version, flags, num, classname \
+                = struct.unpack_from(cls.HEADER, mmf)
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise ValueError(f"Not a sample artifact of version {cls.VERSION}: {piece}")
+            head = struct.calcsize(cls.HEADER)
+            ends = np.frombuffer(mmf, dtype='<u8', count=num, offset=head).tolist()
+            base = head + 8 * num
+            starts = [0] + ends[:-1]
+            normlogs = [mmf[base+start:base+end].decode('utf-8')
+                        for start, end in zip(starts, ends)]
+        return Sample(normlogs, classname.rstrip(b'\0').decode('utf-8'),
+                      bool(flags & cls.FLAG_HEAD_OK), bool(flags & cls.FLAG_TAIL_OK))
@@ -81,11 +81,9 @@ def cli_deeplog_train(all_para, debug):
     # Concatenate the logs under data/raw/LOG_TYPE/normal
     ppobj.cat_files_deeplog(os.path.join(dh.RAW_DATA, 'normal'))
 
-    # Process the raw data and generate norm data
-    ppobj.preprocess()
-
-    # Extract segment info and remove them from norm data
-    ppobj.segment_deeplog()
+    # Process the raw data and generate norm data. Extract segment info
+    # and remove them from norm data.
+    ppobj.preprocess(segment='deeplog')
 
     # Parse the norm data
     psobj = Parser(ppobj.normlogs)
@@ -154,15 +152,10 @@ def cli_deeplog_validate(all_para, debug, src):
         # Load existing test.txt for validation
         ppobj.load_raw_logs()
 
-    # Process the raw data and generate norm data
-    ppobj.preprocess()
-
-    # Remove the abnormal labels from norm data if any exist. And then
-    # extract segment info. Do NOT inverse them.
-    ppobj.extract_labels()
-
-    # Extract segment info and remove them from norm data
-    ppobj.segment_deeplog()
+    # Process the raw data and generate norm data. Remove the abnormal
+    # labels from norm data if any exist, and then extract segment info
+    # in the same pass. The order is kept by preprocess_norm().
+    ppobj.preprocess(labels=True, segment='deeplog')
 
     # Parse the norm data
     psobj = Parser(ppobj.normlogs)
@@ -233,11 +226,9 @@ def cli_deeplog_predict(all_para, learn_ts, debug):
         ps_ts_obj.parse()
         ps_ts_obj.det_timestamp()
 
-    # Process the raw data and generate norm data
-    ppobj.preprocess()
-
-    # Extract segment info and remove them from norm data
-    ppobj.segment_deeplog()
+    # Process the raw data and generate norm data. Extract segment info
+    # and remove them from norm data.
+    ppobj.preprocess(segment='deeplog')
 
     # Parse the norm data
     psobj = Parser(ppobj.normlogs)
@@ -85,14 +85,10 @@ def cli_loglab_train(model, mykfold, debug):
 
     ppobj = pp.Preprocess()
 
-    # Concatenate the logs under data/raw/LOG_TYPE/loglab
-    ppobj.cat_files_loglab()
-
-    # Process the raw data and generate norm data
-    ppobj.preprocess()
-
-    # Extract class info and remove them from norm data
-    ppobj.segment_loglab()
+    # Concatenate the logs under data/raw/LOG_TYPE/loglab, process them
+    # to generate norm data, and extract class info and remove them from
+    # norm data. The preprocessed samples are reused from the store.
+    ppobj.preprocess_loglab()
 
     # Parse the norm data
     psobj = Parser(ppobj.normlogs)
@@ -57,11 +57,9 @@ def train_general(is_all, filelst, debug, sel = 'stc'):
 
     ppobj.cat_files_lst(os.path.join(dh.RAW_DATA, 'labeled'), filelst)
 
-    # Process the raw data and generate norm data
-    ppobj.preprocess()
-
-    # Extract label info and remove them from norm data
-    ppobj.extract_labels()
+    # Process the raw data and generate norm data. Extract label info
+    # and remove them from norm data.
+    ppobj.preprocess(labels=True)
 
     # Parse the norm data
     psobj = Parser(ppobj.normlogs)
@@ -209,11 +207,9 @@ def cli_loglizer_validate(model, debug, src):
         # Load existing test.txt for validation
         ppobj.load_raw_logs()
 
-    # Process the raw data and generate norm data
-    ppobj.preprocess()
-
-    # Remove the abnormal labels from norm data if any exist
-    ppobj.extract_labels()
+    # Process the raw data and generate norm data. Remove the abnormal
+    # labels from norm data if any exist.
+    ppobj.preprocess(labels=True)
 
     # Parse the norm data
     psobj = Parser(ppobj.normlogs)
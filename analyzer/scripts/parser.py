@@ -88,11 +88,9 @@ def cli_updt_tmplt(src, training, overwrite, current, debug):
         # Load existing tran.txt or test.txt
         ppobj.load_raw_logs()
 
-    # Process the raw data and generate norm data
-    ppobj.preprocess()
-
-    # Remove the abnormal labels from norm data if any exist.
-    ppobj.extract_labels()
+    # Process the raw data and generate norm data. Remove the abnormal
+    # labels from norm data if any exist.
+    ppobj.preprocess(labels=True)
 
     # Parsing using the norm data
     psobj = Parser(ppobj.normlogs, dbg=debug)
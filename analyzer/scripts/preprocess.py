@@ -126,8 +126,8 @@ def cli_gen_norm(src, training, overwrite, current):
 
     # Sync the config update in memory to file. Really necessary?
     # GC.write()
-    ppobj.preprocess_norm()
-    # Remove the abnormal labels from norm dataset if any exist.
-    ppobj.extract_labels()
+    # Remove the abnormal labels from norm dataset if any exist, in the
+    # same pass of normalization.
+    ppobj.preprocess_norm(labels=True)
 
     log.info("The norm log dataset is generated.")
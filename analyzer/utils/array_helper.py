@@ -0,0 +1,60 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Utils to save / load the side info vectors as typed arrays """
+import os
+import pickle
+from typing import List, Tuple
+import numpy as np
+
+
+__all__ = [
+    "DTYPE_LINE",
+    "DTYPE_LABEL",
+    "DTYPE_SEGDL",
+    "DTYPE_SEGLL",
+    "save_vec",
+    "load_vec",
+    "load_segll",
+]
+
+
+# The line index (1 based) in the line mapping tables
+DTYPE_LINE = np.dtype('<i4')
+# The abnormal label, 0 or 1
+DTYPE_LABEL = np.dtype('u1')
+# The session size of DeepLog
+DTYPE_SEGDL = np.dtype('<i4')
+# The sample size and class name 'cxxx' of Loglab
+DTYPE_SEGLL = np.dtype([('size', '<i4'), ('class', 'S8')])
+
+
+def save_vec(filepath: str, vec, dtype: np.dtype):
+    """
+    Save the vector as a typed array in .npy format. No pickle is used.
+    The Loglab segment info, a list of (sample_size, sample_class), is
+    saved as a structured array of DTYPE_SEGLL.
+    """
+    np.save(filepath, np.asarray(vec, dtype=dtype), allow_pickle=False)
+
+
+def load_vec(filepath: str, dtype: np.dtype, mmap: bool = True):
+    """
+    Load the vector saved by save_vec(). The array is memory-mapped by
+    default, so only the accessed part is read. For the compatibility,
+    it reads the pickle file of the same name with .pkl suffix if the
+    .npy file does not exist, and converts it to the typed array.
+    """
+    if os.path.exists(filepath):
+        return np.load(filepath, mmap_mode='r' if mmap else None, allow_pickle=False)
+
+    legacy = os.path.splitext(filepath)[0] + '.pkl'
+    if os.path.exists(legacy):
+        with open(legacy, 'rb') as fin:
+            return np.asarray(pickle.load(fin), dtype=dtype)
+
+    raise FileNotFoundError(f"No such file: {filepath}")
+
+
+def load_segll(filepath: str) -> List[Tuple[int, str]]:
+    """ Load the Loglab segment info as [(sample_size, sample_class), ...] """
+    segll = load_vec(filepath, DTYPE_SEGLL, mmap=False)
+    return [(int(size), sample_class.decode('utf-8')) for size, sample_class in segll]
@@ -15,6 +15,7 @@ __all__ = [
     "TMP_DATA",
     "LOG_TYPE",
     "TEMPLATE_LIB",
+    "TEMPLATE_TREE",
     "SKIP_FILE_LIST",
     "get_files_io",
     "get_data_type",
@@ -45,6 +46,12 @@ TRAIN_DATA = os.path.join(ANALYZER_DATA, 'train', LOG_TYPE)
 TEST_DATA = os.path.join(ANALYZER_DATA, 'test', LOG_TYPE)
 TMP_DATA = os.path.join(ANALYZER_DATA, 'tmp')
 TEMPLATE_LIB = os.path.join(PERSIST_DATA, 'template_lib.csv')
+# Binary snapshot of the Drain tree built from the template library
+TEMPLATE_TREE = os.path.join(PERSIST_DATA, 'template_lib.tree')
+# Cache of cooked raw log files for concatenation
+CAT_CACHE = os.path.join(COOKED_DATA, 'cache')
+# Store of preprocessed Loglab sample files
+LOGLAB_STORE = os.path.join(TRAIN_DATA, 'loglab_store')
 # Vocabularies
 VOCAB_LOGLAB = os.path.join(PERSIST_DATA, 'vocab_loglab.npy')
 VOCAB_DEEPLOG = os.path.join(PERSIST_DATA, 'vocab_deeplog.npy')
@@ -84,9 +91,9 @@ def get_files_io():
             'new': os.path.join(COOKED_DATA, 'train_new.txt'),
             'norm': os.path.join(COOKED_DATA, 'train_norm.txt'),
             'manu': os.path.join(RAW_DATA, 'others', 'temp_updt_manu.txt'),
-            'labels': os.path.join(TRAIN_DATA, 'train_norm.txt_labels.pkl'),
-            'segll': os.path.join(TRAIN_DATA, 'train_norm.txt_seginf_loglab.pkl'),
-            'segdl': os.path.join(TRAIN_DATA, 'train_norm.txt_seginf_deeplog.pkl'),
+            'labels': os.path.join(TRAIN_DATA, 'train_norm.txt_labels.npy'),
+            'segll': os.path.join(TRAIN_DATA, 'train_norm.txt_seginf_loglab.npy'),
+            'segdl': os.path.join(TRAIN_DATA, 'train_norm.txt_seginf_deeplog.npy'),
             'struct': os.path.join(TRAIN_DATA, 'train_norm.txt_structured.csv'),
             'output': TRAIN_DATA
         }
@@ -95,11 +102,11 @@ def get_files_io():
             'raw': os.path.join(COOKED_DATA, 'test.txt'),
             'new': os.path.join(COOKED_DATA, 'test_new.txt'),
             'norm': os.path.join(COOKED_DATA, 'test_norm.txt'),
-            'labels': os.path.join(TEST_DATA, 'test_norm.txt_labels.pkl'),
-            'segll': os.path.join(TEST_DATA, 'test_norm.txt_seginf_loglab.pkl'),
-            'segdl': os.path.join(TEST_DATA, 'test_norm.txt_seginf_deeplog.pkl'),
-            'map_norm_raw': os.path.join(TEST_DATA, 'map_norm_raw.pkl'),
-            'map_norm_rcv': os.path.join(TEST_DATA, 'map_norm_rcv.pkl'),
+            'labels': os.path.join(TEST_DATA, 'test_norm.txt_labels.npy'),
+            'segll': os.path.join(TEST_DATA, 'test_norm.txt_seginf_loglab.npy'),
+            'segdl': os.path.join(TEST_DATA, 'test_norm.txt_seginf_deeplog.npy'),
+            'map_norm_raw': os.path.join(TEST_DATA, 'map_norm_raw.npy'),
+            'map_norm_rcv': os.path.join(TEST_DATA, 'map_norm_rcv.npy'),
             'norm_rcv': os.path.join(TEST_DATA, 'test_norm_rcv.txt'),
             'struct': os.path.join(TEST_DATA, 'test_norm.txt_structured.csv'),
             'struct_rcv': os.path.join(TEST_DATA, 'test_norm_rcv.txt_structured.csv'),
@@ -1,9 +1,15 @@
 # Licensed under the MIT License - see LICENSE.txt
 """ Miscellaneous regex patterns """
 import re
+try:
+    # Python 3.11+
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse  # pylint: disable=deprecated-module
 
 
 __all__ = [
+    "Rexengine",
     "PTN_LIBC_CTIME",
     "PTN_SNMP_MIB",
     "PTN_MAC_ADDR",
@@ -62,3 +68,150 @@ PTN_IP_V6 = re.compile(
     r'|(?:(?:[0-9A-Fa-f]{1,4}:){,5}[0-9A-Fa-f]{1,4})?::[0-9A-Fa-f]{1,4}'
     r'|(?:(?:[0-9A-Fa-f]{1,4}:){,6}[0-9A-Fa-f]{1,4})?::)(/\d{1,3})?'
 )
+
+
+class Rexengine:
+    """ Engine of a sequential dict of regex substitutions, e.g. the hard
+        parameters of Drain preprocess. Each pattern is compiled along
+        with the trigger chars that any of its matches must contain, so
+        the pattern is skipped right away when the line lacks them. The
+        output is identical to applying every pattern one by one.
+
+        A fused alternation of all patterns does not keep the semantics
+        of the sequential dict, as a later pattern sees the replacement
+        of earlier ones, and it is slower with re as well.
+    """
+    # Max num of chars in an any-of trigger char set
+    MAX_SET_SIZE = 64
+
+    # Max num of trigger chars and trigger char sets of a pattern
+    MAX_TRIGGERS = 3
+
+    # Atom of the \d category in a trigger char set
+    DIGIT = '\\d'
+
+    def __init__(self, rex, prefilter=True, memo_size=100000):
+        """
+        Attributes
+        ----------
+        rules     : list of (pattern, replacement, trigger chars, trigger
+                    char sets). A line must have each trigger char and a
+                    char of each trigger char set to match the pattern.
+        memo_size : max num of memorized results, 0 disables it
+        """
+        self.memo_size = memo_size
+        self._memo = {}
+        self.rules = []
+        for ptn, repl in rex.items():
+            chars, char_sets = [], []
+            if prefilter:
+                chars, char_sets = self.triggers(ptn)
+            self.rules.append((ptn, repl, chars, char_sets))
+
+    def sub(self, line):
+        """ Apply the substitutions to the line in order """
+        rslt = self._memo.get(line)
+        if rslt is None:
+            rslt = line
+            for ptn, repl, chars, char_sets in self.rules:
+                # Skip the pattern if any trigger is absent
+                for char in chars:
+                    if char not in rslt:
+                        break
+                else:
+                    for char_set in char_sets:
+                        if char_set.search(rslt) is None:
+                            break
+                    else:
+                        rslt = ptn.sub(repl, rslt)
+
+            # Logs repeat a lot, so memorize the recent results
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[line] = rslt
+        return rslt
+
+    @classmethod
+    def triggers(cls, ptn):
+        """ Return the trigger chars and compiled trigger char sets """
+        if ptn.flags & re.IGNORECASE:
+            return [], []
+        reqs = cls._seq_reqs(sre_parse.parse(ptn.pattern, ptn.flags))
+        # A superset of another set is implied by the other one
+        reqs = [req for req in reqs if not any(other < req for other in reqs)]
+
+        chars, char_sets = [], []
+        for req in sorted(reqs, key=sorted):
+            if len(req) == 1 and cls.DIGIT not in req:
+                chars.append(next(iter(req)))
+            elif len(char_sets) < cls.MAX_TRIGGERS:
+                atoms = sorted(req - {cls.DIGIT})
+                char_class = ''.join(re.escape(atom) for atom in atoms)
+                if cls.DIGIT in req:
+                    char_class += cls.DIGIT
+                char_sets.append(re.compile('[' + char_class + ']'))
+
+        # Punctuations are more selective than letters and the space
+        chars.sort(key=lambda char: (char.isspace(), char.isalnum()))
+        return chars[0:cls.MAX_TRIGGERS], char_sets
+
+    @classmethod
+    def _seq_reqs(cls, items):
+        """ Requirements of a sequence of regex items """
+        reqs = set()
+        for opcode, arg in items:
+            reqs |= cls._item_reqs(opcode, arg)
+        return reqs
+
+    @classmethod
+    def _item_reqs(cls, opcode, arg):
+        """
+        Requirements of a regex item. Each requirement is a frozenset of
+        atoms, aka. chars or DIGIT, and any match of the item must have
+        at least one of them.
+        """
+        if opcode == sre_parse.LITERAL:
+            return {frozenset([chr(arg)])}
+        if opcode == sre_parse.IN:
+            atoms = cls._char_set(arg)
+            return {atoms} if atoms else set()
+        if opcode == sre_parse.SUBPATTERN:
+            add_flags, sub_items = arg[1], arg[-1]
+            if add_flags & re.IGNORECASE:
+                return set()
+            return cls._seq_reqs(sub_items)
+        if opcode in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+                      getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            min_num, _, sub_items = arg
+            return cls._seq_reqs(sub_items) if min_num >= 1 else set()
+        if opcode == getattr(sre_parse, 'ATOMIC_GROUP', None):
+            return cls._seq_reqs(arg)
+        if opcode == sre_parse.ASSERT:
+            # The chars of a positive lookaround are in the line too
+            return cls._seq_reqs(arg[1])
+        if opcode == sre_parse.BRANCH:
+            branch_reqs = [cls._seq_reqs(branch) for branch in arg[1]]
+            reqs = set.intersection(*branch_reqs)
+            # Each branch has one of its requirements met at least
+            if all(branch_reqs):
+                atoms = frozenset().union(*(min(breqs, key=len) for breqs in branch_reqs))
+                if len(atoms) <= cls.MAX_SET_SIZE:
+                    reqs.add(atoms)
+            return reqs
+        # Zero width or too wide, e.g. AT, ASSERT_NOT, ANY, NOT_LITERAL
+        return set()
+
+    @classmethod
+    def _char_set(cls, items):
+        """ The atoms of a char class, None if it is negated or too wide """
+        atoms = set()
+        for opcode, arg in items:
+            if opcode == sre_parse.LITERAL:
+                atoms.add(chr(arg))
+            elif opcode == sre_parse.RANGE and arg[1] - arg[0] < cls.MAX_SET_SIZE:
+                atoms.update(chr(code) for code in range(arg[0], arg[1]+1))
+            elif opcode == sre_parse.CATEGORY and arg == sre_parse.CATEGORY_DIGIT:
+                atoms.add(cls.DIGIT)
+            else:
+                return None
+        return frozenset(atoms) if len(atoms) <= cls.MAX_SET_SIZE else None
@@ -5,10 +5,10 @@ import re
 from typing import List
 from datetime import datetime
 from importlib import import_module
-import pickle
 import collections
 import pandas as pd
 import analyzer.utils.data_helper as dh
+import analyzer.utils.array_helper as ah
 
 # Load LOG_TYPE dependent helpers
 msc = import_module("analyzer.extensions." + dh.LOG_TYPE + ".misc")
@@ -59,8 +59,7 @@ def find_logs_by_eid(event_id: str, training: str):
         # For prediction, use 1 based line number instead of timestamp
         time_logs = list(range(data_df.shape[0]))
         # Load map file between norm and raw
-        with open(fzip['map_norm_raw'], 'rb') as fin:
-            map_norm_raw = pickle.load(fin)
+        map_norm_raw = ah.load_vec(fzip['map_norm_raw'], ah.DTYPE_LINE)
 
     # Do not iterate dataframe using data_df.iterrows(). It's very slow.
     for time, eid in zip(time_logs, eid_logs):
@@ -0,0 +1,72 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Benchmark of normalizing the multi-line logs to one line
+"""
+import os
+import random
+from importlib import import_module
+import pytest
+
+os.environ.setdefault('ANALYZER_DATA', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data'))
+
+# pylint: disable=wrong-import-position
+from analyzer.config import GlobalConfig as GC
+
+
+# Primary lines of a cm capture, and the nested lines of a table or a
+# block that follow them
+PRIMARY = [
+    'Channel {} is locked at frequency {} Hz\n',
+    'CM-STATUS message sent. Event Type Code: {}; Chan ID: {}\n',
+    'DS profile assignment change. DS Chan ID: {}; Previous Profile: {}\n',
+    'Ranging request retries exhausted; CM-MAC= {}:{}\n',
+]
+NESTED = [
+    '    DCID: {}  Freq: {} Hz\n',
+    '\tPower: {} dBmV  SNR: {} dB\n',
+    '      \n',
+]
+
+
+def synthetic_capture(num, seed=0):
+    """ Generate the new logs of a cm capture with the timestamps, where
+        about one fifth of them are nested lines. Some nested lines have
+        no timestamp, and some lines are blank.
+    """
+    rnd = random.Random(seed)
+    logs = []
+    for idx in range(num):
+        tstamp = f'[20210101-00:{idx//60%60:02d}:{idx%60:02d}.000] '
+        dice = rnd.random()
+        if dice < 0.2 and logs:
+            line = rnd.choice(NESTED).format(rnd.randint(0, 99), rnd.randint(0, 999999))
+            logs.append(line if dice < 0.02 else tstamp + line)
+        elif dice < 0.21:
+            logs.append(tstamp + '\n')
+        else:
+            logs.append(tstamp + rnd.choice(PRIMARY).format(rnd.randint(0, 99),
+                                                             rnd.randint(0, 999999)))
+    return logs
+
+
+@pytest.mark.parametrize('impl', ['iter_norm', 'norm_columnar'])
+def test_bench_norm(benchmark, impl):
+    """ Normalize the synthetic cm capture """
+    GC.read()
+    GC.conf['general']['training'] = True
+    GC.conf['general']['context'] = 'TEMPUPDT'
+    ppobj = import_module('analyzer.extensions.cm.preprocess').Preprocess()
+    newlogs = synthetic_capture(200000)
+    map_new_raw = list(range(1, len(newlogs)+1))
+
+    if impl == 'iter_norm':
+        normlogs = benchmark(lambda: [normline for _, normline
+                                      in ppobj.iter_norm(zip(map_new_raw, newlogs))])
+    else:
+        normlogs = benchmark(lambda: ppobj.norm_columnar(newlogs, map_new_raw)[0])
+
+    # Same output as the line by line one, along with raw line index
+    expected = list(ppobj.iter_norm(zip(map_new_raw, newlogs)))
+    assert normlogs == [normline for _, normline in expected]
+    assert ppobj.norm_columnar(newlogs, map_new_raw)[1].tolist() \
+        == [raw_ln for raw_ln, _ in expected]
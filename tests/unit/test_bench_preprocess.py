@@ -0,0 +1,195 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Benchmark of the preprocess stages on synthetic raw logs
+
+Each stage is timed alone on the synthetic cm and ftp raw logs. The num
+of raw lines is set by the env var ANALYZER_BENCH_LINES (20000 default).
+The lines/s and the peak RSS of the stage are reported in extra_info.
+
+Record a JSON baseline per commit under .benchmarks/ on demand, and
+compare with the earlier ones, e.g.
+    pytest tests/unit/test_bench_preprocess.py --benchmark-autosave
+    pytest tests/unit/test_bench_preprocess.py --benchmark-compare \
+        --benchmark-compare-fail=mean:10%
+With --benchmark-disable, each stage runs once for the checks only.
+"""
+import os
+import random
+from importlib import import_module
+import pytest
+
+os.environ.setdefault('ANALYZER_DATA', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data'))
+
+# pylint: disable=wrong-import-position
+from analyzer.config import GlobalConfig as GC
+
+
+NUM_LINES = int(os.environ.get('ANALYZER_BENCH_LINES', '20000'))
+
+# Log head offset of the standard timestamp
+HEAD_OFFSET = {'cm': 24, 'ftp': 20}
+
+# The stage -> context, training, stages ahead of it, and the logs it
+# consumes
+STAGES = {
+    'preprocess_ts':   ('OLDSCHOOL', False, [], '_rawlogs'),
+    'preprocess_new':  ('TEMPUPDT', True, [], '_rawlogs'),
+    'preprocess_norm': ('TEMPUPDT', True, ['preprocess_new'], '_newlogs'),
+    'extract_labels':  ('LOGLIZER', True, ['preprocess_new', 'preprocess_norm'], '_normlogs'),
+    'segment_deeplog': ('DEEPLOG', True, ['preprocess_new', 'preprocess_norm'], '_normlogs'),
+    'segment_loglab':  ('LOGLAB', True, ['preprocess_new', 'preprocess_norm'], '_normlogs'),
+}
+
+# Primary logs of cm. The BFC timestamp, thread tag and console prompt
+# are cleaned by preprocess.
+CM_PRIMARY = [
+    'Channel {} is locked at frequency {} Hz',
+    'CM-STATUS message sent. Event Type Code: {}; Chan ID: {}',
+    'DS profile assignment change. DS Chan ID: {}; Previous Profile: {}',
+    'Ranging request retries exhausted; CM-MAC= 00:10:18:de:{:02x}:{:02x}',
+    '[{:02d}:00:10 01/01/1970] Lost MDD Timeout;CM-MAC= 00:10:18:de:f1:{:02x}',
+    '[ cmtask{} ] Moving to Downstream Frequency {} Hz',
+    'CM> Received REG-RSP while in REG-HOLD1 state;CM-TLV={}.{}',
+]
+
+# Logs of ftp, after the process id and session id
+FTP_PRIMARY = [
+    'Trace: CControlSocket::SendNextCommand()',
+    'Status: Connecting to 209.51.{}.{}:21...',
+    'Command: RETR file_{}.tar.gz{}',
+    'Response: 226 Transfer complete {} {}',
+    'Status: File transfer successful, transferred {} bytes in {} seconds',
+    'Status: Disconnected from server',
+]
+
+
+def cm_block(rnd, idx):
+    """ A multi-line cm log, a table or a block """
+    dice = rnd.random()
+    if dice < 0.2:
+        # Primary lines concatenated because of no endl
+        return [f'Registration Complete {idx} [00:01:{idx%60:02d} 01/01/1970] '
+                f'Channel {idx%32} is locked at frequency {idx*7} Hz']
+    if dice < 0.4:
+        return ['Active Downstream Channel Diagnostics:', '',
+                '  rx id  dcid    freq, hz  qam  fec   snr, dB   power, dBmV  modulation',
+                '                           plc  prfA',
+                '  -----  ----  ----------  ---  ---  ---------  -----------  ----------'] \
+            + [f'      {rxid}     {rxid+1}   {300000000+rxid*8000000}   y    y'
+               f'          35            3      Qam256' for rxid in range(8)] \
+            + ['* indicates currently configured']
+    if dice < 0.55:
+        return ['Active Upstream Channels:', '',
+                '                    rng     pwr        frequency     symbols   phy  ok tx',
+                ' txid  ucid  dcid   sid     dBmv          MHz          sec    type  data?',
+                ' ----  ----  ----  ------  -----    ---------------  -------  ----  -----',
+                '    0   101     1     0x2      18             9.000  5120000     3      y',
+                '    8   149     1     0x2      18   63.700 - 78.450        0     5      y',
+                f'Dynamic range window {idx}']
+    if dice < 0.7:
+        # Removable blocks
+        return ['Downloading LEAP image', f'LEAP segment {idx}', '  nested junk',
+                '>>>AP dload time 3', '=== Default Router List ===', '  10.0.0.1',
+                f'  10.0.0.{idx%255}', f"Type 'help' or '?' for a list {idx}"]
+    # Nested lines
+    return [f'Sending REG-REQ {idx}', '    UCID: 1', '    DSID: 2 3 4', '\tSF: 5']
+
+
+def synthetic_raws(log_type: str, num: int, seglabel: str = '', seed=0):
+    """ Generate the raw logs with abnormal labels. The samples of about
+        200 lines start with the seglabel, 'segsign: ' or 'cxxx '.
+    """
+    rnd = random.Random(seed)
+    raws = []
+    sample = 0
+    while len(raws) < num:
+        idx = len(raws)
+        if log_type == 'cm':
+            tstamp = f'[20210101-{idx//3600%24:02d}:{idx//60%60:02d}:{idx%60:02d}.000] '
+            if rnd.random() < 0.05:
+                logs = cm_block(rnd, idx)
+            else:
+                logs = [rnd.choice(CM_PRIMARY).format(rnd.randint(0, 23), rnd.randint(0, 255))]
+        else:
+            tstamp = f'2022-06-22 {idx//3600%24:02d}:{idx//60%60:02d}:{idx%60:02d} '
+            logs = [f'10236 {idx%10} ' + rnd.choice(FTP_PRIMARY).format(rnd.randint(0, 255),
+                                                                        rnd.randint(0, 255))]
+
+        label = 'abn: ' if rnd.random() < 0.01 else ''
+        if seglabel and idx >= sample:
+            label += f'c{sample//200%5+1:03d} ' if seglabel == 'class' else seglabel
+            sample += 200
+        raws += [''.join([tstamp, label if not i else '', log, '\n'])
+                 for i, log in enumerate(logs)]
+    return raws
+
+
+def setup_preprocess(log_type: str, stage: str):
+    """ The preprocess object with the logs ready for the stage """
+    context, training, ahead, _ = STAGES[stage]
+    GC.read()
+    GC.conf['general'].update(training=training, metrics=False, context=context,
+                              head_offset=HEAD_OFFSET[log_type], aim=True, intmdt=False)
+    ppobj = import_module('analyzer.extensions.' + log_type + '.preprocess').Preprocess()
+    ppobj.max_line = NUM_LINES
+
+    seglabel = {'segment_deeplog': 'segsign: ', 'segment_loglab': 'class'}.get(stage, '')
+    ppobj._rawlogs = synthetic_raws(log_type, NUM_LINES, seglabel)  # pylint: disable=protected-access
+    for func in ahead:
+        getattr(ppobj, func)()
+    return ppobj
+
+
+def clone_preprocess(tmpl):
+    """ A fresh preprocess object with the logs of the template one """
+    ppobj = type(tmpl)()
+    ppobj.max_line = tmpl.max_line
+    # pylint: disable=protected-access
+    ppobj._log_head_offset = tmpl._log_head_offset
+    for logs in ['_rawlogs', '_newlogs', '_normlogs']:
+        setattr(ppobj, logs, list(getattr(tmpl, logs)))
+    return ppobj
+
+
+def peak_rss(func):
+    """ The peak RSS in MB of running the func once in a child process """
+    if not hasattr(os, 'fork'):
+        return None
+    pid = os.fork()  # pylint: disable=no-member
+    if pid == 0:
+        try:
+            func()
+        finally:
+            os._exit(0)  # pylint: disable=protected-access
+    _, _, rusage = os.wait4(pid, 0)  # pylint: disable=no-member
+    return rusage.ru_maxrss / 1024
+
+
+@pytest.mark.parametrize('stage', list(STAGES))
+@pytest.mark.parametrize('log_type', ['cm', 'ftp'])
+def test_bench_preprocess(benchmark, log_type, stage):
+    """ Time one preprocess stage """
+    tmpl = setup_preprocess(log_type, stage)
+    num = len(getattr(tmpl, STAGES[stage][3]))
+
+    ppobj = benchmark.pedantic(lambda ppobj: getattr(ppobj, stage)() or ppobj,
+                               setup=lambda: ((clone_preprocess(tmpl),), {}), rounds=3)
+
+    # No stats if benchmarking is disabled
+    if benchmark.stats:
+        benchmark.extra_info['lines'] = num
+        benchmark.extra_info['lines_per_sec'] = num / benchmark.stats.stats.mean
+        benchmark.extra_info['peak_rss_mb'] = peak_rss(
+            lambda: getattr(clone_preprocess(tmpl), stage)())
+
+    # The stage does its work on the synthetic features
+    if stage == 'preprocess_new':
+        assert 0 < len(ppobj._newlogs) <= num  # pylint: disable=protected-access
+    else:
+        assert ppobj.normlogs
+    if stage == 'extract_labels':
+        assert 0 < sum(ppobj.labels) < num
+    elif stage == 'segment_deeplog':
+        assert len(ppobj.segdl) > 1
+    elif stage == 'segment_loglab':
+        assert len(ppobj.segll) > 1
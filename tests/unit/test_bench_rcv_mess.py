@@ -0,0 +1,95 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Benchmark of recovering the messed logs caused by multi threads
+"""
+import os
+import random
+from importlib import import_module
+import pandas as pd
+import pytest
+
+os.environ.setdefault('ANALYZER_DATA', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data'))
+
+# pylint: disable=wrong-import-position
+from analyzer.config import GlobalConfig as GC
+import analyzer.parser.parser as parser_mod
+from analyzer.parser import Parser, Tmpltregistry
+
+
+# Templates of the lib. The ones starting with the char in HEADER_CARE
+# of cm can be broken by the logs of other threads.
+TMPLTS = [
+    'Logging event: CM-STATUS message sent, Event Type Code: <*>; Chan ID: <*>',
+    'CM-STATUS message sent. Event Type Code: <*>; Chan ID: <*>',
+    'Lost MDD Timeout;CM-MAC= <*>;CMTS-MAC= <*>;CM-QOS=1.1;CM-VER=3.1;',
+    'Channel <*> is locked at frequency <*> Hz',
+    'DS profile assignment change. DS Chan ID: <*>; Previous Profile: <*>',
+    'Ranging request retries exhausted; CM-MAC= <*>',
+    'MIMO Event MIMO: Stored MIMO=-1 post cfg file MIMO=-1;CM-MAC= <*>',
+    'Received REG-RSP while in REG-HOLD1 state;CM-MAC= <*>',
+]
+
+
+def synthetic_logs(num, seed=0):
+    """ Generate the structured logs where the thread of a log starting
+        with 'L' or 'C' is broken by the log of another thread. The log
+        o1 is split into o1_head + o2 and o1 tail in the next line, or
+        o1_head, o2 and o1 tail in three lines if o2 starts with a new
+        line char. Return the logs and the num of o1_head only lines.
+    """
+    rnd = random.Random(seed)
+    eids = [Tmpltregistry.hash_tmplt(tmplt) for tmplt in TMPLTS]
+    breakable = [tmplt for tmplt in TMPLTS if tmplt[0] in ['L', 'C']]
+    eid_old_logs, temp_logs = [], []
+    num_head = 0
+    while len(temp_logs) < num:
+        dice = rnd.random()
+        if dice < 0.2:
+            o1_tmplt = rnd.choice(breakable)
+            cut = rnd.randint(1, len(o1_tmplt)-1)
+            o2_idx = rnd.randrange(len(TMPLTS))
+            if dice < 0.05:
+                eid_old_logs += ['0', eids[o2_idx], '0']
+                temp_logs += [o1_tmplt[0:cut], TMPLTS[o2_idx], o1_tmplt[cut:]]
+                num_head += 1
+            else:
+                eid_old_logs += ['0', '0']
+                temp_logs += [o1_tmplt[0:cut] + TMPLTS[o2_idx], o1_tmplt[cut:]]
+        else:
+            idx = rnd.randrange(len(TMPLTS))
+            eid_old_logs.append(eids[idx])
+            temp_logs.append(TMPLTS[idx])
+
+    df_raws = pd.DataFrame({'Time': ['[20210101-00:00:00.000] '] * len(temp_logs),
+                            'EventIdOld': eid_old_logs, 'EventTemplate': temp_logs})
+    df_tmplts = pd.DataFrame({'EventIdOld': eids, 'EventId': eids, 'EventTemplate': TMPLTS})
+    return df_raws, df_tmplts, num_head
+
+
+def make_parser(df_raws, df_tmplts):
+    """ Set up a parser with the structured logs """
+    psobj = Parser([], rcv=True)
+    psobj._df_raws = df_raws  # pylint: disable=protected-access
+    psobj._df_tmplts = df_tmplts  # pylint: disable=protected-access
+    psobj._log_head_offset = 24  # pylint: disable=protected-access
+    psobj.map_norm_raw = list(range(1, df_raws.shape[0]+1))
+    return (psobj,), {}
+
+
+@pytest.mark.parametrize('num', [10000, 40000])
+def test_bench_rcv_mess(benchmark, monkeypatch, num):
+    """ Recover the synthetically interleaved logs """
+    GC.read()
+    GC.conf['general']['aim'] = True
+    monkeypatch.setattr(parser_mod, 'msc', import_module('analyzer.extensions.cm.misc'))
+    df_raws, df_tmplts, num_head = synthetic_logs(num)
+
+    psobj = benchmark.pedantic(lambda psobj: psobj.rcv_mess() or psobj,
+                               setup=lambda: make_parser(df_raws, df_tmplts),
+                               rounds=5)
+
+    # Each broken log is recovered to its template, and the o1_head only
+    # lines are dropped from the norm and raw line mapping table.
+    assert set(psobj.norm_rcv) == {'[20210101-00:00:00.000] '+tmplt+'\n' for tmplt in TMPLTS}
+    assert len(psobj.norm_rcv) == df_raws.shape[0] - num_head
+    assert len(psobj.map_norm_raw) == df_raws.shape[0] - num_head
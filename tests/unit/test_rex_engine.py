@@ -0,0 +1,67 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Equivalence of the regex engine and the sequential substitutions
+"""
+import os
+import re
+import random
+from importlib import import_module
+import pandas as pd
+import pytest
+from analyzer.utils.misc_regex import Rexengine
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
+
+# Values to fill the <*> of templates, and chars of random logs
+PARAS = ['1', '23', '-5', '+7*', '0x1f', '3.5', '..9', '( 12-11.1 )', ' 1 2 3',
+         '192.168.0.1', '/10.0.0.1:80:', '1.3.6.1.2.1.69', '00:10:18:aa:bb:cc',
+         '2001:db8::1', '::1', '12:34:56', '24:00:00', '[ 197 26 1 ]', 'CH32',
+         'Ch33', 'Success', 'y', 'n', 'kFooBar', 'dcid', 'not specified',
+         'Mon Jan 01 12:34:56 2021', 'QAM lock failure', 'AB CD ']
+CHARS = 'aAbBcCdDeEfFkKnNxXyY019:.-+*()[]=/ '
+
+
+def sequential(rex, line):
+    """ Apply the patterns one by one, same as the original preprocess """
+    for ptn, repl in rex.items():
+        line = ptn.sub(repl, line)
+    return line
+
+
+def synthetic_logs(log_type, seed=0):
+    """ Fill the templates of the library with random parameters, along
+        with random strings.
+    """
+    rnd = random.Random(seed)
+    tmplts = pd.read_csv(os.path.join(DATA_DIR, 'persist', log_type, 'template_lib.csv'))
+    logs = [re.sub(r'<\*>', lambda _: rnd.choice(PARAS), tmplt)
+            for tmplt in tmplts['EventTemplate'].tolist() for _ in range(5)]
+    logs += [''.join(rnd.choice(CHARS) for _ in range(rnd.randint(1, 60)))
+             for _ in range(5000)]
+    logs += [' '.join(rnd.choice(PARAS) for _ in range(rnd.randint(1, 8)))
+             for _ in range(5000)]
+    return logs
+
+
+@pytest.mark.parametrize('log_type', ['cm', 'ftp'])
+def test_rex_engine_equivalence(log_type):
+    """ The engine output is identical to the sequential substitutions """
+    rex = import_module('analyzer.extensions.' + log_type + '.patterns').PTN_HARD_PARA
+    engine = Rexengine(rex)
+    for line in synthetic_logs(log_type):
+        expected = sequential(rex, line)
+        # Twice for the memorized result
+        assert engine.sub(line) == expected
+        assert engine.sub(line) == expected
+
+
+@pytest.mark.parametrize('log_type', ['cm', 'ftp'])
+def test_rex_engine_triggers(log_type):
+    """ The triggers never skip a pattern that matches """
+    rex = import_module('analyzer.extensions.' + log_type + '.patterns').PTN_HARD_PARA
+    engine = Rexengine(rex)
+    for line in synthetic_logs(log_type, seed=1):
+        for ptn, _, chars, char_sets in engine.rules:
+            if ptn.search(line):
+                assert all(char in line for char in chars)
+                assert all(char_set.search(line) for char_set in char_sets)
@@ -0,0 +1,43 @@
+# Licensed under the MIT License - see LICENSE.txt
+""" Equivalence of the vocabulary lookup and the list.index()
+"""
+import random
+import pytest
+from analyzer.modern import Vocab
+
+
+def random_ids(rnd, num):
+    """ Event ids with many duplicated ZEROs like the STIDLE """
+    return [rnd.choice(['0', '0', 'ffffffff', f'{rnd.randint(0, 50):08x}'])
+            for _ in range(num)]
+
+
+def list_index(event_ids, tid, unknown):
+    """ The index by list.index(), unknown if not found """
+    return event_ids.index(tid) if tid in event_ids else unknown
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_vocab_equivalence(seed):
+    """ Same index as the list, before and after the updates """
+    rnd = random.Random(seed)
+    event_ids = random_ids(rnd, 200)
+    vocab = Vocab(event_ids)
+
+    for _ in range(50):
+        tids = random_ids(rnd, 100) + ['deadbeef']
+        assert vocab.lookup(tids, unknown=-1).tolist() \
+            == [list_index(event_ids, tid, -1) for tid in tids]
+        assert vocab.missing(tids) == {tid for tid in tids if tid not in event_ids}
+        for tid in tids:
+            if tid in event_ids:
+                assert vocab.index(tid) == event_ids.index(tid)
+            else:
+                with pytest.raises(ValueError):
+                    vocab.index(tid)
+
+        # Replace an event id, e.g. a ZERO by a new one
+        idx, tid = rnd.randrange(len(event_ids)), random_ids(rnd, 1)[0]
+        event_ids[idx] = tid
+        vocab.update(idx, tid)
+        assert list(vocab) == event_ids